@@ -0,0 +1,28 @@
+''' Measures how much CPU time the parent process spends while fast_map
+waits for results. Tasks only sleep, so ideally the parent should stay
+idle (parent cpu time close to 0) for the whole wall time.
+
+Usage:
+    python benchmarks/parent_cpu.py
+'''
+from fast_map import fast_map
+import time
+
+def io_task(x):
+    time.sleep(1)
+    return x
+
+def measure(tasks_count, threads_limit):
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    for _ in fast_map(io_task, range(tasks_count), threads_limit=threads_limit):
+        pass
+    wall = time.time() - wall_start
+    cpu = time.process_time() - cpu_start
+    return wall, cpu
+
+if __name__ == '__main__':
+    print(f'{"tasks":>6} {"threads":>8} {"wall [s]":>9} {"parent cpu [s]":>15} {"parent cpu %":>13}')
+    for tasks_count, threads_limit in [(8, 8), (16, 4), (100, 100)]:
+        wall, cpu = measure(tasks_count, threads_limit)
+        print(f'{tasks_count:>6} {threads_limit:>8} {wall:>9.2f} {cpu:>15.2f} {cpu / wall * 100:>12.1f}%')
@@ -0,0 +1,37 @@
+''' Measures the makespan (total wall time) of fast_map when task durations
+are skewed: every "procs_count"-th task is slow, so a static (round robin)
+assignment of tasks to processes would give all slow tasks to the same
+process while the other processes sit idle.
+
+Usage:
+    python benchmarks/skewed_tasks.py
+'''
+from fast_map import fast_map
+import multiprocessing as mp
+import time
+
+SLOW_DURATION = 0.5
+FAST_DURATION = 0.05
+
+def skewed_task(x, procs_count):
+    time.sleep(SLOW_DURATION if x % procs_count == 0 else FAST_DURATION)
+    return x
+
+def measure(tasks_count, procs_count):
+    start = time.time()
+    for _ in fast_map(skewed_task, range(tasks_count), [procs_count] * tasks_count,
+                      threads_limit=procs_count, procs_limit=procs_count, chunksize=1):
+        pass
+    return time.time() - start
+
+if __name__ == '__main__':
+    procs_count = min(mp.cpu_count(), 4)
+    tasks_count = 8 * procs_count
+    slow_count = tasks_count // procs_count
+    total_work = slow_count * SLOW_DURATION + (tasks_count - slow_count) * FAST_DURATION
+    # all slow tasks assigned to a single process
+    static_makespan = slow_count * SLOW_DURATION
+    print(f'processes: {procs_count}, tasks: {tasks_count} (1 thread per process)')
+    print(f'ideal makespan (total work / processes): {total_work / procs_count:.2f}s')
+    print(f'static round robin assignment makespan:  {static_makespan:.2f}s')
+    print(f'fast_map makespan:                       {measure(tasks_count, procs_count):.2f}s')
@@ -0,0 +1,51 @@
+''' Measures worker startup latency of each start method: the time until
+the first result of a trivial task arrives and until the whole map call
+(one task per process) returns. The first call of each method is reported
+separately ("cold"), it includes starting the forkserver and importing
+preloaded modules there.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --procs 8 --preload decimal,asyncio,email.mime.text
+'''
+from fast_map import fast_map
+import multiprocessing as mp
+import statistics
+import argparse
+import time
+
+def noop(x):
+    return x
+
+def measure(procs, mp_context, preload):
+    start = time.perf_counter()
+    first = None
+    for _ in fast_map(noop, range(procs), procs_limit=procs, chunksize=1,
+                      mp_context=mp_context, preload=preload):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='fast_map worker startup benchmark')
+    parser.add_argument('--procs', type=int, default=mp.cpu_count(),
+                        help='number of processes (default: CPU cores)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='warm runs of each method, the median is reported (default: 5)')
+    parser.add_argument('--preload', default='',
+                        help='comma separated modules preloaded by the forkserver')
+    args = parser.parse_args()
+    preload = [m for m in args.preload.split(',') if m]
+
+    print(f'{"method":<12} {"cold first [s]":>15} {"cold total [s]":>15} '
+          f'{"first [s]":>10} {"total [s]":>10}')
+    for method in mp.get_all_start_methods():
+        cold_first, cold_total = measure(args.procs, method,
+                                         preload if method == 'forkserver' else None)
+        runs = [measure(args.procs, method, None) for _ in range(args.repeat)]
+        first = statistics.median(run[0] for run in runs)
+        total = statistics.median(run[1] for run in runs)
+        print(f'{method:<12} {cold_first:>15.3f} {cold_total:>15.3f} {first:>10.3f} {total:>10.3f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+''' Benchmark suite of fast_map covering typical workloads. Each workload
+runs in a fresh interpreter (so peak RSS of the parent and of the worker
+processes isn't affected by other workloads) and reports:
+- throughput               tasks per second
+- time_to_first_result     seconds until the first result was yielded
+- wall_time                seconds until all results were yielded
+- parent_cpu               CPU seconds used by the parent process
+- parent_cpu_percent       parent_cpu relative to wall_time
+- parent_peak_rss_mb       peak RSS of the parent process
+- workers_peak_rss_mb      peak RSS of the largest worker process
+(RSS is not available on Windows)
+
+Results are written as JSON and may be compared with a previously saved
+baseline, the exit code is 1 if any metric regressed more than the
+tolerance.
+
+Usage:
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --baseline baseline.json --output new.json
+    python benchmarks/suite.py --workloads cpu,tiny --repeat 5
+    python benchmarks/suite.py --list
+'''
+from fast_map import fast_map
+import multiprocessing as mp
+import subprocess
+import statistics
+import platform
+import argparse
+import json
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+def cpu_task(x):
+    for i in range(10 ** 5):
+        pass
+    return x
+
+def io_task(x):
+    time.sleep(0.01)
+    return x
+
+def mixed_task(x):
+    time.sleep(0.005)
+    for i in range(10 ** 4):
+        pass
+    return x
+
+def skewed_task(x):
+    time.sleep(0.2 if x % 10 == 0 else 0.01)
+    return x
+
+def tiny_task(x):
+    return x * 2
+
+def payload_task(payload):
+    return payload[::-1]
+
+def record_task(x):
+    return {'id': x, 'name': f'item {x}', 'values': [x, x * 0.5], 'tags': ['a', 'b']}
+
+# key=name val=(description, function returning (func, f_args, fast_map kwargs)),
+# the "scale" argument allows shorter runs (e.g. 0.1 in CI)
+WORKLOADS = {
+    'cpu': ('CPU-bound tasks (pure Python loop)',
+            lambda scale: (cpu_task, [range(int(400 * scale))], {})),
+    'io': ('I/O-bound tasks (10ms sleep)',
+           lambda scale: (io_task, [range(int(4000 * scale))], {'threads_limit': 500})),
+    'mixed': ('5ms sleep followed by a short loop',
+              lambda scale: (mixed_task, [range(int(2000 * scale))], {'threads_limit': 100})),
+    'skewed': ('every 10th task is 20 times slower',
+               lambda scale: (skewed_task, [range(int(1000 * scale))], {'threads_limit': 100})),
+    'tiny': ('tasks much cheaper than sending them to other processes',
+             lambda scale: (tiny_task, [range(int(200000 * scale))], {})),
+    'large_payload': ('1MB bytes argument and result of each task',
+                      lambda scale: (payload_task,
+                                     [[bytes(2 ** 20)] * int(200 * scale)], {})),
+    'records': ('small dict results (pickled)',
+                lambda scale: (record_task, [range(int(100000 * scale))], {})),
+    'records_marshal': ('small dict results (serializer="marshal")',
+                        lambda scale: (record_task, [range(int(100000 * scale))],
+                                       {'serializer': 'marshal'})),
+    'generator': ('tiny tasks supplied by a generator (unknown length)',
+                  lambda scale: (tiny_task, [(x for x in range(int(100000 * scale)))], {})),
+}
+
+# key=metric val=True if higher values are better
+METRICS = {
+    'throughput': True,
+    'time_to_first_result': False,
+    'wall_time': False,
+    'parent_cpu': False,
+    'parent_cpu_percent': False,
+    'parent_peak_rss_mb': False,
+    'workers_peak_rss_mb': False,
+}
+
+def peak_rss_mb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+def run_workload(name, scale):
+    ''' Runs the workload once in the current process and returns a dict
+    of metrics. '''
+    func, f_args, kwargs = WORKLOADS[name][1](scale)
+    tasks_count = 0
+    first_result_time = None
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in fast_map(func, *f_args, **kwargs):
+        if first_result_time is None:
+            first_result_time = time.perf_counter() - wall_start
+        tasks_count += 1
+    wall_time = time.perf_counter() - wall_start
+    parent_cpu = time.process_time() - cpu_start
+    return {
+        'tasks': tasks_count,
+        'throughput': tasks_count / wall_time,
+        'time_to_first_result': first_result_time,
+        'wall_time': wall_time,
+        'parent_cpu': parent_cpu,
+        'parent_cpu_percent': parent_cpu / wall_time * 100,
+        'parent_peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        'workers_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+def run_isolated(name, scale):
+    ''' Runs the workload in a new interpreter, returns a dict of metrics. '''
+    output = subprocess.check_output([sys.executable, __file__, '--run-one', name,
+                                      '--scale', str(scale)])
+    return json.loads(output)
+
+def median_metrics(runs):
+    metrics = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        metrics[key] = statistics.median(values) if values else None
+    return metrics
+
+def compare(results, baseline, tolerance):
+    ''' Prints the comparison and returns a list of (workload, metric,
+    baseline value, new value) tuples of regressions. '''
+    regressions = []
+    print(f'\n{"workload":<14} {"metric":<22} {"baseline":>10} {"new":>10} {"change":>8}')
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old = baseline[name].get(metric)
+            new = metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = ' REGRESSION'
+                regressions.append((name, metric, old, new))
+            print(f'{name:<14} {metric:<22} {old:>10.3f} {new:>10.3f} {change * 100:>7.1f}%{flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='fast_map benchmark suite')
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help='comma separated workload names (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each workload, the median is reported (default: 3)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies the number of tasks (default: 1.0)')
+    parser.add_argument('--output', help='JSON file to write results to')
+    parser.add_argument('--baseline', help='JSON file (written by --output) to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative change treated as a regression (default: 0.25)')
+    parser.add_argument('--list', action='store_true', help='list workloads and exit')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_workload(args.run_one, args.scale)))
+        return 0
+    if args.list:
+        for name, (description, _) in WORKLOADS.items():
+            print(f'{name:<14} {description}')
+        return 0
+
+    names = args.workloads.split(',')
+    for name in names:
+        assert name in WORKLOADS, f'unknown workload "{name}", see --list'
+    results = {}
+    print(f'{"workload":<14} {"tasks/s":>10} {"first [s]":>10} {"wall [s]":>9} '
+          f'{"parent cpu %":>13} {"parent MB":>10} {"worker MB":>10}')
+    for name in names:
+        metrics = median_metrics([run_isolated(name, args.scale) for _ in range(args.repeat)])
+        results[name] = metrics
+        print(f'{name:<14} {metrics["throughput"]:>10.1f} {metrics["time_to_first_result"]:>10.3f} '
+              f'{metrics["wall_time"]:>9.2f} {metrics["parent_cpu_percent"]:>12.1f}% '
+              f'{metrics["parent_peak_rss_mb"] or 0:>10.1f} {metrics["workers_peak_rss_mb"] or 0:>10.1f}')
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': mp.cpu_count(),
+            'repeat': args.repeat,
+            'scale': args.scale,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('scale') != args.scale:
+            print('warning: baseline was recorded with a different --scale')
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) above {args.tolerance * 100:.0f}%')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,2 +1,14 @@
 from .fast_map import fast_map #, fast_map_simple
 from .fast_map_async import fast_map_async
+from .fast_map_pool import FastMapPool
+from .fast_map_aio import fast_map_aio
+from .stats import FastMapStats, print_progress
+from .worker_state import process_state, thread_state
+from .cache import ResultCache
+from .cancel import CancelToken
+from .short_circuit import fast_first, fast_any, fast_all
+from .remote import Coordinator, run_worker
+from .reduce import fast_map_reduce
+from .serializers import Serializer
+from .pipeline import fast_pipeline, Stage
+from .file_input import fast_map_file
@@ -0,0 +1,110 @@
+import logging
+import glob
+import os
+import re
+
+NODES_PATH = '/sys/devices/system/node'
+
+def parse_cpulist(text):
+    ''' Returns the set of cores of a Linux cpulist (e.g. "0-3,8,10-11"). '''
+    cores = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return cores
+
+def available_cores():
+    ''' Returns the sorted list of cores the current process may run on. '''
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def numa_nodes():
+    ''' Returns a dict (key=NUMA node number) of sorted lists of available
+    cores, a single node 0 with all of them if the topology isn't known
+    (e.g. not on Linux). '''
+    available = set(available_cores())
+    nodes = {}
+    for path in glob.glob(os.path.join(NODES_PATH, 'node[0-9]*')):
+        try:
+            with open(os.path.join(path, 'cpulist')) as f:
+                cores = parse_cpulist(f.read()) & available
+        except OSError:
+            continue
+        if cores:
+            nodes[int(re.search(r'(\d+)$', path).group(1))] = sorted(cores)
+    return nodes or {0: sorted(available)}
+
+class AffinityPlan:
+    ''' Decides which cores each worker process is pinned to.
+    - affinity = None (each process may run on any core except reserved
+    ones), 'core' (each process is pinned to a single core, consecutive
+    processes are spread evenly across NUMA nodes), 'numa' (each process is
+    pinned to all cores of a NUMA node, processes are spread evenly across
+    nodes) or a list of cores (int) or core sets (lists of ints) used by
+    consecutive processes
+    - reserved_cores = cores left free for the parent process (e.g. for the
+    thread collecting results), workers aren't pinned to them
+
+    Processes are assigned cores in a round-robin way when there are more
+    processes than cores (or NUMA nodes). '''
+    def __init__(self, affinity, reserved_cores=()):
+        reserved = set(reserved_cores or ())
+        self.nodes = {node: [c for c in cores if c not in reserved]
+                      for node, cores in numa_nodes().items()}
+        self.nodes = {node: cores for node, cores in self.nodes.items() if cores}
+        if not self.nodes:
+            logging.warning('all available cores are reserved, worker processes '
+                            'may run on reserved cores')
+            self.nodes = numa_nodes()
+        if affinity is None:
+            self.placements = [sorted(c for cores in self.nodes.values() for c in cores)]
+        elif affinity == 'core':
+            # node 0 core 0, node 1 core 0, node 0 core 1, ...
+            by_node = list(self.nodes.values())
+            self.placements = [[cores[i]] for i in range(max(map(len, by_node)))
+                               for cores in by_node if i < len(cores)]
+        elif affinity == 'numa':
+            self.placements = list(self.nodes.values())
+        else:
+            assert isinstance(affinity, (list, tuple)) and affinity, (
+                'affinity must be "core", "numa" or a list of cores (or core sets)')
+            self.placements = [sorted(c) if isinstance(c, (list, tuple, set, frozenset)) else [c]
+                               for c in affinity]
+
+    @property
+    def cores_count(self):
+        ''' The number of cores workers may run on (the default number of
+        processes). '''
+        return len({c for cores in self.placements for c in cores})
+
+    def cores(self, proc_id):
+        return self.placements[proc_id % len(self.placements)]
+
+    def numa_node(self, cores):
+        ''' Returns the NUMA node containing all "cores" (None if they span
+        many nodes). '''
+        for node, node_cores in self.nodes.items():
+            if set(cores) <= set(node_cores):
+                return node
+        return None
+
+    def placement(self, proc_id):
+        ''' Returns a tuple containing cores of the process and their NUMA node. '''
+        cores = self.cores(proc_id)
+        return cores, self.numa_node(cores)
+
+def pin_process(cores):
+    ''' Pins the calling process (and threads it creates afterwards) to
+    the cores. Called by worker processes before they start any threads. '''
+    if not cores:
+        return
+    if not hasattr(os, 'sched_setaffinity'):
+        logging.warning('CPU affinity is not supported on this platform, ignoring it')
+        return
+    try:
+        os.sched_setaffinity(0, cores)
+    except OSError as e:
+        logging.warning(f'failed to pin worker process to cores {cores}: {e}')
@@ -0,0 +1,176 @@
+from threading import Thread, Lock, BoundedSemaphore
+from itertools import islice
+import concurrent.futures
+import asyncio
+import queue
+import time
+import sys
+import os
+
+# key=name val=description, see fast_map for details
+BACKENDS = {
+    'hybrid': 'worker processes, each running a thread pool (the default)',
+    'processes': 'worker processes running a single task at a time',
+    'threads': 'a thread pool in the parent process',
+    'subinterpreters': 'a pool of subinterpreters in the parent process (Python 3.14+)',
+    'auto': 'chosen from the interpreter and the duration of the first task',
+}
+
+# With backend='auto', tasks using less CPU time than this fraction of their
+# wall time (e.g. waiting for the network) are run by threads.
+IO_BOUND_CPU_RATIO = 0.5
+
+def is_free_threaded():
+    ''' Returns whether the GIL is disabled (free-threaded CPython build,
+    3.13+), so threads of a single process can use all cores. '''
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+def has_subinterpreters():
+    return hasattr(concurrent.futures, 'InterpreterPoolExecutor')
+
+class ThreadQueue(queue.Queue):
+    ''' Stands in for multiprocessing.Queue when workers are threads of the
+    parent (see ThreadContext). Once it's discarded (by cancel_join_thread,
+    when the map is stopped) queued items are dropped and get() returns the
+    (None, None) sentinel, so the worker thread takes no more tasks. '''
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.discarded = False
+
+    def put(self, item, block=True, timeout=None):
+        if not self.discarded:
+            super().put(item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        if self.discarded:
+            return None, None
+        return super().get(block, timeout)
+
+    def close(self):
+        pass
+
+    def join_thread(self):
+        pass
+
+    def cancel_join_thread(self):
+        with self.mutex:
+            self.discarded = True
+            self.queue.clear()
+        # wakes up the worker thread waiting in get()
+        super().put((None, None))
+
+class ThreadWorker(Thread):
+    ''' Stands in for multiprocessing.Process when workers are threads of
+    the parent (see ThreadContext), e.g. running "process_chunk". Threads
+    can't be stopped, a terminated worker is abandoned (it finishes its
+    running tasks in the background, joining it doesn't wait for them). '''
+    def __init__(self, target=None, args=()):
+        super().__init__(target=target, args=args, daemon=True)
+        self.pid = os.getpid()
+        self.exitcode = None
+        self.terminated = False
+
+    def run(self):
+        try:
+            super().run()
+        except BaseException:
+            self.exitcode = 1
+            raise
+        self.exitcode = 0
+
+    def terminate(self):
+        self.terminated = True
+
+    def kill(self):
+        self.terminated = True
+
+    def join(self, timeout=None):
+        if not self.terminated:
+            super().join(timeout)
+
+class SharedValue:
+    ''' Stands in for multiprocessing.Value (see ThreadContext). '''
+    def __init__(self, typecode, value):
+        self.value = value
+        self.lock = Lock()
+
+    def get_lock(self):
+        return self.lock
+
+class ThreadContext:
+    ''' Stands in for the multiprocessing context in fast_map when worker
+    "processes" are threads of the parent ('threads' and 'subinterpreters'
+    backends), so the rest of fast_map (queues, sentinels, rate limits) is
+    the same for all backends. Functions and arguments aren't pickled. '''
+    def __init__(self, interpreters=False):
+        self.interpreters = interpreters
+
+    def get_start_method(self):
+        return 'subinterpreters' if self.interpreters else 'threads'
+
+    def Queue(self, maxsize=0):
+        return ThreadQueue(maxsize)
+
+    def Process(self, target=None, args=()):
+        return ThreadWorker(target, args)
+
+    def Value(self, typecode, value):
+        return SharedValue(typecode, value)
+
+    def BoundedSemaphore(self, value=1):
+        return BoundedSemaphore(value)
+
+class Skip:
+    ''' Iterable (with len()) of items of a sized iterable except the
+    first "count" ones. '''
+    def __init__(self, iterable, count):
+        self.iterable = iterable
+        self.count = count
+
+    def __len__(self):
+        return max(0, len(self.iterable) - self.count)
+
+    def __iter__(self):
+        return islice(self.iterable, self.count, None)
+
+# "proc_id" of result chunks of tasks run to choose the backend (see FastMapStats)
+PROBE_PROC_ID = 'probe'
+
+class TaskProbe:
+    ''' Wraps the task function run to choose the backend (backend='auto'),
+    summing the wall time and the CPU time of its calls. '''
+    def __init__(self, func):
+        self.func = func
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            return self.func(*args)
+        finally:
+            self.wall_time += time.perf_counter() - start
+            self.cpu_time += time.thread_time() - cpu_start
+
+    @property
+    def cpu_ratio(self):
+        ''' CPU time of calls divided by their wall time (0.0 if no call
+        finished, e.g. the task timed out). '''
+        return self.cpu_time / max(self.wall_time, 1e-9)
+
+def backend_without_probe(f):
+    ''' Returns the backend chosen for backend='auto' without running any
+    task (None if the first task must be run to choose it):
+    - free-threaded Python runs everything in threads (no pickling)
+    - coroutine functions run in an event loop of a single thread '''
+    if is_free_threaded() or asyncio.iscoroutinefunction(f):
+        return 'threads'
+    return None
+
+def backend_of_probe(cpu_ratio):
+    ''' Returns the backend chosen for backend='auto' once the first task
+    ran (see TaskProbe), I/O-bound tasks (using little CPU time compared to
+    their wall time) run in threads, others in worker processes ('hybrid'). '''
+    return 'threads' if cpu_ratio < IO_BOUND_CPU_RATIO else 'hybrid'
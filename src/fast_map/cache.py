@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import pickle
+import types
+import os
+
+DEFAULT_MAX_ITEMS = 1024
+DEFAULT_MAX_DISK_BYTES = 2 ** 30
+# "proc_id" of result chunks answered from the cache (see FastMapStats)
+CACHE_PROC_ID = 'cache'
+
+def code_identity(code):
+    ''' Returns a list identifying the code object, which is the same in
+    every run of the interpreter. Nested code objects (comprehensions,
+    lambdas, inner functions) are identified the same way, their repr
+    contains memory addresses. Names of globals and attributes used by
+    the code (e.g. math.sin or math.cos) are included. '''
+    return [code.co_code, code.co_names,
+            [const_identity(const) for const in code.co_consts]]
+
+def const_identity(const):
+    if isinstance(const, types.CodeType):
+        return code_identity(const)
+    if isinstance(const, frozenset):
+        # the order of items of sets depends on hashes of strings, which
+        # are randomized in every run
+        return sorted(repr(item) for item in const)
+    return repr(const)
+
+def function_identity(func):
+    ''' Returns bytes identifying the function, its code, default arguments,
+    closure contents and the object of bound methods included (so results
+    cached on disk are not reused after the function changed), or None if
+    any of these can't be pickled (results of such functions aren't cached). '''
+    try:
+        return repr(function_state(func)).encode()
+    except Exception:
+        # e.g. pickle.PicklingError, or ValueError of an empty closure cell
+        return None
+
+def function_state(func):
+    if isinstance(func, types.MethodType):
+        return [function_state(func.__func__), pickle.dumps(func.__self__, protocol=4)]
+    identity = [getattr(func, '__module__', None), getattr(func, '__qualname__', None)]
+    code = getattr(func, '__code__', None)
+    if code is not None:
+        identity.append(code_identity(code))
+        cells = [cell.cell_contents for cell in func.__closure__ or ()]
+        identity.append(pickle.dumps(
+            (func.__defaults__, func.__kwdefaults__, cells), protocol=4))
+    if identity[1] is None:
+        # e.g. functools.partial or callable objects
+        identity.append(pickle.dumps(func, protocol=4))
+    return identity
+
+class ResultCache:
+    ''' Cache of results of fast_map tasks, keyed on the function identity
+    and a hash of the (pickled) arguments. It consists of an in-memory LRU
+    tier (max_items results) and an optional on-disk tier in "directory"
+    (the least recently used files are removed once they take more than
+    max_disk_bytes). Tasks with unpicklable arguments, failed tasks and
+    functions whose defaults or closure can't be pickled (see
+    function_identity) aren't cached. The same cache may be used by many fast_map calls.
+
+    Usage:
+
+        cache = ResultCache(directory='.fast_map_cache')
+        results = list(fast_map(task, range(1000), cache=cache))
+        print(cache.hits, cache.misses)
+    '''
+    def __init__(self, max_items=DEFAULT_MAX_ITEMS, directory=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        assert max_items >= 0, "max_items must be >= 0"
+        assert max_disk_bytes > 0, "max_disk_bytes must be > 0"
+        self.max_items = max_items
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict() # key=key val=result
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.disk_size = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for name in os.listdir(directory):
+                self.disk_size += os.path.getsize(os.path.join(directory, name))
+
+    @staticmethod
+    def key(func_identity, args):
+        ''' Returns the hex digest identifying the task, or None if its
+        arguments can't be pickled. '''
+        try:
+            data = pickle.dumps(args, protocol=4)
+        except Exception:
+            return None
+        return hashlib.sha256(func_identity + data).hexdigest()
+
+    def get(self, key):
+        ''' Returns a tuple containing whether the result was found and the
+        result itself. '''
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return True, self.memory[key]
+            found, res = self._disk_get(key)
+            if found:
+                self.hits += 1
+                self.disk_hits += 1
+                self._memory_put(key, res)
+            else:
+                self.misses += 1
+            return found, res
+
+    def put(self, key, res):
+        with self.lock:
+            self._memory_put(key, res)
+            self._disk_put(key, res)
+
+    def _memory_put(self, key, res):
+        if not self.max_items:
+            return
+        self.memory[key] = res
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _disk_get(self, key):
+        if self.directory is None:
+            return False, None
+        try:
+            with open(self._path(key), 'rb') as f:
+                res = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        # modification time is used to evict the least recently used files
+        os.utime(self._path(key))
+        return True, res
+
+    def _disk_put(self, key, res):
+        if self.directory is None:
+            return
+        try:
+            data = pickle.dumps(res, protocol=4)
+        except Exception:
+            return
+        if len(data) > self.max_disk_bytes:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            self.disk_size -= os.path.getsize(path)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.disk_size += len(data)
+        if self.disk_size > self.max_disk_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        entries.sort()
+        self.disk_size = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if self.disk_size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            self.disk_size -= size
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.directory is not None:
+                for name in os.listdir(self.directory):
+                    os.remove(os.path.join(self.directory, name))
+                self.disk_size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'memory_items': len(self.memory),
+                'disk_bytes': self.disk_size,
+            }
+
+class CacheLookup:
+    ''' Parent-side cache handling of a single map call. Splits chunks of
+    tasks into contiguous parts of cached results (passed to on_hit as
+    (start_index, results) and never sent to workers) and of tasks to
+    compute, whose results are stored once they arrive. '''
+    def __init__(self, cache, func):
+        self.cache = cache
+        self.func_identity = function_identity(func)
+        self.keys = {} # key=chunk start index val=list of keys
+        self.lock = Lock()
+
+    def split_chunks(self, chunks, on_hit):
+        ''' Yields (start_index, tasks) chunks of tasks missing in the cache. '''
+        if self.func_identity is None:
+            yield from chunks
+            return
+        for start, tasks in chunks:
+            run_start = start
+            run = [] # contiguous hits or misses
+            run_hit = None
+            run_keys = []
+            for offset, task in enumerate(tasks):
+                key = self.cache.key(self.func_identity, task)
+                found, res = self.cache.get(key) if key is not None else (False, None)
+                if found != run_hit and run:
+                    yield from self._flush(run_start, run, run_hit, run_keys, on_hit)
+                    run_start, run, run_keys = start + offset, [], []
+                run_hit = found
+                run.append(res if found else task)
+                run_keys.append(key)
+            if run:
+                yield from self._flush(run_start, run, run_hit, run_keys, on_hit)
+
+    def _flush(self, start, run, hit, keys, on_hit):
+        if hit:
+            on_hit(start, run)
+            return
+        with self.lock:
+            self.keys[start] = keys
+        yield start, run
+
+    def store_chunks(self, chunks):
+        ''' Stores results of arrived (start_index, results, errors, duration)
+        chunks in the cache. '''
+        for start, results, errors, duration in chunks:
+            with self.lock:
+                keys = self.keys.pop(start, None)
+            if keys is not None:
+                for offset, (key, res) in enumerate(zip(keys, results)):
+                    if key is not None and offset not in errors:
+                        self.cache.put(key, res)
+            yield start, results, errors, duration
@@ -0,0 +1,57 @@
+from threading import Thread, Lock
+
+class CancelToken:
+    ''' Allows to stop a map call from another thread (e.g. when a user
+    presses "cancel"). Supplied as the "cancel_token" argument of fast_map
+    (or FastMapPool.imap), calling cancel() stops enqueuing tasks, stops
+    worker processes and ends the results generator (results yielded
+    before remain valid). A single token may cancel many map calls.
+
+    Usage:
+
+        token = CancelToken()
+        threading.Timer(5, token.cancel).start()
+        for res in fast_map(task, range(1000), cancel_token=token):
+            print(res)
+    '''
+    def __init__(self):
+        self.lock = Lock()
+        self.callbacks = []
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        with self.lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        ''' The callback is called once cancel() is called (right away if
+        it was called already). '''
+        with self.lock:
+            if not self._cancelled:
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+class CancellableThread(Thread):
+    ''' Thread returned by fast_map_async and FastMapPool.map_async,
+    cancel() stops its map call (see CancelToken). '''
+    def __init__(self, *args, cancel_token=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cancel_token = cancel_token or CancelToken()
+
+    def cancel(self):
+        self.cancel_token.cancel()
@@ -0,0 +1,47 @@
+import multiprocessing as mp
+import logging
+
+# Imported by the forkserver process (once), so worker processes forked
+# from it don't import them again.
+DEFAULT_PRELOAD = ['fast_map']
+
+# modules imported by the running forkserver process (None until it's started)
+_forkserver_preload = None
+
+def get_context(mp_context=None, preload=None):
+    ''' Returns the multiprocessing context used to start worker processes.
+    - mp_context = None (the default context), a start method name ('fork',
+    'spawn' or 'forkserver') or a context returned by multiprocessing.get_context
+    - preload = names of modules imported once by the forkserver process
+    (only with the 'forkserver' start method), worker processes are forked
+    from it with these modules already imported, without inheriting locks
+    held by threads of the parent
+
+    The forkserver is started right away (see warm_up). '''
+    if mp_context is None or isinstance(mp_context, str):
+        mp_context = mp.get_context(mp_context)
+    if mp_context.get_start_method() == 'forkserver':
+        warm_up(preload)
+    elif preload:
+        logging.warning(f'preload is supported only with the "forkserver" start method, '
+                        f'not "{mp_context.get_start_method()}", ignoring it')
+    return mp_context
+
+def warm_up(preload=None):
+    ''' Starts the forkserver process (if it isn't running yet), importing
+    the "preload" modules in it, so the first map call using the 'forkserver'
+    start method doesn't wait for it. The forkserver is shared by all map
+    calls, modules supplied once it's running are imported by each worker
+    process instead. '''
+    global _forkserver_preload
+    preload = DEFAULT_PRELOAD + [m for m in preload or [] if m not in DEFAULT_PRELOAD]
+    ctx = mp.get_context('forkserver')
+    if _forkserver_preload is None:
+        ctx.set_forkserver_preload(preload)
+        _forkserver_preload = preload
+    missing = [m for m in preload if m not in _forkserver_preload]
+    if missing:
+        logging.warning(f'forkserver is already running, modules {missing} were not preloaded')
+    # noop if it's running already
+    from multiprocessing import forkserver
+    forkserver.ensure_running()
@@ -0,0 +1,87 @@
+import asyncio
+from threading import Thread, Event, Lock
+import time
+
+async def timed_coroutine_call(func, args):
+    ''' Coroutine equivalent of "timed_call", returns a tuple containing 
+    the duration of "await func(*args)", the CPU time (unknown for 
+    coroutines interleaved in a single thread, so 0.0) and its result. '''
+    start = time.perf_counter()
+    res = await func(*args)
+    return time.perf_counter() - start, 0.0, res
+
+class CoroutineExecutor:
+    ''' Runs coroutines in an event loop of a separate thread, at most 
+    max_workers at once. It mimics the part of ThreadPoolExecutor interface
+    used by worker processes, so coroutine functions supplied to fast_map 
+    are awaited concurrently in a single thread, instead of using a 
+    separate thread for each concurrently running task. The initializer
+    (if supplied) is called in the event loop thread before it starts. '''
+    def __init__(self, max_workers, initializer=None):
+        assert max_workers > 0, "max_workers must be > 0"
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initializer_error = None
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        self.futures = set()
+        self.lock = Lock()
+        self.shutting_down = False
+        ready = Event()
+        self.thread = Thread(target=self._run_loop, daemon=True, args=[ready])
+        self.thread.start()
+        ready.wait()
+        if self.initializer_error is not None:
+            raise self.initializer_error
+
+    def _run_loop(self, ready):
+        if self.initializer is not None:
+            try:
+                self.initializer()
+            except BaseException as e:
+                self.initializer_error = e
+                ready.set()
+                return
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _limited(self, fn, args):
+        async with self.semaphore:
+            return await fn(*args)
+
+    def _forget(self, future):
+        with self.lock:
+            self.futures.discard(future)
+            if self.shutting_down and not self.futures:
+                # done callbacks run in the loop thread, so the remaining
+                # callbacks of this future are called before the loop stops
+                self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit(self, fn, *args):
+        ''' Schedules "fn(*args)" coroutine, returns concurrent.futures.Future. '''
+        future = asyncio.run_coroutine_threadsafe(self._limited(fn, args), self.loop)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def shutdown(self, wait=True):
+        ''' Stops the event loop once all submitted coroutines complete
+        (like ThreadPoolExecutor, already submitted tasks aren't cancelled
+        when wait=False). '''
+        with self.lock:
+            if not self.shutting_down:
+                self.shutting_down = True
+                if not self.futures:
+                    self.loop.call_soon_threadsafe(self.loop.stop)
+        if wait:
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
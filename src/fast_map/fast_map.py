@@ -3,10 +3,27 @@ import multiprocessing as mp
 from concurrent.futures import ThreadPoolExecutor
 import math
 from functools import partial
-from threading import Thread
+from threading import Thread, Lock, Condition, Event
+from itertools import islice
 import logging
+import queue
 import time
-# import psutil
+import asyncio
+
+from .coroutine_executor import CoroutineExecutor, timed_coroutine_call
+from .shared_memory_transport import SharedMemoryTransport, remove_segments_on_terminate
+from .threads_tuner import ThreadsTuner, DEFAULT_MAX_THREADS
+from .stats import FastMapStats
+from .worker_state import (run_process_initializer, run_thread_initializer, process_state,
+                           swap_process_state)
+from .cache import CacheLookup, CACHE_PROC_ID
+from .context import get_context
+from .serializers import Serializer
+from .affinity import AffinityPlan, pin_process
+from .rate_limit import RateLimiter
+from .task_watchdog import TaskWatchdog
+from .backends import (ThreadContext, TaskProbe, Skip, backend_without_probe, backend_of_probe,
+                       has_subinterpreters, BACKENDS, PROBE_PROC_ID)
 
 def cleanup_subprocesses(subprocesses):
     '''Cleanup running subprocesses on exit'''
@@ -16,32 +33,258 @@ def cleanup_subprocesses(subprocesses):
         else:
             subprocess.terminate()
 
-def process_chunk(proc_id, func, threads_count, task_queue, result_queue):
+def timed_call(func, args):
+    ''' Returns a tuple containing the duration of func(*args) call,
+    the CPU time it used and its result. '''
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    res = func(*args)
+    return time.perf_counter() - start, time.thread_time() - cpu_start, res
+
+class ChunkResults:
+    ''' Gathers results of tasks from a single chunk (completed by 
+    different threads) and calls on_chunk_completed once all of them
+    are done, so the whole chunk travels back to the parent at once. 
+    After each task, its slot is released and on_task_completed is 
+    called with its duration and CPU time. If record_durations is True,
+    the duration of each task is sent with the results (see FastMapStats). '''
+    def __init__(self, start, size, on_chunk_completed, slots=None, on_task_completed=None,
+                 record_durations=False):
+        self.start = start
+        self.results = [None] * size
+        self.errors = {} # key=offset within chunk val=exception
+        self.duration = 0.0 # sum of durations of all tasks
+        self.task_durations = [] if record_durations else None
+        self.finished = set() # offsets of completed tasks
+        self.remaining = size
+        self.lock = Lock()
+        self.on_chunk_completed = on_chunk_completed
+        self.slots = slots
+        self.on_any_task_completed = on_task_completed
+
+    def on_task_completed(self, future, offset):
+        duration = cpu_time = 0.0
+        res = error = None
+        try:
+            duration, cpu_time, res = future.result()
+        except BaseException as e:
+            error = e
+        self.complete(offset, res, error, duration)
+        if self.slots is not None:
+            self.slots.release()
+        if self.on_any_task_completed is not None:
+            self.on_any_task_completed(duration, cpu_time)
+
+    def complete(self, offset, res=None, error=None, duration=0.0):
+        ''' Stores the result (or the exception) of a task, returns False
+        if the task was completed already (by another run of it, or because
+        it timed out, see TaskWatchdog). '''
+        with self.lock:
+            if offset in self.finished:
+                return False
+            self.finished.add(offset)
+            if error is not None:
+                self.errors[offset] = error
+            else:
+                self.results[offset] = res
+            self.duration += duration
+            if self.task_durations is not None:
+                self.task_durations.append(duration)
+            self.remaining -= 1
+            remaining = self.remaining
+        if not remaining:
+            self.on_chunk_completed(self.start, self.results, self.errors, self.duration,
+                                    self.task_durations)
+        return True
+
+    def on_batch_completed(self, future):
+        ''' Called once the batched function (see "submit_chunk") returned
+        results of all tasks of the chunk (or raised an exception, which
+        then fails all of them). '''
+        size = len(self.results)
+        duration = cpu_time = 0.0
+        error = None
+        try:
+            duration, cpu_time, results = future.result()
+            results = list(results)
+            if len(results) != size:
+                raise ValueError(f'batched function returned {len(results)} results '
+                                 f'for {size} tasks')
+        except BaseException as e:
+            results = [None] * size
+            error = e
+        for offset, res in enumerate(results):
+            self.complete(offset, res, error, duration / size)
+        if self.slots is not None:
+            self.slots.release()
+        if self.on_any_task_completed is not None:
+            self.on_any_task_completed(duration, cpu_time)
+
+def make_executor(func, max_workers, thread_initializer=None, thread_initargs=(),
+                  interpreters=False):
+    ''' Coroutine functions are awaited in an event loop (allowing 
+    max_workers of them to run concurrently), other functions are called
+    in a thread pool (or in a pool of subinterpreters if "interpreters" is
+    True, Python 3.14+). The thread_initializer is called once in each thread
+    (in the event loop thread for coroutine functions), see "thread_state". '''
+    initializer = None
+    if thread_initializer is not None:
+        initializer = partial(run_thread_initializer, thread_initializer, thread_initargs)
+    if asyncio.iscoroutinefunction(func):
+        return CoroutineExecutor(max_workers=max_workers, initializer=initializer)
+    if interpreters:
+        from concurrent.futures import InterpreterPoolExecutor
+        return InterpreterPoolExecutor(max_workers=max_workers, initializer=initializer)
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=initializer)
+
+def submit_chunk(executor, func, start, tasks, on_chunk_completed, slots=None,
+                 on_task_completed=None, record_durations=False, watchdog=None,
+                 batch_type=None):
+    ''' Submits each task of the chunk separately (so tasks of a single 
+    chunk still run concurrently in the thread pool). If slots are 
+    supplied, each task waits for a free slot before being submitted. 
+    If a TaskWatchdog is supplied, tasks are submitted through it (it
+    releases their slots). If batch_type is supplied, "func" is called
+    once for the whole chunk, with a batch_type(column) argument for each
+    column of arguments (e.g. a list of first arguments of all tasks),
+    and it returns a sequence of results. '''
+    chunk = ChunkResults(start, len(tasks), on_chunk_completed, slots, on_task_completed,
+                         record_durations)
+    call = timed_coroutine_call if asyncio.iscoroutinefunction(func) else timed_call
+    if batch_type is not None:
+        if slots is not None:
+            slots.wait_for_free()
+            slots.take(1)
+        columns = [batch_type(column) for column in zip(*tasks)]
+        executor.submit(call, func, columns).add_done_callback(chunk.on_batch_completed)
+        return
+    for offset, task in enumerate(tasks):
+        if slots is not None:
+            slots.wait_for_free()
+            slots.take(1)
+        if watchdog is not None:
+            watchdog.submit(executor, call, func, chunk, offset, task)
+            continue
+        future = executor.submit(call, func, task)
+        future.add_done_callback(partial(chunk.on_task_completed, offset=offset))
+
+class TaskSlots:
+    ''' Counts tasks submitted to the thread pool of a process, so the
+    process takes new tasks from the shared task queue only when some of 
+    its threads are idle (instead of hoarding tasks that other, idle 
+    processes could run). The parent uses it too, to limit the number
+    of tasks enqueued but not yet yielded ("max_in_flight"). '''
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waited = False
+        self.condition = Condition()
+
+    def wait_for_free(self, count=1):
+        with self.condition:
+            while self.in_flight + count > self.limit:
+                self.waited = True
+                self.condition.wait()
+
+    def pop_waited(self):
+        ''' Returns whether anything had to wait for free slots since the
+        last call. '''
+        with self.condition:
+            waited, self.waited = self.waited, False
+            return waited
+
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+
+    def take(self, count):
+        with self.condition:
+            self.in_flight += count
+
+    def try_take(self):
+        ''' Takes a slot if one is free, returns whether it did. '''
+        with self.condition:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, count=1):
+        with self.condition:
+            self.in_flight -= count
+            self.condition.notify()
+
+def process_chunk(proc_id, func, threads_count, task_queue, result_queue,
+                  max_threads=None, record_durations=False, initializers=None, cores=None,
+                  timeout=None, hedge=None, batch_type=None, interpreters=False):
     '''This is the target function for each spawned process. It receives 
-    the task_queue where each task contains a collection of arguments for
-    the function "func". '''
-    # print('start proc id', proc_id, ' cpu core=', psutil.Process().cpu_num())
-    def on_completed(future, index):
-        res = future.result()
-        # print('on_completed, res=', res)
-        result_queue.put((index, res))
-    with ThreadPoolExecutor(max_workers=threads_count) as executor:
-        while True:
-            i, task = task_queue.get()
-            task_queue.task_done()
-            if task is None:
-                break
-            future = executor.submit(func, *task)
-            future.add_done_callback(partial(on_completed, index=i))
-    # print('end proc id', proc_id, ' cpu core=', psutil.Process().cpu_num())
+    the task_queue (shared by all processes) where each item is a chunk of
+    contiguous tasks (start_index, [args, ...]), each task containing a 
+    collection of arguments for the function "func". A new chunk is taken
+    only when some thread of this process is idle, so the work is balanced
+    dynamically between processes. Results of each chunk are put on 
+    the result_queue together as (start_index, results, errors, duration,
+    proc_id, task_durations) tuple, where "errors" maps offsets of failed
+    tasks to exceptions they raised and "task_durations" is None unless
+    record_durations is True. Once all tasks are done the 
+    (None, None, None, None, proc_id, None) sentinel is put to notify the
+    parent. If "func" is a coroutine
+    function, threads_count limits the number of concurrently awaited
+    coroutines (all running in a single event loop). If max_threads is
+    supplied, the number of threads is adjusted at runtime (between 1 and
+    max_threads, starting with threads_count), see ThreadsTuner. 
+    initializers = (initializer, initargs, thread_initializer, thread_initargs)
+    tuple, the initializer is called once before taking any tasks. If
+    "cores" are supplied, the process is pinned to them (see AffinityPlan).
+    "timeout" and "hedge" are used by TaskWatchdog (if any is supplied,
+    the process puts the sentinel without waiting for abandoned runs of
+    tasks, the parent terminates it if they don't finish). If batch_type
+    is supplied, "func" is called once per chunk (see "submit_chunk"). If
+    "interpreters" is True, tasks run in subinterpreters (see make_executor). '''
+    pin_process(cores)
+    remove_segments_on_terminate()
+    def on_chunk_completed(start, results, errors, duration, task_durations):
+        result_queue.put((start, results, errors, duration, proc_id, task_durations))
+    initializer, initargs, thread_initializer, thread_initargs = initializers or (None, (), None, ())
+    run_process_initializer(initializer, initargs)
+    slots = TaskSlots(threads_count)
+    tuner = None
+    if max_threads and not asyncio.iscoroutinefunction(func):
+        tuner = ThreadsTuner(slots, max_threads)
+    workers = max(threads_count, max_threads or 0)
+    watchdog = None
+    if timeout is not None or hedge is not None:
+        watchdog = TaskWatchdog(slots, timeout, hedge, tuner.observe if tuner else None)
+        # threads of abandoned runs may be still busy
+        workers *= 2
+    executor = make_executor(func, workers, thread_initializer, thread_initargs, interpreters)
+    while True:
+        slots.wait_for_free()
+        start, tasks = task_queue.get()
+        if tasks is None:
+            break
+        submit_chunk(executor, func, start, tasks, on_chunk_completed, slots,
+                     tuner.observe if tuner else None, record_durations, watchdog, batch_type)
+    if watchdog is None:
+        # Waits for all submitted tasks (and their callbacks), so the
+        # sentinel is always queued after the last result.
+        executor.shutdown(wait=True)
+    else:
+        watchdog.wait_for_tasks()
+        watchdog.stop()
+        executor.shutdown(wait=False)
+    result_queue.put((None, None, None, None, proc_id, None))
 
 def calculate_procs_and_threads_per_process(threads_limit, procs_limit,
-                                            tasks_count):
+                                            tasks_count, adaptive=False):
     '''This function returns a tuple containing:
     - the number of processes to spawn
     - the number of threads to spawn in each process
     threads_limit = total threads limit (e.g. if equal to 8 then on a 4 core
     cpu, 2 threads will be spawned in each process) 
+    adaptive = whether threads will be adjusted at runtime (starting with 
+    the returned number), it only disables the warning about generators
     '''
     # Limit the number of processes
     procs_count = mp.cpu_count()
@@ -58,94 +301,702 @@ def calculate_procs_and_threads_per_process(threads_limit, procs_limit,
     # because of using generators
     if tasks_count is None:
         threads_pp = 4
-        logging.warning(f'no len() available for fast_map arguments, using {threads_pp} threads per process, set "tasks_count_estimate" fast_map arugment to allow better calculation.')
+        if not adaptive:
+            logging.warning(f'no len() available for fast_map arguments, using {threads_pp} threads per process, set "tasks_count_estimate" fast_map arugment to allow better calculation.')
     else:
         # Threads per process
-        threads_pp = math.ceil(tasks_count / procs_count)
+        # (at least 1 thread for empty inputs)
+        threads_pp = max(1, math.ceil(tasks_count / procs_count))
 
     if threads_limit:
         threads_pp = min(threads_pp, math.ceil(threads_limit/procs_count))
     # print("threads_pp =", threads_pp)
     return procs_count, threads_pp
 
-enqueueing_finished = False
-enqueued_items_count = 0
-def fast_map(f, *f_args, threads_limit=None, procs_limit=None, tasks_count_estimate=None):
+def calculate_max_threads_per_process(threads_limit, procs_count, tasks_count):
+    ''' Returns the maximum number of threads per process used in adaptive
+    mode (by default 1 thread per task, like without adaptive mode). '''
+    if threads_limit:
+        return max(1, math.ceil(threads_limit / procs_count))
+    if tasks_count is None:
+        return DEFAULT_MAX_THREADS
+    return max(1, math.ceil(tasks_count / procs_count))
+
+# How often (in seconds) the parent checks whether worker processes
+# crashed while it's waiting for results.
+WORKERS_CHECK_INTERVAL = 1.0
+
+# Automatic chunk size aims at chunks taking this long (in seconds, summed
+# over all tasks of a chunk), so cheap tasks are sent in large batches 
+# while expensive ones are sent one by one.
+TARGET_CHUNK_DURATION = 0.05
+# Automatic chunk size limit used when the number of tasks is unknown.
+MAX_AUTO_CHUNKSIZE = 1024
+
+class ChunkSizer:
+    ''' Decides how many tasks are sent together in a single chunk. 
+    If chunksize is None it's adjusted automatically, based on the number
+    of tasks and the average task duration observed so far. '''
+    def __init__(self, chunksize=None, tasks_count=None, workers_count=1, 
+                 max_in_flight=None):
+        self.chunksize = chunksize
+        # at least 4 chunks per process to allow even distribution
+        self.max_chunksize = MAX_AUTO_CHUNKSIZE
+        if tasks_count is not None:
+            self.max_chunksize = max(1, math.ceil(tasks_count / (workers_count * 4)))
+        if max_in_flight is not None:
+            # at least 2 chunks in flight, so processes don't wait for
+            # the parent after finishing every chunk
+            self.max_chunksize = min(self.max_chunksize, max(1, max_in_flight // 2))
+            if chunksize:
+                self.chunksize = min(chunksize, max_in_flight)
+        self.tasks_done = 0
+        self.tasks_duration = 0.0
+        self.last_size = 0
+
+    def observe(self, tasks_done, duration):
+        self.tasks_done += tasks_done
+        self.tasks_duration += duration
+
+    def next_size(self):
+        if self.chunksize:
+            return self.chunksize
+        if self.tasks_done:
+            avg_duration = self.tasks_duration / self.tasks_done
+            size = math.ceil(TARGET_CHUNK_DURATION / max(avg_duration, 1e-9))
+        else:
+            # nothing observed yet, start small and grow gradually
+            size = self.last_size * 2 or 1
+        self.last_size = max(1, min(size, self.max_chunksize))
+        return self.last_size
+
+def iter_chunks(f_args, chunk_sizer, start=0):
+    ''' Yields (start_index, [args, ...]) chunks of contiguous tasks, the
+    index of the first task is "start". If the input raises an exception,
+    tasks taken before it are still yielded. '''
+    tasks = zip(*f_args)
+    while True:
+        chunk = []
+        try:
+            chunk.extend(islice(tasks, chunk_sizer.next_size()))
+        except Exception:
+            if chunk:
+                yield start, chunk
+            raise
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+def enqueuer(task_queue, chunks, procs_count):
+    ''' This function enqueues chunks of tasks (see "iter_chunks") in the 
+    order of their indices into the task queue shared by all processes 
+    (so the lowest indices are processed first, allowing to yield ordered
+    results early). Chunks are generated lazily in this thread (see 
+    "iter_timed" which waits for the max_in_flight window). If generating
+    chunks fails (e.g. the input generator raised an exception), sentinels
+    are still queued (so processes exit once enqueued tasks are done) and
+    the exception is re-raised. '''
+    try:
+        for chunk in chunks:
+            task_queue.put(chunk)
+    finally:
+        # each process stops taking tasks after receiving a single sentinel
+        for _ in range(procs_count):
+            task_queue.put((None,None))
+
+def iter_timed(chunks, window=None, stats=None, stopped=None):
+    ''' Yields (start_index, tasks) chunks once the window has room for
+    them, reporting enqueued tasks and wait times to stats. It stops once
+    the "stopped" event is set (see "stop_map"). '''
+    input_wait_start = time.perf_counter()
+    for chunk in chunks:
+        window_wait_start = time.perf_counter()
+        if window is not None:
+            window.wait_for_free(len(chunk[1]))
+            window.take(len(chunk[1]))
+        if stopped is not None and stopped.is_set():
+            return
+        if stats is not None:
+            stats.on_enqueued(len(chunk[1]), window_wait_start - input_wait_start,
+                              time.perf_counter() - window_wait_start)
+        yield chunk
+        input_wait_start = time.perf_counter()
+    if stats is not None:
+        stats.on_enqueuing_finished()
+
+def default_max_in_flight(tasks_count, procs_count, threads_pp):
+    ''' Inputs without len() (generators) may be huge or infinite, so the
+    number of tasks in flight is limited by default (allowing a few full
+    sized chunks per thread). Other inputs are already in memory and 
+    aren't limited. '''
+    if tasks_count is not None:
+        return None
+    return procs_count * max(threads_pp * 4, MAX_AUTO_CHUNKSIZE * 2)
+
+# "proc_id" of the sentinel put by the parent when the map call is cancelled
+CANCELLED = 'cancelled'
+
+def stop_map(stopped, window=None, wake_queue=None, wake_msg=None):
+    ''' Stops the enqueuer of a map call (waking it up if it waits for
+    the window) and, if wake_queue is supplied, wakes up the consumer 
+    waiting for results by putting wake_msg into it. '''
+    stopped.set()
+    if window is not None:
+        window.set_limit(math.inf)
+    if wake_queue is not None:
+        wake_queue.put(wake_msg)
+
+def terminate_workers(procs, queues):
+    ''' Stops worker processes right away, without running queued tasks. '''
+    cleanup_subprocesses(procs)
+    for p in procs:
+        p.join()
+    for q in queues:
+        # data left in the queues won't be read by anyone, don't wait
+        # for flushing it at exit
+        q.cancel_join_thread()
+
+# How long (in seconds) the parent waits for worker processes to exit
+# after they finished, if tasks may be abandoned (see TaskWatchdog).
+WORKERS_EXIT_TIMEOUT = 1.0
+
+def join_workers(procs, exit_timeout=None):
+    ''' Waits until worker processes exit. If exit_timeout is supplied,
+    processes still running after it (e.g. kept alive by threads of
+    abandoned tasks) are terminated. '''
+    deadline = time.perf_counter() + (exit_timeout or 0.0)
+    for p in procs:
+        p.join(None if exit_timeout is None else max(0.0, deadline - time.perf_counter()))
+    if exit_timeout is not None:
+        cleanup_subprocesses([p for p in procs if p.exitcode is None])
+        for p in procs:
+            p.join()
+
+def check_workers(procs, done_procs):
+    ''' Raises RuntimeError if any worker process (whose id isn't in
+    done_procs) crashed. '''
+    for proc_id, p in enumerate(procs):
+        # processes exiting normally put the sentinel first
+        if proc_id not in done_procs and p.exitcode not in (None, 0):
+            raise RuntimeError(f'fast_map worker process (pid={p.pid}) '
+                               f'exited unexpectedly with code {p.exitcode}')
+
+def collect_results(procs, result_queue, stats=None):
+    ''' Yields (start_index, results, errors, duration) chunks from the 
+    result_queue until every process put its "done" sentinel (or until 
+    the CANCELLED sentinel arrives). It blocks on the result_queue instead
+    of polling it, so the parent doesn't use the CPU while waiting. 
+    Completed chunks are reported to stats. '''
+    done_procs = set()
+    while len(done_procs) < len(procs):
+        try:
+            (start, results, errors, duration,
+             proc_id, task_durations) = result_queue.get(timeout=WORKERS_CHECK_INTERVAL)
+        except queue.Empty:
+            check_workers(procs, done_procs)
+            continue
+        if start is None:
+            if proc_id == CANCELLED:
+                return
+            done_procs.add(proc_id)
+            continue
+        if stats is not None:
+            stats.on_chunk_completed(proc_id, len(results), len(errors), duration,
+                                     task_durations)
+        yield start, results, errors, duration
+
+def order_results(chunks, chunk_sizer=None, window=None, stats=None):
+    ''' Yields individual results of (start_index, results, errors, duration)
+    chunks in the order of their indices, re-raising exceptions of failed
+    tasks. Observed task durations are reported to chunk_sizer, yielded
+    tasks are released from the window and reported to stats. '''
+    expected_index = 0
+    ordered_chunks = {} # key=start index val=(results, errors)
+    for start, results, errors, duration in chunks:
+        # results answered from the cache have no duration
+        if chunk_sizer is not None and duration is not None:
+            chunk_sizer.observe(len(results), duration)
+        ordered_chunks[start] = (results, errors)
+        while expected_index in ordered_chunks:
+            results, errors = ordered_chunks.pop(expected_index)
+            for offset, res in enumerate(results):
+                if offset in errors:
+                    raise errors[offset]
+                yield res
+            expected_index += len(results)
+            if window is not None:
+                window.release(len(results))
+            if stats is not None:
+                stats.on_yielded(len(results))
+
+def unordered_results(chunks, chunk_sizer=None, window=None, stats=None):
+    ''' Yields (index, result) tuples of (start_index, results, errors, 
+    duration) chunks as soon as they arrive, re-raising exceptions of 
+    failed tasks. No results are buffered, so a slow task doesn't hold 
+    back results of other tasks. '''
+    for start, results, errors, duration in chunks:
+        # results answered from the cache have no duration
+        if chunk_sizer is not None and duration is not None:
+            chunk_sizer.observe(len(results), duration)
+        for offset, res in enumerate(results):
+            if offset in errors:
+                raise errors[offset]
+            yield start + offset, res
+        if window is not None:
+            window.release(len(results))
+        if stats is not None:
+            stats.on_yielded(len(results))
+
+class MapRun:
+    ''' Setup and teardown of a single map call, shared by fast_map,
+    fast_map_reduce and fast_pipeline. Creating it validates the options
+    (see fast_map), chooses the backend, the number of processes and
+    threads, creates queues and wraps the task function (rate limits,
+    shared memory, serializer). "start_workers" spawns worker processes,
+    "start_enqueuer" feeds them with chunks of tasks and "finish" stops
+    them once results were consumed (or the map was closed, cancelled or
+    failed). If results_to_parent is False (fast_map_reduce), workers
+    don't send results back, so large results aren't put into shared
+    memory and "cache" isn't supported. '''
+    def __init__(self, f, f_args, threads_limit=None, procs_limit=None,
+                 tasks_count_estimate=None, chunksize=None, max_in_flight=None,
+                 shared_memory_threshold=None, adaptive=False, stats=None, on_progress=None,
+                 initializer=None, initargs=(), thread_initializer=None, thread_initargs=(),
+                 cache=None, cancel_token=None, mp_context=None, preload=None,
+                 serializer=None, affinity=None, reserved_cores=None,
+                 max_calls_per_second=None, max_concurrency=None, timeout=None, hedge=None,
+                 batched=False, batch_type=list, backend='hybrid', results_to_parent=True):
+        if threads_limit is not None:
+            assert threads_limit > 0, "threads_limit must be > 0"
+        if procs_limit is not None:
+            assert procs_limit > 0, "procs_limit must be > 0"
+        if chunksize is not None:
+            assert chunksize > 0, "chunksize must be > 0"
+        if max_in_flight is not None:
+            assert max_in_flight > 0, "max_in_flight must be > 0"
+        if initializer is not None:
+            assert callable(initializer), 'supplied initializer is not callable'
+        if thread_initializer is not None:
+            assert callable(thread_initializer), 'supplied thread_initializer is not callable'
+        if on_progress is not None:
+            stats = stats or FastMapStats()
+            assert callable(on_progress), 'supplied on_progress is not callable'
+            stats.on_progress = on_progress
+        if max_concurrency is not None:
+            # more threads couldn't run tasks anyway
+            threads_limit = min(threads_limit or max_concurrency, max_concurrency)
+        if timeout is not None:
+            assert timeout > 0, "timeout must be > 0"
+        if hedge is not None:
+            assert hedge >= 1, "hedge must be >= 1"
+        if batched:
+            assert callable(batch_type), 'supplied batch_type is not callable'
+            assert timeout is None and hedge is None, "timeout and hedge aren't supported with batched=True"
+            assert shared_memory_threshold is None, "shared memory isn't supported with batched=True"
+        if not results_to_parent:
+            assert cache is None, "cache requires results to be sent to the parent"
+        assert backend in BACKENDS, f'unknown backend "{backend}", use one of {list(BACKENDS)}'
+
+        self.stats = stats
+        try:
+            tasks_count = len(f_args[0])
+            input_len = tasks_count
+        except TypeError:
+            # if not provided, 4 threads per process will be used
+            tasks_count = tasks_count_estimate
+            input_len = None
+        if stats is not None:
+            stats.start(tasks_count)
+        self.lookup = CacheLookup(cache, f) if cache is not None else None
+        self.initializers = (initializer, initargs, thread_initializer, thread_initargs)
+        self.timeout = timeout
+        self.hedge = hedge
+        self.batch_type = batch_type if batched else None
+
+        if backend == 'auto':
+            backend = backend_without_probe(f) or 'probe'
+        if backend == 'subinterpreters':
+            assert has_subinterpreters(), "backend='subinterpreters' requires Python 3.14+"
+            assert max_calls_per_second is None and max_concurrency is None, (
+                "rate limits aren't supported with backend='subinterpreters'")
+        if backend == 'processes':
+            assert not adaptive, "adaptive isn't supported with backend='processes'"
+        if backend in ('threads', 'subinterpreters'):
+            self.ctx = ThreadContext(backend == 'subinterpreters')
+        else:
+            self.ctx = get_context(mp_context, preload)
+        limiter = None
+        task_func = f
+        if max_calls_per_second is not None or max_concurrency is not None:
+            # shared by the probe and workers
+            limiter = RateLimiter(self.ctx, max_calls_per_second, max_concurrency)
+            f = limiter.wrap(f)
+        # result chunks of tasks run by the probe (see "put_probed")
+        self.probed = []
+        self.probed_count = 0
+        if backend == 'probe':
+            backend, f_args = self.probe(task_func, f_args, limiter)
+            if tasks_count is not None:
+                tasks_count = max(0, tasks_count - self.probed_count)
+        in_parent = backend in ('threads', 'subinterpreters')
+        if in_parent:
+            # there is a single worker, nothing crosses process boundaries
+            procs_limit = 1
+            affinity = reserved_cores = None
+            serializer = shared_memory_threshold = None
+            if not isinstance(self.ctx, ThreadContext):
+                # chosen by the probe
+                self.ctx = ThreadContext()
+            if self.probed:
+                # the probe ran the initializer in this process already
+                self.initializers = (None, (), thread_initializer, thread_initargs)
+
+        self.plan = None
+        if affinity is not None or reserved_cores:
+            self.plan = AffinityPlan(affinity, reserved_cores)
+            procs_limit = procs_limit or self.plan.cores_count
+
+        self.f_args = f_args
+        self.tasks_count = tasks_count
+        self.procs_count, self.threads_pp = calculate_procs_and_threads_per_process(
+            threads_limit, procs_limit, tasks_count, adaptive)
+        if backend == 'processes':
+            self.threads_pp = 1
+        self.max_threads = None
+        if adaptive:
+            self.max_threads = calculate_max_threads_per_process(
+                threads_limit, self.procs_count, tasks_count)
+        if max_in_flight is None:
+            max_in_flight = default_max_in_flight(input_len, self.procs_count, self.threads_pp)
+
+        self.serializer = Serializer.get(serializer)
+        self.transport = None
+        if shared_memory_threshold is not None:
+            self.transport = SharedMemoryTransport(shared_memory_threshold)
+            f = self.transport.wrap(f, share_results=results_to_parent)
+
+        # A single task queue shared by all processes, each process takes 
+        # tasks from it whenever its threads are idle.
+        self.task_queue = self.ctx.Queue()
+        self.result_queue = self.ctx.Queue()
+        self.worker_result_queue = self.result_queue
+        if self.serializer is not None:
+            f = self.serializer.wrap_function(f, self.ctx)
+            self.worker_result_queue = self.serializer.wrap_result_queue(self.result_queue)
+        self.f = f
+        self.interpreters = backend == 'subinterpreters'
+
+        self.procs = []
+        # Clean up subprocesses on exit
+        atexit.register(cleanup_subprocesses, self.procs)
+        # queues whose remaining data is dropped when the map is stopped
+        self.queues = [self.task_queue, self.result_queue]
+
+        self.chunk_sizer = ChunkSizer(chunksize, tasks_count, self.procs_count, max_in_flight)
+        self.window = TaskSlots(max_in_flight) if max_in_flight else None
+        if self.window is not None:
+            self.window.take(self.probed_count)
+        self.stopped = Event()
+        # raised by the consumer once results of enqueued tasks arrived
+        self.enqueue_error = None
+        self.cancel_token = cancel_token
+        self.cancel = partial(stop_map, self.stopped, self.window, self.result_queue,
+                              (None, None, None, None, CANCELLED, None))
+
+    def probe(self, f, f_args, limiter=None):
+        ''' Chooses the backend for backend='auto' by running the first task
+        (the first one not answered by the cache) in a thread of the parent,
+        through process_chunk like tasks of workers (so initializers,
+        batching, rate limits and timeouts apply), see backend_of_probe.
+        Returns a tuple containing the backend and arguments of remaining
+        tasks (inputs with len() are iterated again, others continue after
+        probed tasks). '''
+        ctx = ThreadContext()
+        task_queue = ctx.Queue()
+        result_queue = ctx.Queue()
+        def on_hit(start, results):
+            result_queue.put((start, results, {}, None, CACHE_PROC_ID, None))
+        iterators = [iter(a) for a in f_args]
+        chunk = None
+        for task in zip(*iterators):
+            chunks = [(self.probed_count, [task])]
+            self.probed_count += 1
+            if self.lookup is not None:
+                chunks = list(self.lookup.split_chunks(chunks, on_hit))
+            if chunks:
+                chunk = chunks[0]
+                break
+        if self.stats is not None and self.probed_count:
+            self.stats.on_enqueued(self.probed_count)
+        probe = TaskProbe(f)
+        # the initializer runs in the parent for the probe
+        previous_state = process_state()
+        if chunk is not None:
+            task_queue.put(chunk)
+            task_queue.put((None, None))
+            p = ctx.Process(target=process_chunk, args=[
+                PROBE_PROC_ID, probe if limiter is None else limiter.wrap(probe), 1,
+                task_queue, result_queue, None, self.stats is not None, self.initializers,
+                None, self.timeout, self.hedge, self.batch_type])
+            p.start()
+            p.join()
+            if p.exitcode != 0:
+                # e.g. the initializer raised an exception
+                raise RuntimeError("fast_map probe of backend='auto' failed")
+            if self.stats is not None:
+                self.stats.set_pid(PROBE_PROC_ID, p.pid)
+        while True:
+            try:
+                msg = result_queue.get(block=False)
+            except queue.Empty:
+                break
+            if msg[0] is not None:
+                self.probed.append(msg)
+        if all(hasattr(a, '__len__') for a in f_args):
+            rest = [Skip(a, self.probed_count) for a in f_args]
+        else:
+            rest = iterators
+        # nothing to run (or only cached results) needs no processes
+        backend = 'threads' if chunk is None else backend_of_probe(probe.cpu_ratio)
+        if backend != 'threads':
+            # workers run their own initializer, the state (e.g. a loaded
+            # model) isn't kept in the parent
+            swap_process_state(previous_state)
+        return backend, rest
+
+    def put_probed(self, result_queue=None):
+        ''' Puts result chunks of tasks run by the probe (see "probe") into
+        result_queue (the one of workers by default), before results of
+        workers arrive. '''
+        result_queue = result_queue or self.result_queue
+        for msg in self.probed:
+            result_queue.put(msg)
+
+    def start_workers(self, target=process_chunk, extra_args=()):
+        ''' Spawns procs_count worker processes running "target", which
+        accepts the arguments of process_chunk, extra_args are passed right
+        after the task function. '''
+        for i in range(self.procs_count):
+            cores, numa_node = self.plan.placement(i) if self.plan is not None else (None, None)
+            p = self.ctx.Process(target=target, args=[
+                i, self.f, *extra_args, self.threads_pp, self.task_queue,
+                self.worker_result_queue, self.max_threads, self.stats is not None,
+                self.initializers, cores, self.timeout, self.hedge, self.batch_type,
+                self.interpreters])
+            self.procs.append(p)
+            p.start()
+            if self.stats is not None:
+                self.stats.set_pid(i, p.pid)
+                if cores is not None:
+                    self.stats.set_placement(i, cores, numa_node)
+
+    def start_enqueuer(self):
+        ''' Starts the thread enqueuing chunks of tasks (see "enqueuer"),
+        tasks whose results are cached are answered right away. '''
+        if self.cancel_token is not None:
+            self.cancel_token.add_callback(self.cancel)
+        chunks = iter_timed(iter_chunks(self.f_args, self.chunk_sizer, self.probed_count),
+                            self.window, self.stats, self.stopped)
+        if self.lookup is not None:
+            # cached results go straight to the result queue
+            chunks = self.lookup.split_chunks(chunks, lambda start, results: self.result_queue.put(
+                (start, results, {}, None, CACHE_PROC_ID, None)))
+        if self.transport is not None:
+            chunks = self.transport.share_chunks(chunks)
+        if self.serializer is not None:
+            chunks = self.serializer.encode_chunks(chunks)
+        Thread(target=self.enqueue, daemon=True, args=[chunks]).start()
+
+    def enqueue(self, chunks):
+        ''' Runs "enqueuer" in its own thread, an exception of the input
+        (or of caching, shared memory or serializer steps) is stored, see
+        "check_enqueued". '''
+        try:
+            enqueuer(self.task_queue, chunks, self.procs_count)
+        except Exception as e:
+            self.enqueue_error = e
+
+    def check_enqueued(self):
+        ''' Re-raises the exception which stopped enqueuing tasks (if any),
+        consumers call it once results of all enqueued tasks arrived. '''
+        if self.enqueue_error is not None:
+            raise self.enqueue_error
+
+    def collect(self):
+        ''' Yields (start_index, results, errors, duration) chunks sent by
+        workers (see collect_results). '''
+        chunks = collect_results(self.procs, self.result_queue, self.stats)
+        if self.transport is not None:
+            chunks = self.transport.receive_chunks(chunks)
+        if self.lookup is not None:
+            chunks = self.lookup.store_chunks(chunks)
+        yield from chunks
+        if not self.stopped.is_set():
+            self.check_enqueued()
+
+    def finish(self, completed):
+        ''' Waits for worker processes to exit if all results were consumed
+        ("completed"), otherwise stops them right away. '''
+        if self.cancel_token is not None:
+            self.cancel_token.remove_callback(self.cancel)
+        if completed:
+            abandons_tasks = self.timeout is not None or self.hedge is not None
+            join_workers(self.procs, WORKERS_EXIT_TIMEOUT if abandons_tasks else None)
+        else:
+            # closed, cancelled or failed
+            stop_map(self.stopped, self.window)
+            terminate_workers(self.procs, self.queues)
+            if self.transport is not None:
+                # results which won't be read
+                self.transport.discard_chunks(self.result_queue)
+        if self.transport is not None:
+            self.transport.close()
+        if self.stats is not None:
+            self.stats.finish()
+
+def fast_map(f, *f_args, threads_limit=None, procs_limit=None, tasks_count_estimate=None,
+             chunksize=None, max_in_flight=None, ordered=True,
+             shared_memory_threshold=None, adaptive=False, stats=None, on_progress=None,
+             initializer=None, initargs=(), thread_initializer=None, thread_initargs=(),
+             cache=None, cancel_token=None, mp_context=None, preload=None,
+             serializer=None, affinity=None, reserved_cores=None, max_calls_per_second=None,
+             max_concurrency=None, timeout=None, hedge=None, batched=False, batch_type=list,
+             backend='hybrid'):
     ''' This function works like the built-in map() function, but it spawns
     multiple processes and threads to speed up the execution.
     f_args = a collection of arguments for the function "f", using the same
     format as the original map function.
     
     - threads_limit = total threads limit (e.g. if equal to 8, then on a 4 core
-    cpu, 2 threads will be spawned in each process)
+    cpu, 2 threads will be spawned in each process), if "f" is a coroutine 
+    function (async def) it limits the number of concurrently awaited 
+    coroutines instead (each process runs them in a single event loop)
     - tasks_count_estimate argument should only be used if supplying generators
-       '''
-    global enqueueing_finished, enqueued_items_count
-    if threads_limit is not None:
-        assert threads_limit > 0, "threads_limit must be > 0"
-    if procs_limit is not None:
-        assert procs_limit > 0, "procs_limit must be > 0"
-
-    def enqueuer(task_queues, f_args):
-        ''' This function evenly enqueues tasks into 
-        multiple task queues (one queue per process). '''
-        global enqueueing_finished, enqueued_items_count
-        for i, val in enumerate(zip(*f_args)):
-            task_queues[i % len(task_queues)].put((i,val))
-            enqueued_items_count += 1
-        for q in task_queues:
-            q.put((None,None))
-        enqueueing_finished = True
+    - chunksize = the number of tasks sent to a process together (results
+    are sent back together too), by default it's adjusted automatically 
+    based on the number of tasks and their observed duration
+    - max_in_flight = the maximum number of tasks enqueued but not yet 
+    yielded, it keeps the memory usage flat for huge (or infinite) inputs, 
+    by default it's unlimited unless generators are supplied
+    - ordered = if False, (index, result) tuples are yielded as soon as
+    tasks complete, instead of results in the order of arguments
+    - shared_memory_threshold = arguments and results (bytes, bytearray,
+    memoryview or NumPy arrays) having at least this many bytes are passed
+    through shared memory instead of being pickled (Python 3.8+)
+    - adaptive = if True, the number of threads in each process is adjusted
+    at runtime (up to threads_limit), based on the CPU time of tasks compared
+    to their wall time, I/O-bound tasks get more threads while CPU-bound 
+    tasks get fewer of them (useful with generators, where the number of
+    tasks is unknown)
+    - stats = FastMapStats object updated while the map runs (task counts,
+    tasks in flight, per-process throughput, task durations histogram, 
+    reorder buffer size, enqueuer waiting times), see FastMapStats
+    - on_progress = callback receiving FastMapStats (e.g. to show progress
+    and ETA), called at most every 0.5s and once when the map ends
+    - initializer = function called with "initargs" once in each worker
+    process before it runs any tasks, its return value (e.g. a loaded model)
+    is available to tasks through process_state()
+    - thread_initializer = function called with "thread_initargs" once in
+    each thread of worker processes, its return value (e.g. a database 
+    connection) is available to tasks through thread_state()
+    - cache = ResultCache object, tasks whose results are cached (keyed on
+    the function and its arguments) are answered by the parent without being
+    sent to worker processes, results of other tasks are added to the cache
+    - cancel_token = CancelToken object allowing to stop the map call from 
+    another thread, see CancelToken
+    - mp_context = start method of worker processes ('fork', 'spawn' or
+    'forkserver') or a multiprocessing context, by default the default
+    context of multiprocessing is used ('fork' inherits locks held by other
+    threads of the parent, 'spawn' imports modules again in every process)
+    - preload = names of modules imported once by the forkserver process
+    (with mp_context='forkserver'), so new worker processes start quickly,
+    see get_context
+    - serializer = 'cloudpickle' (allows lambdas and locally defined
+    functions with 'spawn' and 'forkserver' start methods), 'marshal'
+    (faster than pickle for chunks of primitive data like numbers, strings
+    and lists/dicts of them), 'pickle5' (highest pickle protocol) or a
+    Serializer object combining a function serializer and a data codec,
+    see Serializer
+    - affinity = 'core' (pins each process to a single core, spreading them
+    evenly across NUMA nodes), 'numa' (pins each process to all cores of a
+    NUMA node) or a list of cores (or core sets) for consecutive processes,
+    by default processes aren't pinned (Linux only), see AffinityPlan
+    - reserved_cores = cores left free for the parent process (e.g. for
+    collecting results), worker processes aren't run on them
 
-    try:
-        tasks_count = len(f_args[0])
-    except TypeError:
-        # if not provided, 4 threads per process will be used
-        tasks_count = tasks_count_estimate
-    procs_count, threads_pp = calculate_procs_and_threads_per_process(
-        threads_limit, procs_limit, tasks_count)
-
-    # Multiple task queues are used for the sake of 
-    # even task distribution within processes.
-    task_queues = [mp.JoinableQueue() for _ in range(procs_count)]
-    result_queue = mp.Queue()
-
-    procs = []
-
-    # Clean up subprocesses on exit
-    atexit.register(cleanup_subprocesses, procs)
-
-    for i in range(procs_count):
-        p = mp.Process(target=process_chunk, args=[
-            i, f, threads_pp, task_queues[i], result_queue])
-        procs.append(p)
-        p.start()
-
-    enqueueing_finished = False
-    enqueued_items_count = 0
+    - max_calls_per_second = calls of "f" (in all processes and threads
+    together) start at most at this rate, evenly spaced (e.g. for APIs with
+    a quota), see RateLimiter
+    - max_concurrency = the maximum number of calls of "f" running at once
+    in all processes together (threads_limit is capped to it)
+    - timeout = tasks running longer than this many seconds fail with 
+    TimeoutError (re-raised when their result would be yielded), so a hung
+    task doesn't block the results generator forever
+    - hedge = tasks running "hedge" times longer than the median duration
+    of tasks completed by their process (e.g. 3.0) are started again in an
+    idle thread of the process, the first completed run gives the result
+    (bounds the tail latency of I/O-bound tasks, "f" may run twice for 
+    the same arguments), see TaskWatchdog
+    - batched = if True, "f" is called once per chunk of tasks (the chunk 
+    size is the batch size, set it with "chunksize" or let it be adjusted
+    automatically), with a column of arguments for each of its parameters
+    (e.g. f([1, 2, 3], [4, 5, 6]) instead of f(1, 4), f(2, 5), f(3, 6)),
+    it must return a sequence of results (one for each task), which are
+    yielded individually, this allows to use vectorized (NumPy) or batched
+    (database, HTTP) APIs, an exception fails all tasks of the batch
+    - batch_type = type of columns supplied to "f" in batched mode (list
+    by default, e.g. numpy.asarray gives NumPy arrays)
+    - backend = how tasks are run:
+      'hybrid' (default) = worker processes, each running a thread pool
+      'processes' = worker processes running a single task at a time (no
+    threads, for CPU-bound functions that aren't thread-safe)
+      'threads' = a single thread pool (or event loop) in the parent, nothing
+    is pickled (I/O-bound tasks, free-threaded Python builds), process
+    options (procs_limit, mp_context, serializer, affinity, shared memory)
+    are ignored, the "initializer" runs in the parent
+      'subinterpreters' = like 'threads' but functions run in a pool of
+    subinterpreters, each having its own GIL (Python 3.14+, "f" and its
+    arguments must be picklable)
+      'auto' = 'threads' on free-threaded Python builds and for coroutine
+    functions, otherwise the first task runs in a thread of the parent (its
+    result is used, all other options apply to it, so the "initializer"
+    runs in the parent too, its state is dropped unless 'threads' are
+    chosen) and I/O-bound tasks (using little CPU time
+    compared to their wall time) run in 'threads', others in 'hybrid'
+
+    With affinity (or reserved_cores) there is a process for each core
+    workers may use by default, the placement is reported in stats.procs.
+
+    If "f" raises an exception, it is re-raised when its result would
+    be yielded. Once the generator is closed (e.g. by "break" in a "for" 
+    loop), or it raised an exception, no more tasks are enqueued and worker
+    processes are stopped right away.
+       '''
+    run = MapRun(f, f_args, threads_limit=threads_limit, procs_limit=procs_limit,
+                 tasks_count_estimate=tasks_count_estimate, chunksize=chunksize,
+                 max_in_flight=max_in_flight, shared_memory_threshold=shared_memory_threshold,
+                 adaptive=adaptive, stats=stats, on_progress=on_progress,
+                 initializer=initializer, initargs=initargs,
+                 thread_initializer=thread_initializer, thread_initargs=thread_initargs,
+                 cache=cache, cancel_token=cancel_token, mp_context=mp_context,
+                 preload=preload, serializer=serializer, affinity=affinity,
+                 reserved_cores=reserved_cores, max_calls_per_second=max_calls_per_second,
+                 max_concurrency=max_concurrency, timeout=timeout, hedge=hedge,
+                 batched=batched, batch_type=batch_type, backend=backend)
+    run.start_workers()
+    run.put_probed()
     # Enqueue tasks (destination function arguments "f_args")
-    # into multiple task queues.
-    Thread(target=enqueuer, daemon=True, args=[task_queues, f_args]).start()
+    # into the task queue.
+    run.start_enqueuer()
 
-    expected_index = 0
-    ordered_results = {} # key=index val=result
-    while True:
-        alive_procs = [p for p in procs if p.is_alive()]
-        if result_queue.empty() and len(alive_procs) == 0:
-            return
-        while not result_queue.empty():    
-            i, res = result_queue.get()
-            if i != expected_index:
-                ordered_results[i] = res
-                continue
-            yield res
-            expected_index += 1
-            while ordered_results.get(expected_index, None) is not None:
-                yield ordered_results.pop(expected_index)
-                expected_index += 1
-            # if expected_index == tasks_count:
-            if expected_index == enqueued_items_count and enqueueing_finished:
-                return
+    results = order_results if ordered else unordered_results
+    completed = False
+    try:
+        yield from results(run.collect(), run.chunk_sizer, run.window, run.stats)
+        completed = not run.stopped.is_set()
+    finally:
+        run.finish(completed)
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,72 @@
+from .fast_map import fast_map
+from .cancel import CancelToken
+from threading import Thread, Event
+import asyncio
+
+# Maximum number of results waiting for the "async for" consumer.
+DEFAULT_BUFFER_SIZE = 1000
+
+async def fast_map_aio(f, *f_args, buffer_size=DEFAULT_BUFFER_SIZE, **kwargs):
+    ''' Asynchronous generator equivalent of fast_map, for use in asyncio
+    applications. It accepts the same arguments as fast_map (plus
+    buffer_size), results are awaited without blocking the event loop.
+    "f" may be a regular function or a coroutine function.
+
+        Usage:
+
+        async def task(x):
+            await asyncio.sleep(1)
+            return x*x
+
+        async def main():
+            async for result in fast_map_aio(task, range(1000), threads_limit=1000):
+                print(result)
+
+        asyncio.run(main())
+    '''
+    assert buffer_size > 0, "buffer_size must be > 0"
+    loop = asyncio.get_event_loop()
+    # (True, result) items followed by (False, exception or None)
+    results = asyncio.Queue(maxsize=buffer_size)
+    stopped = Event()
+    # stops fast_map even if it waits for a result when the consumer leaves
+    user_token = kwargs.pop('cancel_token', None)
+    cancel_token = CancelToken()
+    if user_token is not None:
+        user_token.add_callback(cancel_token.cancel)
+
+    def producer():
+        item = (False, None)
+        gen = fast_map(f, *f_args, cancel_token=cancel_token, **kwargs)
+        try:
+            for res in gen:
+                # blocks while the buffer is full (backpressure)
+                asyncio.run_coroutine_threadsafe(results.put((True, res)), loop).result()
+                if stopped.is_set():
+                    return
+        except BaseException as e:
+            item = (False, e)
+        finally:
+            gen.close()
+        asyncio.run_coroutine_threadsafe(results.put(item), loop)
+
+    Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            has_result, value = await results.get()
+            if not has_result:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stopped.set()
+        cancel_token.cancel()
+        if user_token is not None:
+            user_token.remove_callback(cancel_token.cancel)
+        # let the producer put its pending result (if the buffer was full)
+        while not results.empty():
+            results.get_nowait()
+
+if __name__ == '__main__':
+    pass
@@ -1,12 +1,16 @@
 from fast_map import fast_map
-from threading import Thread, Lock
+from fast_map.cancel import CancelToken, CancellableThread
 
 def fast_map_async(*args, **kwargs):
-    ''' Returns a reference to the spawned thread.
+    ''' Returns a reference to the spawned thread, its cancel() method 
+        stops the map call (on_done is still called).
         User may supply the following callbacks:
         - on_result   (having a single argument - result)
         - on_done     (no arguments)
 
+        With ordered=False, on_result receives (index, result) tuples 
+        as soon as tasks complete (instead of results in order).
+
         Usage:
 
         import time
@@ -29,6 +33,7 @@ def fast_map_async(*args, **kwargs):
                 )
 
         # returned thread may be used to "t.join()" if we want
+        # or to stop remaining tasks by "t.cancel()"
     '''
 
     def thread(args, kwargs):
@@ -40,7 +45,8 @@ def fast_map_async(*args, **kwargs):
             on_result(result)
         on_done()
 
-    t = Thread(target=thread, args=[args, kwargs])
+    kwargs['cancel_token'] = kwargs.get('cancel_token') or CancelToken()
+    t = CancellableThread(target=thread, args=[args, kwargs], cancel_token=kwargs['cancel_token'])
     t.start()
     return t
 
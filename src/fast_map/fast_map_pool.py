@@ -0,0 +1,568 @@
+import atexit
+import multiprocessing as mp
+import math
+from functools import partial
+from threading import Thread, Lock, Event
+import queue
+import asyncio
+
+from .fast_map import (cleanup_subprocesses, submit_chunk, make_executor, ChunkSizer,
+                       iter_chunks, iter_timed, order_results, unordered_results, TaskSlots,
+                       default_max_in_flight, calculate_max_threads_per_process, stop_map,
+                       WORKERS_CHECK_INTERVAL)
+from .threads_tuner import ThreadsTuner
+from .shared_memory_transport import (SharedMemoryTransport, remove_shared_results,
+                                      remove_segments_on_terminate)
+from .stats import FastMapStats
+from .worker_state import run_process_initializer
+from .cache import CacheLookup, CACHE_PROC_ID
+from .cancel import CancelToken, CancellableThread
+from .context import get_context
+from .serializers import Serializer
+from .affinity import AffinityPlan, pin_process
+from .rate_limit import RateLimiter
+
+DEFAULT_THREADS_PER_PROCESS = 4
+
+def pool_worker(proc_id, threads_count, task_queue, control_queue, result_queue,
+                max_threads=None, initializers=None, cores=None, limiter=None,
+                first_job_id=0, ongoing_jobs=()):
+    '''This is the target function for each process of FastMapPool. Unlike
+    "process_chunk" it outlives a single map call, so the task function is
+    not given upfront. The task_queue (shared by all processes) delivers:
+    - ('chunk', job_id, start_index, [args, ...])
+                                  runs func(*args) for each task of the chunk
+                                  in the thread pool
+    - None                        finishes started tasks and exits
+    The control_queue (one per process) delivers:
+    - ('job', job_id, func, record_durations, batch_type)
+                                  registers the function of a new map call
+                                  (batch_type is None unless it's batched,
+                                  see "submit_chunk")
+    - ('job_end', job_id)         forgets the function of a finished map call
+    - ('threads', threads_count)  replaces the thread pool with a new one
+    Coroutine functions are awaited in an event loop (see "make_executor").
+    If max_threads is supplied, the number of threads is adjusted at 
+    runtime (see ThreadsTuner). Initializers and cores are used like in
+    "process_chunk". If a RateLimiter is supplied, functions of all jobs
+    are called through it.
+    Processes added by "resize" aren't told about jobs which ended before
+    they started (job ids below first_job_id, except ongoing_jobs), queued
+    chunks of these jobs are skipped.
+    Results of each chunk are put on the result_queue together as
+    (job_id, start_index, results, errors, duration, proc_id, task_durations),
+    see "process_chunk". '''
+    pin_process(cores)
+    remove_segments_on_terminate()
+    initializer, initargs, thread_initializer, thread_initargs = initializers or (None, (), None, ())
+    run_process_initializer(initializer, initargs)
+    funcs = {} # key=job_id val=(func, record_durations, batch_type)
+    ended_jobs = set()
+    ongoing_jobs = set(ongoing_jobs)
+    def is_ended(job_id):
+        return job_id in ended_jobs or (job_id < first_job_id and job_id not in ongoing_jobs)
+    old_executors = []
+    executors = {} # key=True for coroutine functions, False for others
+    slots = TaskSlots(threads_count)
+    tuner = ThreadsTuner(slots, max_threads) if max_threads else None
+    def get_executor(func):
+        is_coroutine = asyncio.iscoroutinefunction(func)
+        if is_coroutine not in executors:
+            executors[is_coroutine] = make_executor(func, max(slots.limit, max_threads or 0),
+                                                    thread_initializer, thread_initargs)
+        return executors[is_coroutine]
+    def on_chunk_completed(start, results, errors, duration, task_durations, job_id):
+        result_queue.put((job_id, start, results, errors, duration, proc_id, task_durations))
+    def handle_control(msg):
+        kind = msg[0]
+        if kind == 'job':
+            func, record_durations, batch_type = msg[2:]
+            if limiter is not None:
+                func = limiter.wrap(func)
+            funcs[msg[1]] = (func, record_durations, batch_type)
+        elif kind == 'job_end':
+            funcs.pop(msg[1], None)
+            ended_jobs.add(msg[1])
+        elif kind == 'threads':
+            # already submitted tasks keep running on the old threads,
+            # new executors are created when needed
+            for executor in executors.values():
+                executor.shutdown(wait=False)
+            old_executors.extend(executors.values())
+            executors.clear()
+            slots.set_limit(msg[1])
+    while True:
+        slots.wait_for_free()
+        msg = task_queue.get()
+        if msg is None:
+            break
+        _, job_id, start, tasks = msg
+        # "job" message is always sent before chunks of the job
+        while job_id not in funcs and not is_ended(job_id):
+            handle_control(control_queue.get())
+        while True:
+            try:
+                handle_control(control_queue.get_nowait())
+            except queue.Empty:
+                break
+        if is_ended(job_id):
+            # results of abandoned map calls aren't needed
+            continue
+        func, record_durations, batch_type = funcs[job_id]
+        observe = None
+        if tuner is not None and not asyncio.iscoroutinefunction(func):
+            observe = tuner.observe
+        submit_chunk(get_executor(func), func, start, tasks,
+                     partial(on_chunk_completed, job_id=job_id), slots, observe,
+                     record_durations, batch_type=batch_type)
+    for executor in old_executors + list(executors.values()):
+        executor.shutdown(wait=True)
+    result_queue.put((None, proc_id))
+
+
+class _Job:
+    '''Parent-side state of a single map call submitted to FastMapPool.'''
+    def __init__(self, job_id, func, stats=None, batch_type=None):
+        self.job_id = job_id
+        self.func = func
+        self.stats = stats
+        self.batch_type = batch_type
+        self.lookup = None
+        # set once the job ended or was abandoned, stops enqueuing
+        self.stopped = Event()
+        self.chunk_sizer = None
+        self.window = None
+        self.transport = None
+        # set if a worker process crashed, raised instead of the results
+        self.error = None
+        # set if enqueuing tasks failed, raised after the results
+        self.enqueue_error = None
+        # (start_index, results, errors, duration, proc_id, task_durations)
+        # chunks routed here by the collector thread, (None, total) is put
+        # once all tasks were enqueued, (None, None) when it's cancelled
+        self.results = queue.Queue()
+
+    def control_message(self):
+        return ('job', self.job_id, self.func, self.stats is not None, self.batch_type)
+
+
+class FastMapPool:
+    ''' Long-lived pool of worker processes (each running its own thread
+    pool) that may be reused by many map calls. This avoids spawning new
+    processes on every fast_map call, which dominates the execution time
+    when mapping small batches of tasks.
+
+    - procs_limit = the number of processes (by default, the number of CPU cores)
+    - threads_limit = total threads limit (e.g. if equal to 8, then on a 4 core
+      cpu, 2 threads will be spawned in each process), by default 4 threads
+      are used in each process
+    - shared_memory_threshold = see fast_map, applies to all map calls
+    - adaptive = if True, the number of threads in each process is adjusted
+      at runtime (up to threads_limit), see fast_map
+    - initializer, initargs, thread_initializer, thread_initargs = see 
+      fast_map, called once in each process/thread of the pool (not once
+      per map call)
+    - mp_context, preload = start method of processes and modules preloaded
+      by the forkserver, see fast_map
+    - serializer = see fast_map, applies to all map calls (functions are
+      sent to processes once per map call)
+    - affinity, reserved_cores = see fast_map, processes added by resize()
+      are placed the same way
+    - max_calls_per_second, max_concurrency = see fast_map, limits are
+      shared by all map calls of the pool
+
+    Usage:
+
+        with FastMapPool(threads_limit=100) as pool:
+            for result in pool.imap(task, range(8)):
+                print(result)
+            results = pool.map(task, range(8))
+    '''
+    def __init__(self, procs_limit=None, threads_limit=None, shared_memory_threshold=None,
+                 adaptive=False, initializer=None, initargs=(), thread_initializer=None,
+                 thread_initargs=(), mp_context=None, preload=None, serializer=None,
+                 affinity=None, reserved_cores=None, max_calls_per_second=None,
+                 max_concurrency=None):
+        if threads_limit is not None:
+            assert threads_limit > 0, "threads_limit must be > 0"
+        if procs_limit is not None:
+            assert procs_limit > 0, "procs_limit must be > 0"
+        if initializer is not None:
+            assert callable(initializer), 'supplied initializer is not callable'
+        if thread_initializer is not None:
+            assert callable(thread_initializer), 'supplied thread_initializer is not callable'
+        self._initializers = (initializer, initargs, thread_initializer, thread_initargs)
+        if max_concurrency is not None:
+            threads_limit = min(threads_limit or max_concurrency, max_concurrency)
+        self._affinity = None
+        if affinity is not None or reserved_cores:
+            self._affinity = AffinityPlan(affinity, reserved_cores)
+            procs_limit = procs_limit or self._affinity.cores_count
+        procs_count, threads_pp = self._calculate_size(procs_limit, threads_limit)
+        self._lock = Lock()
+        self._ctx = get_context(mp_context, preload)
+        self._limiter = None
+        if max_calls_per_second is not None or max_concurrency is not None:
+            self._limiter = RateLimiter(self._ctx, max_calls_per_second, max_concurrency)
+        # a single task queue shared by all processes, each process takes
+        # tasks from it whenever its threads are idle
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        # key=proc_id val=(process, control_queue) of not yet exited processes
+        self._procs = {}
+        # the number of processes that weren't asked to stop
+        self._procs_count = 0
+        self._procs_started = 0
+        self._threads_pp = threads_pp
+        self._max_threads = None
+        if adaptive:
+            self._max_threads = calculate_max_threads_per_process(
+                threads_limit, procs_count, None)
+        self._jobs = {} # key=job_id val=_Job
+        self._jobs_count = 0
+        self._placements = {} # key=proc_id val=(cores, numa_node)
+        self._closed = False
+        # set once a worker process crashed, the pool can't be used anymore
+        self._error = None
+        self._shared_memory_threshold = shared_memory_threshold
+        self._serializer = Serializer.get(serializer)
+        self._worker_result_queue = self._result_queue
+        if self._serializer is not None:
+            # (job_id, start_index, results, ...) messages
+            self._worker_result_queue = self._serializer.wrap_result_queue(
+                self._result_queue, index=2)
+        if shared_memory_threshold is not None:
+            # validates the threshold and prepares shared memory before
+            # starting processes
+            SharedMemoryTransport(shared_memory_threshold)
+        # Clean up subprocesses on exit
+        self._all_procs = []
+        atexit.register(cleanup_subprocesses, self._all_procs)
+        self._add_processes(procs_count)
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    @staticmethod
+    def _calculate_size(procs_limit, threads_limit):
+        procs_count = mp.cpu_count()
+        if procs_limit:
+            procs_count = min(procs_count, procs_limit)
+        if threads_limit and threads_limit < procs_count:
+            return threads_limit, 1
+        threads_pp = DEFAULT_THREADS_PER_PROCESS
+        if threads_limit:
+            threads_pp = math.ceil(threads_limit / procs_count)
+        return procs_count, threads_pp
+
+    @property
+    def procs_count(self):
+        return self._procs_count
+
+    @property
+    def threads_per_process(self):
+        return self._threads_pp
+
+    def _add_processes(self, count):
+        for _ in range(count):
+            control_queue = self._ctx.Queue()
+            proc_id = self._procs_started
+            cores = None
+            if self._affinity is not None:
+                self._placements[proc_id] = self._next_placement()
+                cores = self._placements[proc_id][0]
+            p = self._ctx.Process(target=pool_worker, daemon=True, args=[
+                proc_id, self._threads_pp, self._task_queue, control_queue,
+                self._worker_result_queue, self._max_threads, self._initializers, cores,
+                self._limiter, self._jobs_count, list(self._jobs)])
+            self._procs_started += 1
+            p.start()
+            # chunks of ongoing jobs may be taken by new processes too
+            for job in self._jobs.values():
+                control_queue.put(job.control_message())
+            self._procs[proc_id] = (p, control_queue)
+            self._all_procs.append(p)
+        self._procs_count += count
+
+    def _next_placement(self):
+        ''' Returns the placement (see AffinityPlan) used by the fewest
+        running processes. '''
+        used = [self._placements[proc_id] for proc_id in self._procs if proc_id in self._placements]
+        placements = [self._affinity.placement(i) for i in range(len(self._affinity.placements))]
+        return min(placements, key=used.count)
+
+    def placement(self):
+        ''' Returns a dict (key=proc_id) of (cores, numa_node) tuples of
+        running processes pinned to cores (see "affinity"). '''
+        with self._lock:
+            return {proc_id: self._placements[proc_id] for proc_id in self._procs
+                    if proc_id in self._placements}
+
+    def _stop_processes(self, count):
+        ''' Stopped processes finish their already started tasks before
+        exiting. The sentinels are queued after already queued chunks, so 
+        these are processed too. '''
+        for _ in range(count):
+            self._task_queue.put(None)
+        self._procs_count -= count
+
+    def _send_control(self, msg):
+        for _, control_queue in self._procs.values():
+            control_queue.put(msg)
+
+    def _collect(self):
+        ''' Routes results from the shared result queue to the jobs they
+        belong to. Runs in a separate thread until the pool is closed. '''
+        while True:
+            try:
+                job_id, *chunk = self._result_queue.get(timeout=WORKERS_CHECK_INTERVAL)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if job_id is None:
+                if chunk[0] is None:
+                    # put by close() once all processes exited
+                    return
+                # worker process exited (its id is stored in chunk[0])
+                with self._lock:
+                    self._procs.pop(chunk[0], None)
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    # under the lock, so the ended job doesn't miss it
+                    # when discarding its chunks
+                    job.results.put(chunk)
+            if job is None:
+                # the job ended (e.g. the consumer broke out of the loop)
+                remove_shared_results(chunk[1])
+
+    def _check_workers(self):
+        ''' Fails all ongoing jobs if any worker process crashed (e.g. its
+        initializer raised an exception), chunks it took are lost. Like in
+        "check_workers", processes exiting normally put the sentinel first. '''
+        with self._lock:
+            for proc_id, (p, _) in list(self._procs.items()):
+                if p.exitcode in (None, 0):
+                    continue
+                self._procs.pop(proc_id)
+                if self._error is None:
+                    self._error = RuntimeError(f'fast_map worker process (pid={p.pid}) '
+                                               f'exited unexpectedly with code {p.exitcode}')
+            if self._error is None:
+                return
+            for job in self._jobs.values():
+                if job.error is None:
+                    job.error = self._error
+                    # wakes up the consumer of the job
+                    job.results.put((None, None))
+
+    def _enqueue(self, job, f_args):
+        ''' Enqueues chunks of tasks of a single job into the shared task
+        queue in the order of their indices (so the lowest indices are 
+        processed first, allowing to yield ordered results early). '''
+        with self._lock:
+            self._send_control(job.control_message())
+        count = 0
+        def on_hit(start, results):
+            nonlocal count
+            count += len(results)
+            job.results.put((start, results, {}, None, CACHE_PROC_ID, None))
+        chunks = iter_timed(iter_chunks(f_args, job.chunk_sizer), job.window, job.stats,
+                            job.stopped)
+        if job.lookup is not None:
+            chunks = job.lookup.split_chunks(chunks, on_hit)
+        if job.transport is not None:
+            chunks = job.transport.share_chunks(chunks)
+        try:
+            for start, tasks in chunks:
+                payload = tasks if self._serializer is None else self._serializer.encode(tasks)
+                self._task_queue.put(('chunk', job.job_id, start, payload))
+                count += len(tasks)
+        except Exception as e:
+            # e.g. the input generator raised, it's re-raised once results
+            # of enqueued tasks arrived
+            job.enqueue_error = e
+        job.results.put((None, count))
+
+    def imap(self, f, *f_args, chunksize=None, max_in_flight=None, ordered=True,
+             stats=None, on_progress=None, cache=None, cancel_token=None, batched=False,
+             batch_type=list):
+        ''' Works like fast_map (results are yielded in order, as soon as
+        they are available) but uses the processes of this pool. With 
+        ordered=False, (index, result) tuples are yielded as tasks complete.
+        See fast_map for "stats", "on_progress", "cache", "cancel_token",
+        "batched" and "batch_type".
+        Closing the generator stops enqueuing tasks of this call, already
+        queued tasks are skipped by worker processes. '''
+        if chunksize is not None:
+            assert chunksize > 0, "chunksize must be > 0"
+        if max_in_flight is not None:
+            assert max_in_flight > 0, "max_in_flight must be > 0"
+        if batched:
+            assert callable(batch_type), 'supplied batch_type is not callable'
+            assert self._shared_memory_threshold is None, "shared memory isn't supported with batched=True"
+        if on_progress is not None:
+            stats = stats or FastMapStats()
+            assert callable(on_progress), 'supplied on_progress is not callable'
+            stats.on_progress = on_progress
+        try:
+            tasks_count = len(f_args[0])
+        except TypeError:
+            tasks_count = None
+        if stats is not None:
+            stats.start(tasks_count)
+        with self._lock:
+            assert not self._closed, "FastMapPool is closed"
+            if self._error is not None:
+                raise RuntimeError(f'FastMapPool is broken: {self._error}')
+            if stats is not None:
+                for proc_id, (p, _) in self._procs.items():
+                    stats.set_pid(proc_id, p.pid)
+                    if proc_id in self._placements:
+                        stats.set_placement(proc_id, *self._placements[proc_id])
+            job = _Job(self._jobs_count, f, stats, batch_type if batched else None)
+            if cache is not None:
+                job.lookup = CacheLookup(cache, f)
+            if self._shared_memory_threshold is not None:
+                job.transport = SharedMemoryTransport(self._shared_memory_threshold)
+                job.func = job.transport.wrap(f)
+            if self._serializer is not None:
+                # control messages are always pickled
+                job.func = self._serializer.wrap_function(job.func)
+            if max_in_flight is None:
+                max_in_flight = default_max_in_flight(
+                    tasks_count, self._procs_count, self._threads_pp)
+            if max_in_flight:
+                job.window = TaskSlots(max_in_flight)
+            job.chunk_sizer = ChunkSizer(chunksize, tasks_count, self._procs_count,
+                                         max_in_flight)
+            self._jobs_count += 1
+            self._jobs[job.job_id] = job
+        Thread(target=self._enqueue, daemon=True, args=[job, f_args]).start()
+        return self._iter_results(job, ordered, cancel_token)
+
+    def _iter_chunks(self, job):
+        ''' Yields result chunks of the job until all of them arrived. '''
+        total = None
+        received = 0
+        while total is None or received < total:
+            start, *chunk = job.results.get()
+            if start is None:
+                if chunk[0] is None:
+                    if job.error is not None:
+                        raise job.error
+                    # cancelled
+                    return
+                total = chunk[0]
+                continue
+            results, errors, duration, proc_id, task_durations = chunk
+            received += len(results)
+            if job.stats is not None:
+                job.stats.on_chunk_completed(proc_id, len(results), len(errors), duration,
+                                             task_durations)
+            yield start, results, errors, duration
+        if job.enqueue_error is not None:
+            raise job.enqueue_error
+
+    def _iter_results(self, job, ordered, cancel_token=None):
+        results = order_results if ordered else unordered_results
+        cancel = partial(stop_map, job.stopped, job.window, job.results, (None, None))
+        if cancel_token is not None:
+            cancel_token.add_callback(cancel)
+        chunks = self._iter_chunks(job)
+        if job.transport is not None:
+            chunks = job.transport.receive_chunks(chunks)
+        if job.lookup is not None:
+            chunks = job.lookup.store_chunks(chunks)
+        try:
+            yield from results(chunks, job.chunk_sizer, job.window, job.stats)
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(cancel)
+            stop_map(job.stopped, job.window)
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+                self._send_control(('job_end', job.job_id))
+            if job.transport is not None:
+                job.transport.discard_chunks(job.results)
+            if job.stats is not None:
+                job.stats.finish()
+
+    def map(self, f, *f_args, **kwargs):
+        ''' Blocks until all tasks are done and returns the list of results. 
+        Accepts the same keyword arguments as imap. '''
+        return list(self.imap(f, *f_args, **kwargs))
+
+    def map_async(self, f, *f_args, on_result=None, on_done=None, **kwargs):
+        ''' Non-blocking equivalent of imap, see fast_map_async for
+        the description of callbacks. Returns the spawned thread, its 
+        cancel() method stops the map call. '''
+        on_result = on_result or (lambda x:None)
+        assert callable(on_result), 'supplied on_result is not callable'
+        on_done = on_done or (lambda:None)
+        assert callable(on_done), 'supplied on_done is not callable'
+        def thread(results):
+            for result in results:
+                on_result(result)
+            on_done()
+        cancel_token = kwargs.pop('cancel_token', None) or CancelToken()
+        t = CancellableThread(target=thread, cancel_token=cancel_token, args=[
+            self.imap(f, *f_args, cancel_token=cancel_token, **kwargs)])
+        t.start()
+        return t
+
+    def resize(self, procs_count=None, threads_per_process=None):
+        ''' Changes the number of processes and/or the number of threads
+        in each process. Tasks that are already queued are not affected
+        (processes removed from the pool finish their queued tasks). '''
+        if procs_count is not None:
+            assert procs_count > 0, "procs_count must be > 0"
+        if threads_per_process is not None:
+            assert threads_per_process > 0, "threads_per_process must be > 0"
+        with self._lock:
+            assert not self._closed, "FastMapPool is closed"
+            if threads_per_process is not None and threads_per_process != self._threads_pp:
+                self._threads_pp = threads_per_process
+                self._send_control(('threads', threads_per_process))
+            if procs_count is not None:
+                if procs_count > self._procs_count:
+                    self._add_processes(procs_count - self._procs_count)
+                else:
+                    self._stop_processes(self._procs_count - procs_count)
+
+    def close(self):
+        ''' Waits until all queued tasks are done and stops the processes. '''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._stop_processes(self._procs_count)
+        for p in self._all_procs:
+            p.join()
+        self._result_queue.put((None, None))
+        self._collector.join()
+
+    def terminate(self):
+        ''' Stops the processes immediately, without finishing queued tasks.
+        Ongoing map calls raise RuntimeError. '''
+        with self._lock:
+            self._closed = True
+            self._procs_count = 0
+            for job in self._jobs.values():
+                if job.error is None:
+                    job.error = RuntimeError('FastMapPool was terminated')
+                    # wakes up the consumer of the job
+                    job.results.put((None, None))
+        cleanup_subprocesses(self._all_procs)
+        for p in self._all_procs:
+            p.join()
+        self._result_queue.put((None, None))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,107 @@
+from functools import partial
+import multiprocessing as mp
+import mmap
+import os
+
+from .fast_map import fast_map
+
+# Limits of the automatic size (in bytes) of ranges processed by a single
+# task, results of a whole range are sent to the parent together.
+MIN_RANGE_SIZE = 1024 * 1024
+MAX_RANGE_SIZE = 64 * 1024 * 1024
+# Automatic range size aims at this many ranges per process (so they are
+# distributed evenly).
+RANGES_PER_PROCESS = 4
+
+def split_file(path, range_size):
+    ''' Returns (path, start, end) byte ranges of the file, each about
+    range_size bytes long, beginning at the start of a line and ending
+    after a newline (or at the end of the file). Only a single line is
+    read around each boundary, so the file isn't read by the parent. '''
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            end = start + range_size
+            if end < size:
+                # the range ends after the newline at or after "end - 1"
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            end = min(end, size)
+            ranges.append((path, start, end))
+            start = end
+    return ranges
+
+def iter_lines(mapped, start, end):
+    ''' Yields lines (including the newline, like iterating a file opened
+    in binary mode) of the mmap between start and end. '''
+    pos = start
+    while pos < end:
+        newline = mapped.find(b'\n', pos, end)
+        line_end = end if newline == -1 else newline + 1
+        yield mapped[pos:line_end]
+        pos = line_end
+
+def map_file_range(func, encoding, path, start, end):
+    ''' Runs in worker processes, calls func on each line of the byte range
+    of the file (memory-mapped, so only lines of this range are read).
+    Returns a tuple containing the list of results and the exception
+    raised by func (None if it didn't fail), results of lines before the
+    failed one are still returned. '''
+    results = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for line in iter_lines(mapped, start, end):
+            if encoding is not None:
+                line = line.decode(encoding)
+            try:
+                results.append(func(line))
+            except Exception as e:
+                return results, e
+    return results, None
+
+def fast_map_file(f, paths, encoding=None, range_size=None, **kwargs):
+    ''' Works like map(f, lines) for lines of a large file (or of multiple
+    files, one after another), yielding results in the order of lines.
+    The parent doesn't read the files, it splits them into line-aligned
+    byte ranges, each worker process memory-maps the files and iterates
+    lines of its ranges, so only results cross process boundaries.
+
+    - paths = path of the file or a list of paths
+    - encoding = lines are decoded with it (e.g. 'utf-8'), by default "f"
+    receives bytes, lines include the newline like when iterating a file
+    - range_size = the number of bytes in a range processed by a single
+    task (results of the whole range are sent back together), by default
+    it's adjusted to the total size of files and the number of processes
+
+    Other arguments work like in fast_map (see fast_map), "chunksize",
+    "max_in_flight" and "threads_limit" count ranges instead of lines,
+    ordered=False and batched=True aren't supported. If "f" raises an
+    exception, it's re-raised after yielding results of preceding lines.
+
+        Usage:
+
+        for record in fast_map_file(json.loads, 'events.jsonl', procs_limit=8):
+            print(record)
+    '''
+    assert callable(f), 'supplied function is not callable'
+    assert kwargs.get('ordered', True), "ordered=False isn't supported by fast_map_file"
+    assert not kwargs.get('batched', False), "batched=True isn't supported by fast_map_file"
+    if isinstance(paths, (str, bytes, os.PathLike)):
+        paths = [paths]
+    if range_size is None:
+        total_size = sum(os.path.getsize(path) for path in paths)
+        procs_count = min(mp.cpu_count(), kwargs.get('procs_limit') or mp.cpu_count())
+        range_size = total_size // (procs_count * RANGES_PER_PROCESS)
+        range_size = max(MIN_RANGE_SIZE, min(range_size, MAX_RANGE_SIZE))
+    assert range_size > 0, "range_size must be > 0"
+    ranges = [r for path in paths for r in split_file(path, range_size)]
+    # ranges are large already, each one is a separate chunk
+    kwargs.setdefault('chunksize', 1)
+    # (paths, starts, ends) arguments of map_file_range
+    columns = list(zip(*ranges)) or [(), (), ()]
+    for results, error in fast_map(partial(map_file_range, f, encoding), *columns, **kwargs):
+        yield from results
+        if error is not None:
+            raise error
@@ -0,0 +1,168 @@
+from threading import Lock
+import queue
+
+from .fast_map import (process_chunk, calculate_procs_and_threads_per_process, order_results,
+                       unordered_results, check_workers, MapRun, CANCELLED, WORKERS_CHECK_INTERVAL)
+
+# The number of chunks waiting between two stages (per process of the
+# next stage), a faster stage blocks once it's this far ahead.
+STAGE_QUEUE_CHUNKS_PER_PROCESS = 4
+
+class Stage:
+    ''' A stage of fast_pipeline with its own budget of processes and
+    threads (see fast_map for "procs_limit" and "threads_limit"). Functions
+    supplied to fast_pipeline directly use the default budget. '''
+    def __init__(self, f, procs_limit=None, threads_limit=None):
+        assert callable(f), 'supplied stage function is not callable'
+        if procs_limit is not None:
+            assert procs_limit > 0, "procs_limit must be > 0"
+        if threads_limit is not None:
+            assert threads_limit > 0, "threads_limit must be > 0"
+        self.f = f
+        self.procs_limit = procs_limit
+        self.threads_limit = threads_limit
+
+class StageOutput:
+    ''' Stands in for the result_queue of worker processes of a stage which
+    isn't the last one. Results of each chunk are put into the task queue
+    of the next stage (keeping their indices, each result becomes the only
+    argument of a task), failed tasks skip remaining stages and go to the
+    result_queue of the parent together with the "done" sentinel. '''
+    def __init__(self, next_task_queue, result_queue):
+        self.next_task_queue = next_task_queue
+        self.result_queue = result_queue
+        # chunks complete in different threads
+        self.lock = Lock()
+
+    def put(self, msg):
+        start, results, errors, duration, proc_id, task_durations = msg
+        if start is None:
+            with self.lock:
+                # the parent sends sentinels to the next stage once it
+                # receives this one, forwarded chunks must get there first
+                self.next_task_queue.close()
+                self.next_task_queue.join_thread()
+            self.result_queue.put(msg)
+            return
+        with self.lock:
+            run_start = 0
+            for offset in range(len(results) + 1):
+                if offset < len(results) and offset not in errors:
+                    continue
+                if run_start < offset:
+                    self.next_task_queue.put(
+                        (start + run_start, [(res,) for res in results[run_start:offset]]))
+                if offset < len(results):
+                    self.result_queue.put(
+                        (start + offset, [None], {0: errors[offset]}, 0.0, proc_id, None))
+                run_start = offset + 1
+
+def stage_chunk(proc_id, func, next_task_queue, threads_count, task_queue, result_queue, *args):
+    ''' Target function of processes of fast_pipeline stages (except the
+    last one, which uses process_chunk), it works like process_chunk
+    (accepting the same arguments after "result_queue") but forwards
+    results to the next stage (see StageOutput). '''
+    process_chunk(proc_id, func, threads_count, task_queue,
+                  StageOutput(next_task_queue, result_queue), *args)
+
+def collect_pipeline_results(stages_procs, task_queues, result_queue):
+    ''' Yields (start_index, results, errors, duration) chunks of the last
+    stage (and failed tasks of other stages) from the result_queue until
+    all processes of the last stage put their "done" sentinels. Once all
+    processes of a stage are done, processes of the next stage receive
+    their sentinels. '''
+    procs = [p for procs in stages_procs for p in procs]
+    stage_of = [i for i, procs in enumerate(stages_procs) for _ in procs]
+    remaining = [len(procs) for procs in stages_procs]
+    done_procs = set()
+    while remaining[-1]:
+        try:
+            (start, results, errors, duration,
+             proc_id, _) = result_queue.get(timeout=WORKERS_CHECK_INTERVAL)
+        except queue.Empty:
+            check_workers(procs, done_procs)
+            continue
+        if start is None:
+            if proc_id == CANCELLED:
+                return
+            done_procs.add(proc_id)
+            stage = stage_of[proc_id]
+            remaining[stage] -= 1
+            if not remaining[stage] and stage + 1 < len(stages_procs):
+                for _ in stages_procs[stage + 1]:
+                    task_queues[stage + 1].put((None, None))
+            continue
+        yield start, results, errors, duration
+
+def fast_pipeline(*stages, f_args, tasks_count_estimate=None, chunksize=None,
+                  max_in_flight=None, ordered=True, cancel_token=None, mp_context=None,
+                  preload=None):
+    ''' Runs a chain of functions like fast_map(stage2, fast_map(stage1, ...)),
+    but results of each stage go straight from its worker processes to
+    processes of the next stage (through a bounded queue), the parent only
+    enqueues arguments of the first stage and receives results of the last
+    one. Each stage is a function or a Stage object giving its own number
+    of processes and threads (e.g. many threads for downloading and
+    a process per core for parsing).
+    f_args = a collection of arguments for the first stage (like *f_args
+    of fast_map), each next stage receives a single argument (the result
+    of the previous stage).
+
+    Results are yielded in the order of arguments (see fast_map for
+    "ordered", "chunksize", "max_in_flight" and "cancel_token"). The
+    window of "max_in_flight" tasks spans all stages, and a stage is slowed
+    down when the next one falls behind, so the memory usage stays flat.
+    If any stage raises an exception, it's re-raised when the result would
+    be yielded (the task skips remaining stages).
+
+        Usage:
+
+        for record in fast_pipeline(Stage(fetch, threads_limit=64), parse, f_args=[urls]):
+            print(record)
+    '''
+    assert stages, 'no stages supplied'
+    stages = [s if isinstance(s, Stage) else Stage(s) for s in stages]
+    # sizes the first stage, chunks and the window of tasks in flight
+    run = MapRun(stages[0].f, f_args, threads_limit=stages[0].threads_limit,
+                 procs_limit=stages[0].procs_limit, tasks_count_estimate=tasks_count_estimate,
+                 chunksize=chunksize, max_in_flight=max_in_flight, cancel_token=cancel_token,
+                 mp_context=mp_context, preload=preload)
+    budgets = [(run.procs_count, run.threads_pp)]
+    for stage in stages[1:]:
+        # the warning about generators was logged for the first stage
+        budgets.append(calculate_procs_and_threads_per_process(
+            stage.threads_limit, stage.procs_limit, run.tasks_count, adaptive=True))
+    task_queues = [run.task_queue]
+    for procs_count, _ in budgets[1:]:
+        task_queues.append(run.ctx.Queue(procs_count * STAGE_QUEUE_CHUNKS_PER_PROCESS))
+    run.queues.extend(task_queues[1:])
+
+    stages_procs = []
+    for i, (stage, (procs_count, threads_pp)) in enumerate(zip(stages, budgets)):
+        next_queues = [task_queues[i + 1]] if i + 1 < len(stages) else []
+        target = stage_chunk if next_queues else process_chunk
+        if i == 0:
+            run.start_workers(target, next_queues)
+            stages_procs.append(list(run.procs))
+            continue
+        stage_procs = []
+        for _ in range(procs_count):
+            p = run.ctx.Process(target=target, args=[
+                len(run.procs), stage.f, *next_queues, threads_pp, task_queues[i],
+                run.result_queue])
+            run.procs.append(p)
+            stage_procs.append(p)
+            p.start()
+        stages_procs.append(stage_procs)
+    run.start_enqueuer()
+
+    chunks = collect_pipeline_results(stages_procs, task_queues, run.result_queue)
+    results = order_results if ordered else unordered_results
+    completed = False
+    try:
+        yield from results(chunks, run.chunk_sizer, run.window)
+        completed = not run.stopped.is_set()
+        if completed:
+            run.check_enqueued()
+    finally:
+        run.finish(completed)
@@ -0,0 +1,77 @@
+from functools import partial
+import asyncio
+import time
+
+# How often (in seconds) coroutines check whether the concurrency limit
+# allows them to start (the semaphore can't be awaited).
+SEMAPHORE_POLL_INTERVAL = 0.001
+
+class RateLimiter:
+    ''' Limits calls of the task function across all worker processes and
+    their threads. It's created by the parent and passed to processes when
+    they start (its shared state can't be sent through queues).
+    - max_calls_per_second = calls start at most at this rate, spaced evenly
+    (a token bucket holding "burst" tokens, the time of the next allowed
+    call is shared by all processes)
+    - max_concurrency = the maximum number of calls running at once
+    '''
+    def __init__(self, ctx, max_calls_per_second=None, max_concurrency=None, burst=1):
+        if max_calls_per_second is not None:
+            assert max_calls_per_second > 0, "max_calls_per_second must be > 0"
+        if max_concurrency is not None:
+            assert max_concurrency > 0, "max_concurrency must be > 0"
+        assert burst >= 1, "burst must be >= 1"
+        self.interval = None
+        self.next_call = None
+        if max_calls_per_second is not None:
+            self.interval = 1 / max_calls_per_second
+            # tolerance allowing "burst" calls at once
+            self.tolerance = (burst - 1) * self.interval
+            # "theoretical arrival time" of the next call (time.monotonic()
+            # is system-wide, so it's comparable between processes)
+            self.next_call = ctx.Value('d', 0.0)
+        self.semaphore = None
+        if max_concurrency is not None:
+            self.semaphore = ctx.BoundedSemaphore(max_concurrency)
+
+    def reserve(self):
+        ''' Reserves the earliest allowed time of a call, returns the number
+        of seconds to wait for it. '''
+        if self.next_call is None:
+            return 0.0
+        with self.next_call.get_lock():
+            now = time.monotonic()
+            next_call = max(self.next_call.value, now)
+            self.next_call.value = next_call + self.interval
+        return max(0.0, next_call - self.tolerance - now)
+
+    def wrap(self, func):
+        ''' Returns the function to be called by workers instead of "func". '''
+        if asyncio.iscoroutinefunction(func):
+            return partial(call_coroutine_rate_limited, self, func)
+        return partial(call_rate_limited, self, func)
+
+def call_rate_limited(limiter, func, *args):
+    if limiter.semaphore is not None:
+        limiter.semaphore.acquire()
+    try:
+        delay = limiter.reserve()
+        if delay:
+            time.sleep(delay)
+        return func(*args)
+    finally:
+        if limiter.semaphore is not None:
+            limiter.semaphore.release()
+
+async def call_coroutine_rate_limited(limiter, func, *args):
+    if limiter.semaphore is not None:
+        while not limiter.semaphore.acquire(block=False):
+            await asyncio.sleep(SEMAPHORE_POLL_INTERVAL)
+    try:
+        delay = limiter.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return await func(*args)
+    finally:
+        if limiter.semaphore is not None:
+            limiter.semaphore.release()
@@ -0,0 +1,154 @@
+from concurrent.futures import CancelledError
+from threading import Lock
+from itertools import chain
+import queue
+
+from .fast_map import (process_chunk, unordered_results, check_workers, MapRun, CANCELLED,
+                       WORKERS_CHECK_INTERVAL)
+
+_NO_INITIAL = object()
+
+class PartialResult:
+    ''' Stands in for the result_queue of process_chunk in fast_map_reduce
+    worker processes. Results of each completed chunk are folded (with the
+    reducer) into a single partial result of the process, only the number
+    of completed tasks, errors and durations of the chunk are put to the
+    real result_queue. The partial result travels with the "done" sentinel,
+    as (None, (has_value, partial), None, None, proc_id, None). '''
+    def __init__(self, reducer, result_queue):
+        self.reducer = reducer
+        self.result_queue = result_queue
+        self.has_value = False
+        self.value = None
+        # chunks complete in different threads
+        self.lock = Lock()
+
+    def put(self, msg):
+        start, results, errors, duration, proc_id, task_durations = msg
+        if start is None:
+            self.result_queue.put((None, (self.has_value, self.value), None, None, proc_id, None))
+            return
+        with self.lock:
+            for offset, res in enumerate(results):
+                if offset in errors:
+                    continue
+                try:
+                    self.value = self.reducer(self.value, res) if self.has_value else res
+                except Exception as e:
+                    errors = {**errors, offset: e}
+                    break
+                self.has_value = True
+        self.result_queue.put((start, len(results), errors, duration, proc_id, task_durations))
+
+def reduce_chunk(proc_id, func, reducer, threads_count, task_queue, result_queue, *args):
+    ''' Target function of fast_map_reduce processes, it works like
+    process_chunk (accepting the same arguments after "result_queue"),
+    but it folds results locally (see PartialResult). '''
+    process_chunk(proc_id, func, threads_count, task_queue,
+                  PartialResult(reducer, result_queue), *args)
+
+def collect_partials(procs, result_queue, chunk_sizer=None, window=None, stats=None,
+                     transport=None):
+    ''' Yields partial results of processes (processes which completed no
+    tasks have none) until every process put its "done" sentinel. Exceptions
+    of failed tasks are re-raised as soon as they arrive. Completed tasks
+    are released from the window and reported to chunk_sizer and stats,
+    their arguments are removed from shared memory (see SharedMemoryTransport).
+    Raises CancelledError if the CANCELLED sentinel arrives. '''
+    done_procs = set()
+    while len(done_procs) < len(procs):
+        try:
+            (start, count, errors, duration,
+             proc_id, task_durations) = result_queue.get(timeout=WORKERS_CHECK_INTERVAL)
+        except queue.Empty:
+            check_workers(procs, done_procs)
+            continue
+        if start is None:
+            if proc_id == CANCELLED:
+                raise CancelledError('fast_map_reduce was cancelled')
+            done_procs.add(proc_id)
+            has_value, value = count
+            if has_value:
+                yield value
+            continue
+        if transport is not None:
+            transport.release(start)
+        if stats is not None:
+            stats.on_chunk_completed(proc_id, count, len(errors), duration, task_durations)
+        if errors:
+            raise errors[min(errors)]
+        if chunk_sizer is not None:
+            chunk_sizer.observe(count, duration)
+        if window is not None:
+            window.release(count)
+        if stats is not None:
+            stats.on_yielded(count)
+
+def fast_map_reduce(f, reducer, *f_args, initial=_NO_INITIAL, **kwargs):
+    ''' Parallel equivalent of functools.reduce(reducer, map(f, *f_args), initial),
+    for jobs that need only an aggregate of results (sum, histogram, top-k,
+    merged dict). Each worker process folds results of its own tasks with
+    "reducer", only these per-process partial results are sent back to the
+    parent (instead of every single result) and combined with "reducer" too.
+
+    Results are folded in the order of completion, so "reducer" must be
+    associative and commutative (e.g. operator.add, max, Counter.__add__),
+    and it must accept partial results as arguments (it combines two
+    results or partial results of the same type). "initial" is used once,
+    by the parent, it's returned for empty inputs (which raise TypeError
+    without it). Other keyword arguments work like in fast_map (except
+    "ordered"), see fast_map. With "cache", results are sent to the parent
+    (to be cached) and folded there.
+
+    If "f" or "reducer" raises an exception, it is re-raised (and worker
+    processes are stopped). If the map is cancelled (see CancelToken),
+    concurrent.futures.CancelledError is raised.
+
+        Usage:
+
+        def word_counts(path):
+            with open(path) as f:
+                return Counter(f.read().split())
+
+        total = fast_map_reduce(word_counts, operator.add, paths, initial=Counter())
+    '''
+    assert callable(reducer), 'supplied reducer is not callable'
+    assert 'ordered' not in kwargs, "ordered isn't supported by fast_map_reduce"
+    folded_in_workers = kwargs.get('cache') is None
+    run = MapRun(f, f_args, results_to_parent=not folded_in_workers, **kwargs)
+    if folded_in_workers:
+        worker_reducer = reducer
+        if run.serializer is not None:
+            # results are folded by workers, only tasks are encoded
+            worker_reducer = run.serializer.wrap_function(reducer, run.ctx)
+        run.start_workers(reduce_chunk, [worker_reducer])
+        # results of the tasks run to choose the backend are folded by the parent
+        probed = PartialResult(reducer, run.result_queue)
+        run.put_probed(probed)
+    else:
+        run.start_workers()
+        run.put_probed()
+    run.start_enqueuer()
+
+    acc = initial
+    completed = False
+    try:
+        if folded_in_workers:
+            values = collect_partials(run.procs, run.result_queue, run.chunk_sizer,
+                                      run.window, run.stats, run.transport)
+            if probed.has_value:
+                values = chain([probed.value], values)
+        else:
+            values = (res for _, res in unordered_results(
+                run.collect(), run.chunk_sizer, run.window, run.stats))
+        for value in values:
+            acc = value if acc is _NO_INITIAL else reducer(acc, value)
+        if run.stopped.is_set():
+            raise CancelledError('fast_map_reduce was cancelled')
+        run.check_enqueued()
+        completed = True
+    finally:
+        run.finish(completed)
+    if acc is _NO_INITIAL:
+        raise TypeError('fast_map_reduce() of empty input with no initial value')
+    return acc
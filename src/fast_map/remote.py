@@ -0,0 +1,464 @@
+''' Multi-node execution: a Coordinator (in the process calling imap/map)
+distributes chunks of tasks to worker nodes connected over TCP, each node
+runs tasks in its own processes and threads (like fast_map does).
+
+Start a coordinator:
+
+    coordinator = Coordinator(('0.0.0.0', 6000), authkey=b'secret')
+    for res in coordinator.imap(task, range(1000)):
+        print(res)
+
+Then start nodes on other machines (the task function must be importable
+there, e.g. by running the worker in the same project directory):
+
+    fast_map-worker 192.168.0.10:6000 --authkey secret
+
+Functions, arguments and results are pickled, so anyone who knows the
+authkey may run arbitrary code on nodes (and on the coordinator). There is
+no default authkey, and the coordinator listens only on localhost unless
+another address is supplied. Use it in trusted networks only.
+'''
+from multiprocessing.connection import Listener, Client, deliver_challenge, answer_challenge
+import multiprocessing as mp
+from threading import Thread, Lock, Condition, Event
+import argparse
+import socket
+import signal
+import heapq
+import queue
+import time
+import sys
+import os
+
+from .fast_map import (process_chunk, cleanup_subprocesses, ChunkSizer, iter_chunks,
+                       order_results, unordered_results, WORKERS_CHECK_INTERVAL)
+from .fast_map_pool import FastMapPool
+from .context import get_context
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 6000
+# How long (in seconds) a connecting node may take to authenticate and
+# send its "hello" message.
+HANDSHAKE_TIMEOUT = 10.0
+
+class _HandshakeConnection:
+    ''' Wraps the connection of a node during the handshake, reads fail
+    with TimeoutError once HANDSHAKE_TIMEOUT passed (so a client that
+    doesn't answer doesn't keep its thread forever). '''
+    def __init__(self, conn):
+        self.conn = conn
+        self.deadline = time.monotonic() + HANDSHAKE_TIMEOUT
+
+    def _wait(self):
+        if not self.conn.poll(max(0.0, self.deadline - time.monotonic())):
+            raise TimeoutError('node handshake timed out')
+
+    def send_bytes(self, *args):
+        self.conn.send_bytes(*args)
+
+    def recv_bytes(self, *args):
+        self._wait()
+        return self.conn.recv_bytes(*args)
+
+    def recv(self):
+        self._wait()
+        return self.conn.recv()
+
+class _Node:
+    ''' Coordinator-side state of a connected worker node. '''
+    def __init__(self, node_id, conn, capacity, host):
+        self.node_id = node_id
+        self.conn = conn
+        self.capacity = capacity # the number of tasks it runs concurrently
+        self.host = host
+        self.alive = True
+        self.in_flight = 0
+        self.tasks_completed = 0
+        self.outstanding = {} # key=(job_id, start index) val=tasks
+        self.send_lock = Lock()
+
+    def send(self, msg):
+        with self.send_lock:
+            self.conn.send(msg)
+
+    def free_capacity(self):
+        return self.capacity - self.in_flight
+
+class _RemoteJob:
+    def __init__(self, job_id, func, chunk_sizer):
+        self.job_id = job_id
+        self.func = func
+        self.chunk_sizer = chunk_sizer
+        self.stopped = False
+        self.input_done = False
+        # set if iterating the input failed, raised after the results
+        self.error = None
+        self.enqueued = 0
+        # chunks of dropped nodes, lowest indices are dispatched first
+        self.requeued = [] # heap of (start index, tasks)
+        # (start_index, results, errors, duration) chunks followed by
+        # (None, total) once all tasks were dispatched
+        self.results = queue.Queue()
+
+class Coordinator:
+    ''' Accepts connections of worker nodes (see "run_worker") and runs map
+    calls on them. Chunks of tasks are dispatched to nodes having free
+    capacity (announced by each node, the number of its processes times
+    threads), so faster nodes get more work. Tasks of a node that
+    disconnects are dispatched to other nodes. Results are yielded in
+    order, like with fast_map (or as (index, result) with ordered=False).
+
+    - address = (host, port) to listen on, port 0 picks a free port (see
+      the "address" attribute), by default only local nodes can connect
+      (use ('0.0.0.0', port) to accept nodes of other machines)
+    - authkey = bytes shared with nodes (required, anyone who knows it can
+      run code on nodes and on the coordinator)
+
+    A single map call runs at a time.
+    '''
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT), *, authkey):
+        assert isinstance(authkey, bytes) and authkey, 'authkey must be non-empty bytes'
+        self._authkey = authkey
+        # nodes are authenticated in their own threads (see "_handshake"),
+        # so a slow or malicious client doesn't block accepting others
+        self._listener = Listener(address)
+        self.address = self._listener.address
+        self._condition = Condition()
+        self._nodes = {} # key=node_id val=_Node
+        self._nodes_count = 0
+        self._job = None
+        self._jobs_count = 0
+        self._closed = False
+        self._acceptor = Thread(target=self._accept, daemon=True)
+        self._acceptor.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                continue
+            if self._closed:
+                conn.close()
+                return
+            Thread(target=self._handshake, daemon=True, args=[conn]).start()
+
+    def _handshake(self, conn):
+        ''' Authenticates a connected node and registers it, the connection
+        is closed if it fails (e.g. wrong authkey, unexpected message or
+        timeout). '''
+        try:
+            handshake_conn = _HandshakeConnection(conn)
+            deliver_challenge(handshake_conn, self._authkey)
+            answer_challenge(handshake_conn, self._authkey)
+            kind, capacity, host = handshake_conn.recv()
+            if kind != 'hello' or not isinstance(capacity, int) or capacity <= 0:
+                raise ValueError(f'unexpected handshake message from a node: {kind!r}')
+        except Exception:
+            # the node isn't trusted yet, any failure just drops it
+            conn.close()
+            return
+        with self._condition:
+            if self._closed:
+                conn.close()
+                return
+            node = _Node(self._nodes_count, conn, capacity, host)
+            self._nodes_count += 1
+            try:
+                # the job message is always sent before its chunks
+                if self._job is not None:
+                    node.send(('job', self._job.job_id, self._job.func))
+            except OSError:
+                conn.close()
+                return
+            self._nodes[node.node_id] = node
+            self._condition.notify_all()
+        self._receive(node)
+
+    def _receive(self, node):
+        ''' Routes results sent by the node, runs in a separate thread for
+        each node until it disconnects. '''
+        while True:
+            try:
+                _, job_id, start, results, errors, duration = node.conn.recv()
+            except (OSError, EOFError):
+                break
+            with self._condition:
+                tasks = node.outstanding.pop((job_id, start), None)
+                if tasks is None:
+                    continue
+                node.in_flight -= len(tasks)
+                node.tasks_completed += len(tasks)
+                job = self._job if self._job and self._job.job_id == job_id else None
+                self._condition.notify_all()
+            if job is not None:
+                job.results.put((start, results, errors, duration))
+        self._drop(node)
+
+    def _drop(self, node):
+        with self._condition:
+            node.alive = False
+            self._nodes.pop(node.node_id, None)
+            for (job_id, start), tasks in node.outstanding.items():
+                if self._job is not None and self._job.job_id == job_id:
+                    heapq.heappush(self._job.requeued, (start, tasks))
+            node.outstanding.clear()
+            node.in_flight = 0
+            self._condition.notify_all()
+        node.conn.close()
+
+    def _free_node(self):
+        ''' Returns the node with the largest fraction of free capacity. '''
+        nodes = [node for node in self._nodes.values() if node.free_capacity() > 0]
+        if not nodes:
+            return None
+        return max(nodes, key=lambda node: node.free_capacity() / node.capacity)
+
+    def _dispatch(self, job, chunks):
+        ''' Sends chunks of the job to nodes having free capacity, runs in
+        a separate thread until the job ends. '''
+        while True:
+            with self._condition:
+                while not job.stopped:
+                    node = self._free_node()
+                    if node is not None and (job.requeued or not job.input_done):
+                        break
+                    self._condition.wait()
+                if job.stopped:
+                    return
+                chunk = heapq.heappop(job.requeued) if job.requeued else None
+            if chunk is None:
+                try:
+                    chunk = next(chunks, None)
+                except Exception as e:
+                    job.error = e
+                    chunk = None
+                if chunk is None:
+                    with self._condition:
+                        job.input_done = True
+                    job.results.put((None, job.enqueued))
+                    continue
+                job.enqueued += len(chunk[1])
+            self._send_chunk(node, job, chunk)
+
+    def _send_chunk(self, node, job, chunk):
+        start, tasks = chunk
+        with self._condition:
+            if not node.alive:
+                heapq.heappush(job.requeued, chunk)
+                return
+            node.in_flight += len(tasks)
+            node.outstanding[(job.job_id, start)] = tasks
+        try:
+            node.send(('chunk', job.job_id, start, tasks))
+        except OSError:
+            # the receiving thread re-dispatches outstanding chunks
+            node.conn.close()
+
+    def wait_for_nodes(self, count, timeout=None):
+        ''' Blocks until at least "count" nodes are connected, returns
+        whether they are. '''
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._nodes) >= count, timeout)
+
+    def nodes(self):
+        ''' Returns a list of dicts describing connected nodes. '''
+        with self._condition:
+            return [{'host': node.host, 'capacity': node.capacity, 'in_flight': node.in_flight,
+                     'tasks_completed': node.tasks_completed}
+                    for node in self._nodes.values()]
+
+    def _send_all(self, msg):
+        for node in list(self._nodes.values()):
+            try:
+                node.send(msg)
+            except OSError:
+                pass
+
+    def imap(self, f, *f_args, chunksize=None, ordered=True):
+        ''' Works like fast_map but runs tasks on connected nodes (it waits
+        for at least one node to connect). '''
+        if chunksize is not None:
+            assert chunksize > 0, "chunksize must be > 0"
+        try:
+            tasks_count = len(f_args[0])
+        except TypeError:
+            tasks_count = None
+        with self._condition:
+            assert not self._closed, "Coordinator is closed"
+            assert self._job is None, "Coordinator runs a single map call at a time"
+            capacity = sum(node.capacity for node in self._nodes.values())
+            job = _RemoteJob(self._jobs_count, f,
+                             ChunkSizer(chunksize, tasks_count, max(1, capacity)))
+            self._jobs_count += 1
+            self._job = job
+            self._send_all(('job', job.job_id, f))
+        Thread(target=self._dispatch, daemon=True, args=[
+            job, iter_chunks(f_args, job.chunk_sizer)]).start()
+        return self._iter_results(job, ordered)
+
+    def _iter_chunks(self, job):
+        total = None
+        received = 0
+        while total is None or received < total:
+            start, *chunk = job.results.get()
+            if start is None:
+                total = chunk[0]
+                continue
+            received += len(chunk[0])
+            yield (start, *chunk)
+        if job.error is not None:
+            raise job.error
+
+    def _iter_results(self, job, ordered):
+        results = order_results if ordered else unordered_results
+        try:
+            yield from results(self._iter_chunks(job), job.chunk_sizer)
+        finally:
+            with self._condition:
+                job.stopped = True
+                self._job = None
+                for node in self._nodes.values():
+                    node.outstanding.clear()
+                    node.in_flight = 0
+                self._send_all(('job_end', job.job_id))
+                self._condition.notify_all()
+
+    def map(self, f, *f_args, **kwargs):
+        return list(self.imap(f, *f_args, **kwargs))
+
+    def close(self):
+        ''' Asks nodes to exit and stops listening. '''
+        with self._condition:
+            self._closed = True
+            self._send_all(('stop',))
+        # wakes up the thread waiting for connections
+        host, port = self.address
+        try:
+            socket.create_connection(('127.0.0.1' if host == '0.0.0.0' else host, port)).close()
+        except OSError:
+            pass
+        self._acceptor.join()
+        self._listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class _NodeJob:
+    ''' Worker node side state of a map call, runs its tasks in local
+    processes (see "process_chunk"). '''
+    def __init__(self, job_id, func, procs_count, threads_pp, send, failed, ctx):
+        self.job_id = job_id
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.stopped = Event()
+        self.procs = []
+        for i in range(procs_count):
+            p = ctx.Process(target=process_chunk, daemon=True, args=[
+                i, func, threads_pp, self.task_queue, self.result_queue])
+            self.procs.append(p)
+            p.start()
+        Thread(target=self._relay, daemon=True, args=[send, failed]).start()
+
+    def _relay(self, send, failed):
+        ''' Sends results of local processes to the coordinator. '''
+        while not self.stopped.is_set():
+            try:
+                start, results, errors, duration, _, _ = self.result_queue.get(
+                    timeout=WORKERS_CHECK_INTERVAL)
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in self.procs) and not self.stopped.is_set():
+                    # the coordinator dispatches tasks of this node to others
+                    failed.set()
+                    return
+                continue
+            if start is not None:
+                send(('result', self.job_id, start, results, errors, duration))
+
+    def end(self):
+        self.stopped.set()
+        cleanup_subprocesses(self.procs)
+        for p in self.procs:
+            p.join()
+        for q in (self.task_queue, self.result_queue):
+            q.cancel_join_thread()
+
+def run_worker(address, authkey, procs_limit=None, threads_limit=None,
+               mp_context=None, preload=None):
+    ''' Connects to the Coordinator at (host, port) address (authenticating
+    with the authkey bytes shared with it) and runs tasks
+    it sends until it disconnects (or until a local process crashes). By
+    default it runs a process for each CPU core with 4 threads each.
+    Processes are started for each map call, mp_context='forkserver' with
+    preloaded modules makes it faster (see fast_map). '''
+    assert isinstance(authkey, bytes) and authkey, 'authkey must be non-empty bytes'
+    ctx = get_context(mp_context, preload)
+    procs_count, threads_pp = FastMapPool._calculate_size(procs_limit, threads_limit)
+    conn = Client(tuple(address), authkey=authkey)
+    send_lock = Lock()
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+    conn.send(('hello', procs_count * threads_pp, socket.gethostname()))
+    jobs = {} # key=job_id val=_NodeJob
+    failed = Event()
+    try:
+        while not failed.is_set():
+            if not conn.poll(WORKERS_CHECK_INTERVAL):
+                continue
+            msg = conn.recv()
+            kind = msg[0]
+            if kind == 'chunk':
+                _, job_id, start, tasks = msg
+                if job_id in jobs:
+                    jobs[job_id].task_queue.put((start, tasks))
+            elif kind == 'job':
+                jobs[msg[1]] = _NodeJob(msg[1], msg[2], procs_count, threads_pp, send, failed, ctx)
+            elif kind == 'job_end':
+                job = jobs.pop(msg[1], None)
+                if job is not None:
+                    job.end()
+            elif kind == 'stop':
+                break
+    except (EOFError, OSError):
+        # the coordinator exited
+        pass
+    finally:
+        for job in jobs.values():
+            job.end()
+        conn.close()
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port or DEFAULT_PORT)
+
+def main():
+    ''' Entry point of the "fast_map-worker" command. '''
+    parser = argparse.ArgumentParser(description='fast_map worker node, runs tasks '
+                                     'sent by a fast_map Coordinator')
+    parser.add_argument('address', help='host:port of the coordinator')
+    parser.add_argument('--authkey', default=os.environ.get('FAST_MAP_AUTHKEY'),
+                        help='shared secret, required (default: FAST_MAP_AUTHKEY environment variable)')
+    parser.add_argument('--procs', type=int, help='number of processes (default: CPU cores)')
+    parser.add_argument('--threads', type=int, help='total number of threads '
+                        '(default: 4 per process)')
+    parser.add_argument('--start-method', choices=mp.get_all_start_methods(),
+                        help='start method of processes (default: multiprocessing default)')
+    parser.add_argument('--preload', default='', help='comma separated modules imported '
+                        'once by the forkserver (with --start-method forkserver)')
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error('--authkey (or the FAST_MAP_AUTHKEY environment variable) is required')
+    authkey = args.authkey.encode()
+    # let atexit handlers stop local processes
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    run_worker(parse_address(args.address), authkey, args.procs, args.threads,
+               args.start_method, [m for m in args.preload.split(',') if m])
+
+if __name__ == '__main__':
+    main()
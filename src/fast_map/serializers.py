@@ -0,0 +1,140 @@
+import marshal
+import pickle
+
+def pickle_dumps(obj):
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+# marshal doesn't support instances of classes (it raises ValueError), such
+# chunks are pickled instead, the first byte tells which one was used
+MARSHAL_PREFIX = b'm'
+PICKLE_PREFIX = b'p'
+
+def marshal_dumps(obj):
+    try:
+        return MARSHAL_PREFIX + marshal.dumps(obj)
+    except ValueError:
+        return PICKLE_PREFIX + pickle_dumps(obj)
+
+def marshal_loads(data):
+    if data[:1] == MARSHAL_PREFIX:
+        return marshal.loads(data[1:])
+    return pickle.loads(data[1:])
+
+# key=name val=(dumps, loads) functions encoding chunks of tasks and results
+CODECS = {
+    # highest protocol (5 on Python 3.8+), pickles large bytes more efficiently
+    'pickle5': (pickle_dumps, pickle.loads),
+    # faster than pickle for primitive data (numbers, strings, bytes,
+    # and tuples, lists, dicts or sets of them)
+    'marshal': (marshal_dumps, marshal_loads),
+}
+
+# key=name val=(function serializer, data codec)
+SERIALIZERS = {
+    'pickle': ('pickle', None),
+    'cloudpickle': ('cloudpickle', None),
+    'pickle5': ('pickle', 'pickle5'),
+    'marshal': ('pickle', 'marshal'),
+}
+
+def decode(codec, data):
+    return CODECS[codec][1](data)
+
+class EncodedChunk:
+    ''' List of tasks (or results) encoded with a codec once it's pickled
+    (in the feeder thread of a queue), the receiving process gets the
+    decoded list right away, so the code using queues is unchanged. '''
+    def __init__(self, codec, items):
+        self.codec = codec
+        self.items = items
+
+    def __reduce__(self):
+        return decode, (self.codec, CODECS[self.codec][0](self.items))
+
+class EncodingQueue:
+    ''' Stands in for the result_queue of worker processes, lists at
+    "index" of put messages are encoded (see EncodedChunk). '''
+    def __init__(self, queue, codec, index):
+        self.queue = queue
+        self.codec = codec
+        self.index = index
+
+    def put(self, msg):
+        if len(msg) > self.index and isinstance(msg[self.index], list):
+            msg = msg[:self.index] + (EncodedChunk(self.codec, msg[self.index]),) + msg[self.index + 1:]
+        self.queue.put(msg)
+
+def cloudpickle_loads(data):
+    import cloudpickle
+    return cloudpickle.loads(data)
+
+class SerializedFunction:
+    ''' Pickles the function with cloudpickle (supporting lambdas, closures
+    and functions defined in __main__ or locally), unpickling it gives the
+    original function. '''
+    def __init__(self, func):
+        self.func = func
+
+    def __reduce__(self):
+        import cloudpickle
+        return cloudpickle_loads, (cloudpickle.dumps(self.func),)
+
+class Serializer:
+    ''' Decides how the task function and chunks of tasks/results are
+    serialized for worker processes.
+    - function = 'pickle' (functions must be importable by workers) or
+    'cloudpickle' (lambdas and closures, requires the cloudpickle package)
+    - data = None (chunks are pickled by queues), 'pickle5' or 'marshal'
+    (see CODECS)
+
+    The task function is sent to each worker process once (not with
+    every chunk), so 'cloudpickle' doesn't slow down tasks. '''
+    def __init__(self, function='pickle', data=None):
+        assert function in ('pickle', 'cloudpickle'), f'unknown function serializer "{function}"'
+        assert data is None or data in CODECS, f'unknown data codec "{data}"'
+        if function == 'cloudpickle':
+            try:
+                import cloudpickle
+            except ImportError:
+                raise ImportError('serializer="cloudpickle" requires the cloudpickle package '
+                                  '(pip install cloudpickle)')
+        self.function = function
+        self.data = data
+
+    @classmethod
+    def get(cls, serializer):
+        ''' Returns the Serializer for a name from SERIALIZERS (or the
+        supplied Serializer). '''
+        if serializer is None or isinstance(serializer, Serializer):
+            return serializer
+        assert serializer in SERIALIZERS, (f'unknown serializer "{serializer}", '
+                                           f'use one of {list(SERIALIZERS)}')
+        return cls(*SERIALIZERS[serializer])
+
+    def wrap_function(self, func, ctx=None):
+        ''' Returns the object to be pickled instead of the function. With
+        the 'fork' start method of "ctx" the function isn't pickled (worker
+        processes inherit it), so it's returned as it is. '''
+        if ctx is not None and ctx.get_start_method() == 'fork':
+            return func
+        if self.function == 'cloudpickle':
+            return SerializedFunction(func)
+        return func
+
+    def encode(self, items):
+        ''' Returns the object to be put into a queue instead of the list. '''
+        if self.data is None:
+            return items
+        return EncodedChunk(self.data, items)
+
+    def encode_chunks(self, chunks):
+        ''' Encodes tasks of (start_index, tasks) chunks. '''
+        for start, tasks in chunks:
+            yield start, self.encode(tasks)
+
+    def wrap_result_queue(self, result_queue, index=1):
+        ''' Returns the result queue used by workers, encoding lists of
+        results at "index" of messages. '''
+        if self.data is None:
+            return result_queue
+        return EncodingQueue(result_queue, self.data, index)
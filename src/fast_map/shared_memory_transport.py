@@ -0,0 +1,278 @@
+from threading import Lock, current_thread, main_thread
+from functools import partial
+import multiprocessing as mp
+import asyncio
+import signal
+import queue
+import os
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+def is_ndarray(obj):
+    cls = type(obj)
+    return cls.__module__ == 'numpy' and cls.__name__ == 'ndarray'
+
+class SharedBuffer:
+    ''' Picklable handle of a buffer-like object (bytes, bytearray,
+    memoryview or NumPy array) copied into a shared memory segment.
+    Only the handle travels through queues, instead of the data itself. '''
+    def __init__(self, name, size, kind, shape=None, dtype=None):
+        self.name = name
+        self.size = size
+        self.kind = kind
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        # pickled when it's put into a queue, the receiver removes the segment
+        unsent_segments.discard(self.name)
+        return self.__dict__
+
+    @classmethod
+    def create(cls, obj):
+        ''' Returns a tuple containing the handle and the created segment. '''
+        if is_ndarray(obj):
+            data = memoryview(obj.reshape(-1) if obj.flags.c_contiguous else obj.copy().reshape(-1)).cast('B')
+            handle = cls(None, data.nbytes, 'ndarray', obj.shape, obj.dtype.str)
+        else:
+            data = memoryview(obj)
+            if not data.c_contiguous:
+                # e.g. a strided slice, only contiguous views can be cast
+                data = memoryview(data.tobytes())
+            data = data.cast('B')
+            handle = cls(None, data.nbytes, type(obj).__name__)
+        segment = shared_memory.SharedMemory(create=True, size=max(1, handle.size))
+        segment.buf[:handle.size] = data
+        handle.name = segment.name
+        return handle, segment
+
+    def attach(self):
+        ''' Returns a tuple containing the object (sharing memory with the
+        segment if possible) and the attached segment. '''
+        segment = shared_memory.SharedMemory(name=self.name)
+        data = segment.buf[:self.size]
+        if self.kind == 'ndarray':
+            import numpy as np
+            obj = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=data)
+        elif self.kind == 'memoryview':
+            obj = data
+        elif self.kind == 'bytearray':
+            obj = bytearray(data)
+        else:
+            obj = bytes(data)
+        return obj, segment
+
+    def load(self):
+        ''' Returns a copy of the object (owned by the calling process) and
+        removes the segment. '''
+        obj, segment = self.attach()
+        if self.kind == 'ndarray':
+            obj = obj.copy()
+        elif self.kind == 'memoryview':
+            obj = memoryview(bytes(obj))
+        close_segment(segment)
+        segment.unlink()
+        return obj
+
+    def remove(self):
+        ''' Removes the segment without loading the object. '''
+        try:
+            segment = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+
+# Names of result segments created by this (worker) process whose handles
+# weren't pickled into the result queue yet, nobody else can remove them
+# if the process is terminated (see remove_segments_on_terminate).
+unsent_segments = set()
+
+def remove_segments_on_terminate():
+    ''' Makes terminating this worker process (e.g. when the map call was
+    interrupted) remove result segments which weren't sent to the parent.
+    Called by worker processes before taking tasks, it does nothing in
+    the parent or in other threads (e.g. with backend='threads'). '''
+    if shared_memory is None or mp.parent_process() is None or current_thread() is not main_thread():
+        return
+    def on_terminate(signum, frame):
+        for name in list(unsent_segments):
+            SharedBuffer(name, 0, None).remove()
+        # exits the same way as without the handler
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+    signal.signal(signal.SIGTERM, on_terminate)
+
+def is_shareable(obj, threshold):
+    if is_ndarray(obj):
+        return obj.nbytes >= threshold and not obj.dtype.hasobject
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return memoryview(obj).nbytes >= threshold
+    return False
+
+# Segments whose memory is still referenced (e.g. by a NumPy array kept
+# by the task function), closing them is retried later.
+lingering_segments = []
+
+def close_segment(segment):
+    try:
+        segment.close()
+    except BufferError:
+        lingering_segments.append(segment)
+
+def close_lingering_segments():
+    for segment in lingering_segments[:]:
+        try:
+            segment.close()
+            lingering_segments.remove(segment)
+        except BufferError:
+            pass
+
+def remove_shared_results(results):
+    ''' Removes segments of results which won't be loaded (e.g. results
+    of a map call which already ended). '''
+    if not isinstance(results, list):
+        # e.g. a count of folded results (see fast_map_reduce)
+        return
+    for res in results:
+        if isinstance(res, SharedBuffer):
+            res.remove()
+
+def attach_args(args):
+    ''' Replaces SharedBuffer handles with objects, returns a tuple
+    containing the arguments and the attached segments. '''
+    segments = []
+    resolved = []
+    for arg in args:
+        if isinstance(arg, SharedBuffer):
+            arg, segment = arg.attach()
+            segments.append(segment)
+        resolved.append(arg)
+    return resolved, segments
+
+def share_result(res, threshold):
+    if not is_shareable(res, threshold):
+        return res
+    handle, segment = SharedBuffer.create(res)
+    unsent_segments.add(handle.name)
+    # the parent removes the segment after loading the result
+    close_segment(segment)
+    return handle
+
+def call_with_shared_buffers(func, threshold, *args):
+    ''' Runs in worker processes (see SharedMemoryTransport.wrap), results
+    aren't shared if threshold is None. '''
+    args, segments = attach_args(args)
+    try:
+        res = func(*args)
+    finally:
+        del args
+        for segment in segments:
+            close_segment(segment)
+        close_lingering_segments()
+    return res if threshold is None else share_result(res, threshold)
+
+async def call_coroutine_with_shared_buffers(func, threshold, *args):
+    args, segments = attach_args(args)
+    try:
+        res = await func(*args)
+    finally:
+        del args
+        for segment in segments:
+            close_segment(segment)
+        close_lingering_segments()
+    return res if threshold is None else share_result(res, threshold)
+
+class SharedMemoryTransport:
+    ''' Moves buffer-like arguments and results (bytes, bytearray,
+    memoryview and NumPy arrays) having at least "threshold" bytes through
+    shared memory segments instead of pickling them into queues.
+
+    The parent creates a segment for each large argument and removes it
+    once the result of its chunk arrives (or when the map call ends).
+    Workers see NumPy array and memoryview arguments without copying
+    them. Large results are put into segments created by workers, the
+    parent copies them out and removes the segments right away. Segments
+    of results which are never read (the map call was interrupted) are
+    removed by the parent, or by the terminated worker if it didn't send
+    them yet. '''
+    def __init__(self, threshold):
+        assert shared_memory is not None, "shared memory requires Python 3.8+"
+        assert threshold > 0, "shared_memory_threshold must be > 0"
+        self.threshold = threshold
+        self.segments = {} # key=chunk start index val=list of segments
+        self.lock = Lock()
+        # All processes must register segments with the same resource
+        # tracker, otherwise trackers of exiting workers would remove
+        # segments still used by the parent.
+        resource_tracker.ensure_running()
+
+    def wrap(self, func, share_results=True):
+        ''' Returns the function to be called by workers instead of "func".
+        If share_results is False, only arguments are shared (results
+        stay in workers, e.g. folded by fast_map_reduce). '''
+        threshold = self.threshold if share_results else None
+        if asyncio.iscoroutinefunction(func):
+            return partial(call_coroutine_with_shared_buffers, func, threshold)
+        return partial(call_with_shared_buffers, func, threshold)
+
+    def share_chunks(self, chunks):
+        ''' Replaces large arguments of (start_index, tasks) chunks with
+        SharedBuffer handles. '''
+        for start, tasks in chunks:
+            segments = []
+            shared_tasks = []
+            for task in tasks:
+                shared_task = []
+                for arg in task:
+                    if is_shareable(arg, self.threshold):
+                        arg, segment = SharedBuffer.create(arg)
+                        segments.append(segment)
+                    shared_task.append(arg)
+                shared_tasks.append(tuple(shared_task))
+            if segments:
+                with self.lock:
+                    self.segments[start] = segments
+            yield start, shared_tasks
+
+    def receive_chunks(self, chunks):
+        ''' Removes argument segments of arrived (start_index, results,
+        errors, duration) chunks and loads results from shared memory. '''
+        try:
+            for start, results, errors, duration in chunks:
+                self.release(start)
+                results = [res.load() if isinstance(res, SharedBuffer) else res
+                           for res in results]
+                yield start, results, errors, duration
+        finally:
+            self.close()
+
+    def release(self, start):
+        with self.lock:
+            segments = self.segments.pop(start, [])
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+    def discard_chunks(self, chunks_queue):
+        ''' Removes result segments of (start_index, results, ...) chunks
+        left in the queue, once nobody reads them (e.g. when the map call
+        was interrupted). '''
+        while True:
+            try:
+                start, results, *_ = chunks_queue.get(block=False)
+            except queue.Empty:
+                return
+            if start is not None:
+                remove_shared_results(results)
+
+    def close(self):
+        ''' Removes all remaining segments (e.g. when the map call was
+        interrupted). '''
+        with self.lock:
+            starts = list(self.segments)
+        for start in starts:
+            self.release(start)
@@ -0,0 +1,43 @@
+from .fast_map import fast_map
+
+_NOT_FOUND = object()
+
+def fast_first(f, *f_args, predicate=bool, default=None, **kwargs):
+    ''' Returns the first computed result of "f" satisfying the predicate
+    (in the order of completion, not the order of arguments), or "default"
+    if none of them does. Remaining tasks are cancelled as soon as a match
+    is found. Accepts the same keyword arguments as fast_map (results of a
+    chunk arrive together, chunksize=1 gives the earliest answer when tasks
+    take long).
+
+        Usage:
+
+        def find_password(candidate):
+            return candidate if check(candidate) else None
+
+        password = fast_first(find_password, candidates, threads_limit=100)
+    '''
+    assert callable(predicate), 'supplied predicate is not callable'
+    kwargs['ordered'] = False
+    results = fast_map(f, *f_args, **kwargs)
+    try:
+        for _, res in results:
+            if predicate(res):
+                return res
+    finally:
+        # stops the enqueuer and worker processes right away
+        results.close()
+    return default
+
+def fast_any(f, *f_args, **kwargs):
+    ''' Parallel equivalent of any(map(f, *f_args)), stops remaining tasks
+    once any result is true. Accepts the same keyword arguments as
+    fast_map. '''
+    return fast_first(f, *f_args, default=_NOT_FOUND, **kwargs) is not _NOT_FOUND
+
+def fast_all(f, *f_args, **kwargs):
+    ''' Parallel equivalent of all(map(f, *f_args)), stops remaining tasks
+    once any result is false. Accepts the same keyword arguments as
+    fast_map. '''
+    return fast_first(f, *f_args, predicate=lambda res: not res, default=_NOT_FOUND,
+                      **kwargs) is _NOT_FOUND
@@ -0,0 +1,208 @@
+from threading import Lock
+import bisect
+import time
+
+# Upper bounds (in seconds) of task duration histogram buckets, the last
+# bucket counts longer tasks.
+LATENCY_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5,
+                   1.0, 5.0, 10.0, 60.0]
+# Minimum time (in seconds) between calls of the on_progress callback.
+PROGRESS_INTERVAL = 0.5
+
+class FastMapStats:
+    ''' Opt-in metrics of a single map call, supplied as the "stats"
+    argument of fast_map (or FastMapPool.imap) and updated while the map
+    runs. It's cheap enough to be always enabled (counters are updated
+    once per chunk of tasks, not once per task).
+
+    Usage:
+
+        stats = FastMapStats()
+        for res in fast_map(f, range(1000), stats=stats):
+            print(stats.tasks_completed, stats.in_flight, stats.eta)
+        print(stats.snapshot())
+    '''
+    def __init__(self, on_progress=None, progress_interval=PROGRESS_INTERVAL):
+        assert on_progress is None or callable(on_progress), 'supplied on_progress is not callable'
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.lock = Lock()
+        self.start_time = None
+        self.end_time = None
+        self.tasks_total = None # known for inputs with len() (or estimated)
+        self.tasks_enqueued = 0
+        self.tasks_completed = 0
+        self.tasks_failed = 0
+        self.tasks_yielded = 0
+        self.enqueuing_finished = False
+        # time the enqueuer waited for the input (e.g. a slow generator)
+        self.input_wait_time = 0.0
+        # time the enqueuer waited because of max_in_flight
+        self.backpressure_wait_time = 0.0
+        self.max_results_buffered = 0
+        self.procs = {} # key=proc_id val=dict (see "proc_stats")
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.last_progress_time = 0.0
+
+    def start(self, tasks_total=None):
+        with self.lock:
+            self.start_time = time.perf_counter()
+            self.tasks_total = tasks_total
+
+    def finish(self):
+        with self.lock:
+            self.end_time = time.perf_counter()
+        self.report_progress(force=True)
+
+    def proc_stats(self, proc_id):
+        if proc_id not in self.procs:
+            self.procs[proc_id] = {'tasks_completed': 0, 'busy_time': 0.0, 'pid': None}
+        return self.procs[proc_id]
+
+    def set_pid(self, proc_id, pid):
+        with self.lock:
+            self.proc_stats(proc_id)['pid'] = pid
+
+    def set_placement(self, proc_id, cores, numa_node):
+        ''' Records cores the process is pinned to (see AffinityPlan). '''
+        with self.lock:
+            proc = self.proc_stats(proc_id)
+            proc['cores'] = list(cores)
+            proc['numa_node'] = numa_node
+
+    def on_enqueued(self, count, input_wait_time=0.0, backpressure_wait_time=0.0):
+        with self.lock:
+            self.tasks_enqueued += count
+            self.input_wait_time += input_wait_time
+            self.backpressure_wait_time += backpressure_wait_time
+
+    def on_enqueuing_finished(self):
+        with self.lock:
+            self.enqueuing_finished = True
+            if self.tasks_total is None or self.tasks_total != self.tasks_enqueued:
+                # estimate was wrong (or missing)
+                self.tasks_total = self.tasks_enqueued
+
+    def on_chunk_completed(self, proc_id, count, errors_count, duration, task_durations):
+        with self.lock:
+            self.tasks_completed += count
+            self.tasks_failed += errors_count
+            proc = self.proc_stats(proc_id)
+            proc['tasks_completed'] += count
+            proc['busy_time'] += duration or 0.0
+            for task_duration in task_durations or ():
+                self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, task_duration)] += 1
+            self.max_results_buffered = max(self.max_results_buffered, self.results_buffered)
+        self.report_progress()
+
+    def on_yielded(self, count):
+        with self.lock:
+            self.tasks_yielded += count
+
+    def report_progress(self, force=False):
+        if self.on_progress is None:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last_progress_time < self.progress_interval:
+            return
+        self.last_progress_time = now
+        self.on_progress(self)
+
+    @property
+    def in_flight(self):
+        ''' Tasks enqueued but not completed yet. '''
+        return self.tasks_enqueued - self.tasks_completed
+
+    @property
+    def results_buffered(self):
+        ''' Completed tasks whose results weren't yielded yet (e.g. held
+        in the reorder buffer by a slow task with a lower index). '''
+        return self.tasks_completed - self.tasks_yielded
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def throughput(self):
+        ''' Completed tasks per second. '''
+        elapsed = self.elapsed
+        return self.tasks_completed / elapsed if elapsed else 0.0
+
+    @property
+    def progress(self):
+        ''' Fraction of completed tasks (None if the total is unknown). '''
+        if not self.tasks_total:
+            return None
+        return min(1.0, self.tasks_completed / self.tasks_total)
+
+    @property
+    def eta(self):
+        ''' Estimated number of seconds until all tasks complete (None if
+        the total is unknown or nothing completed yet). '''
+        if not self.tasks_total or not self.tasks_completed:
+            return None
+        remaining = max(0, self.tasks_total - self.tasks_completed)
+        return remaining / self.throughput
+
+    def procs_throughput(self):
+        ''' Returns a dict (key=proc_id) of completed tasks per second. '''
+        elapsed = self.elapsed
+        with self.lock:
+            return {proc_id: (proc['tasks_completed'] / elapsed if elapsed else 0.0)
+                    for proc_id, proc in self.procs.items()}
+
+    def latency_percentile(self, percentile):
+        ''' Returns the upper bound of the histogram bucket containing the
+        given percentile (0-100) of task durations (None if unknown,
+        inf if above the last bucket). '''
+        with self.lock:
+            histogram = list(self.latency_histogram)
+        total = sum(histogram)
+        if not total:
+            return None
+        threshold = total * percentile / 100
+        count = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + [float('inf')], histogram):
+            count += bucket_count
+            if count >= threshold:
+                return bound
+
+    def snapshot(self):
+        ''' Returns all metrics as a dict (e.g. for logging). '''
+        with self.lock:
+            procs = {proc_id: dict(proc) for proc_id, proc in self.procs.items()}
+            histogram = list(self.latency_histogram)
+        return {
+            'elapsed': self.elapsed,
+            'tasks_total': self.tasks_total,
+            'tasks_enqueued': self.tasks_enqueued,
+            'tasks_completed': self.tasks_completed,
+            'tasks_failed': self.tasks_failed,
+            'tasks_yielded': self.tasks_yielded,
+            'in_flight': self.in_flight,
+            'results_buffered': self.results_buffered,
+            'max_results_buffered': self.max_results_buffered,
+            'enqueuing_finished': self.enqueuing_finished,
+            'input_wait_time': self.input_wait_time,
+            'backpressure_wait_time': self.backpressure_wait_time,
+            'throughput': self.throughput,
+            'procs_throughput': self.procs_throughput(),
+            'procs': procs,
+            'latency_buckets': LATENCY_BUCKETS,
+            'latency_histogram': histogram,
+            'latency_p50': self.latency_percentile(50),
+            'latency_p99': self.latency_percentile(99),
+            'progress': self.progress,
+            'eta': self.eta,
+        }
+
+def print_progress(stats):
+    ''' Ready to use on_progress callback printing a single progress line. '''
+    total = stats.tasks_total if stats.tasks_total is not None else '?'
+    line = f'{stats.tasks_completed}/{total} tasks done, {stats.throughput:.1f} tasks/s'
+    if stats.eta is not None:
+        line += f', ETA {stats.eta:.1f}s'
+    print(line, flush=True)
@@ -0,0 +1,153 @@
+from threading import Thread, Condition, Event
+from collections import deque
+from functools import partial
+import time
+
+# How often (in seconds) running tasks are checked.
+CHECK_INTERVAL = 0.01
+# Durations of this many recently completed tasks give the median.
+HEDGE_SAMPLES = 1000
+# Tasks aren't duplicated until this many tasks completed.
+HEDGE_MIN_SAMPLES = 10
+
+class _Run:
+    ''' A single run of a task (the original one or its duplicate). '''
+    def __init__(self, task):
+        self.task = task
+        self.future = None
+        # whether its slot was released (once it completed or was abandoned)
+        self.released = False
+
+class _Task:
+    def __init__(self, chunk, offset, args):
+        self.chunk = chunk
+        self.offset = offset
+        self.args = args
+        self.start = time.perf_counter()
+        self.runs = []
+        self.hedged = False
+
+class TaskWatchdog:
+    ''' Watches tasks running in a worker process (see "submit_chunk"):
+    - tasks running longer than "timeout" seconds fail with TimeoutError
+    - if "hedge" is supplied, a task running "hedge" times longer than the
+    median duration of completed tasks is started again (once) if a thread
+    is idle, the result of the run which completes first is used
+
+    Runs of timed out tasks and runs which lost are abandoned: their slots
+    are released right away and they are cancelled (coroutines stop,
+    threads can't be stopped so they run until the function returns, their
+    results are discarded). The timeout counts from handing the task to the
+    thread pool. '''
+    def __init__(self, slots, timeout=None, hedge=None, on_task_completed=None):
+        self.slots = slots
+        self.timeout = timeout
+        self.hedge = hedge
+        self.on_task_completed = on_task_completed
+        self.condition = Condition()
+        self.tasks = set() # tasks not completed yet
+        self.durations = deque(maxlen=HEDGE_SAMPLES)
+        self.median = None
+        self.executor = None
+        self.call = None
+        self.func = None
+        self.stopped = Event()
+        self.thread = Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def submit(self, executor, call, func, chunk, offset, args):
+        ''' Submits the task (its slot is already taken). '''
+        task = _Task(chunk, offset, args)
+        with self.condition:
+            # duplicates are submitted to the latest executor
+            self.executor, self.call, self.func = executor, call, func
+            self.tasks.add(task)
+        self._start_run(task)
+
+    def _start_run(self, task):
+        run = _Run(task)
+        with self.condition:
+            task.runs.append(run)
+        run.future = self.executor.submit(self.call, self.func, task.args)
+        run.future.add_done_callback(partial(self._on_run_done, run))
+
+    def _on_run_done(self, run, future):
+        duration = cpu_time = 0.0
+        res = error = None
+        try:
+            duration, cpu_time, res = future.result()
+        except BaseException as e:
+            error = e
+        task = run.task
+        # the first completed run wins, others are abandoned
+        if task.chunk.complete(task.offset, res, error, duration):
+            if error is None:
+                self._add_duration(duration)
+            self._finish(task)
+        release = self._release(run)
+        if release and self.on_task_completed is not None:
+            self.on_task_completed(duration, cpu_time)
+
+    def _release(self, run):
+        ''' Releases the slot of the run unless it was released already,
+        returns whether it did. '''
+        with self.condition:
+            if run.released:
+                return False
+            run.released = True
+        self.slots.release()
+        return True
+
+    def _finish(self, task):
+        ''' Abandons remaining runs of a completed task. '''
+        with self.condition:
+            self.tasks.discard(task)
+            runs = list(task.runs)
+            self.condition.notify_all()
+        for run in runs:
+            if run.future is not None and not run.future.done():
+                run.future.cancel()
+                self._release(run)
+
+    def _add_duration(self, duration):
+        with self.condition:
+            self.durations.append(duration)
+            self.median = None
+
+    def _hedge_after(self):
+        ''' Returns the duration after which tasks are duplicated (None if
+        not enough tasks completed yet). '''
+        with self.condition:
+            if self.hedge is None or len(self.durations) < HEDGE_MIN_SAMPLES:
+                return None
+            if self.median is None:
+                durations = sorted(self.durations)
+                self.median = durations[len(durations) // 2]
+            return self.median * self.hedge
+
+    def _watch(self):
+        while not self.stopped.wait(CHECK_INTERVAL):
+            with self.condition:
+                tasks = list(self.tasks)
+            now = time.perf_counter()
+            hedge_after = self._hedge_after()
+            for task in tasks:
+                running_time = now - task.start
+                if self.timeout is not None and running_time > self.timeout:
+                    error = TimeoutError(f'fast_map task timed out after {self.timeout}s')
+                    if task.chunk.complete(task.offset, error=error, duration=running_time):
+                        self._finish(task)
+                elif (hedge_after is not None and not task.hedged and running_time > hedge_after
+                      and self.slots.try_take()):
+                    task.hedged = True
+                    self._start_run(task)
+
+    def wait_for_tasks(self):
+        ''' Waits until all submitted tasks are completed (or timed out),
+        abandoned runs may be still running. '''
+        with self.condition:
+            while self.tasks:
+                self.condition.wait()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,53 @@
+from threading import Lock
+import math
+import time
+
+# Maximum number of threads per process (in adaptive mode) if threads_limit
+# isn't supplied and the number of tasks is unknown.
+DEFAULT_MAX_THREADS = 256
+# How often (in seconds) the number of threads is adjusted.
+TUNING_INTERVAL = 0.5
+# CPU utilization of a process (CPU time of its tasks / wall time) above
+# which it's considered CPU-bound, adding threads wouldn't help then.
+SATURATED_UTILIZATION = 0.9
+# Threads are added at most this many times per interval.
+MAX_GROWTH = 2.0
+# Fraction of threads kept when the process is CPU-bound (fewer threads
+# means less contention over the GIL).
+SHRINK_FACTOR = 0.75
+
+class ThreadsTuner:
+    ''' Adjusts the number of concurrently running tasks (threads) of a 
+    worker process while the map runs, based on the CPU time of completed
+    tasks compared to the wall time. I/O-bound tasks leave the CPU idle,
+    so more threads are used (up to max_threads). CPU-bound tasks saturate
+    it, so the number of threads is reduced (down to 1). '''
+    def __init__(self, slots, max_threads):
+        self.slots = slots
+        self.max_threads = max_threads
+        self.lock = Lock()
+        self.cpu_time = 0.0
+        self.interval_start = time.perf_counter()
+
+    def observe(self, duration, cpu_time):
+        ''' Called after each task, with its wall and CPU time. '''
+        with self.lock:
+            self.cpu_time += cpu_time
+            now = time.perf_counter()
+            elapsed = now - self.interval_start
+            if elapsed < TUNING_INTERVAL:
+                return
+            utilization = self.cpu_time / elapsed
+            self.cpu_time = 0.0
+            self.interval_start = now
+            self.slots.set_limit(self.next_limit(self.slots.limit, utilization,
+                                                 self.slots.pop_waited()))
+
+    def next_limit(self, limit, utilization, tasks_waited):
+        if utilization >= SATURATED_UTILIZATION:
+            limit = math.floor(limit * SHRINK_FACTOR)
+        elif tasks_waited:
+            # tasks were waiting for threads while the CPU was idle
+            growth = min(MAX_GROWTH, SATURATED_UTILIZATION / max(utilization, 1e-3))
+            limit = math.ceil(limit * growth)
+        return max(1, min(limit, self.max_threads))
@@ -0,0 +1,42 @@
+from threading import local
+
+# Values returned by the "initializer" (once per worker process) and by the
+# "thread_initializer" (once per thread of a worker process).
+_process_state = None
+_thread_state = local()
+
+def process_state():
+    ''' Returns the value returned by the "initializer" in the current
+    worker process (e.g. a loaded model or a connection pool), or None.
+
+    Usage:
+
+        def init(path):
+            return load_model(path)
+
+        def task(x):
+            return process_state().predict(x)
+
+        fast_map(task, inputs, initializer=init, initargs=('model.bin',))
+    '''
+    return _process_state
+
+def thread_state():
+    ''' Returns the value returned by the "thread_initializer" in the
+    current thread (e.g. a database connection or HTTP session, which
+    often aren't safe to share between threads), or None. '''
+    return getattr(_thread_state, 'value', None)
+
+def swap_process_state(value):
+    ''' Replaces the process state, returns the previous one. '''
+    global _process_state
+    previous, _process_state = _process_state, value
+    return previous
+
+def run_process_initializer(initializer, initargs):
+    global _process_state
+    if initializer is not None:
+        _process_state = initializer(*initargs)
+
+def run_thread_initializer(initializer, initargs):
+    _thread_state.value = initializer(*initargs)
@@ -0,0 +1,3 @@
+# Imported only by the forkserver in test_context.test_preload (nothing
+# else imports it, so it's never in sys.modules of the test process).
+VALUE = 42
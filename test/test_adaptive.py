@@ -0,0 +1,55 @@
+from fast_map import fast_map, FastMapPool
+from fast_map.fast_map import TaskSlots
+from fast_map.threads_tuner import ThreadsTuner
+import time
+
+def io_task(x):
+    time.sleep(0.2)
+    return x
+
+def cpu_task(x):
+    for i in range(10 ** 5):
+        pass
+    return x
+
+def test_tuner_decisions():
+    tuner = ThreadsTuner(TaskSlots(4), max_threads=64)
+    # I/O-bound (CPU mostly idle while tasks waited for threads)
+    assert tuner.next_limit(4, 0.05, tasks_waited=True) == 8
+    assert tuner.next_limit(4, 0.6, tasks_waited=True) == 6
+    # nothing waited for threads, more of them wouldn't help
+    assert tuner.next_limit(4, 0.05, tasks_waited=False) == 4
+    # CPU-bound
+    assert tuner.next_limit(4, 0.99, tasks_waited=True) == 3
+    assert tuner.next_limit(1, 0.99, tasks_waited=True) == 1
+    assert tuner.next_limit(60, 0.01, tasks_waited=True) == 64
+
+def test_adaptive_io_bound_generator():
+    # without adaptive mode only 4 threads per process would be used (20s)
+    start = time.time()
+    results = list(fast_map(io_task, (x for x in range(400)), adaptive=True))
+    assert results == list(range(400))
+    assert time.time() - start < 10
+
+def test_adaptive_respects_threads_limit():
+    start = time.time()
+    assert list(fast_map(io_task, (x for x in range(20)), adaptive=True, threads_limit=2,
+                         procs_limit=1)) == list(range(20))
+    assert time.time() - start >= 2
+
+def test_adaptive_cpu_bound():
+    assert list(fast_map(cpu_task, range(200), adaptive=True)) == list(range(200))
+
+def test_pool_adaptive():
+    with FastMapPool(adaptive=True) as pool:
+        start = time.time()
+        assert pool.map(io_task, range(400)) == list(range(400))
+        assert time.time() - start < 10
+
+if __name__ == '__main__':
+    test_tuner_decisions()
+    test_adaptive_io_bound_generator()
+    test_adaptive_respects_threads_limit()
+    test_adaptive_cpu_bound()
+    test_pool_adaptive()
+    print('all done')
@@ -0,0 +1,62 @@
+from fast_map import fast_map, fast_map_reduce, FastMapPool, FastMapStats
+from fast_map import affinity
+import operator
+import tempfile
+import os
+
+def cores_of_worker(x):
+    return sorted(os.sched_getaffinity(0))
+
+def fake_topology(directory, nodes):
+    for node, cpulist in enumerate(nodes):
+        os.makedirs(os.path.join(directory, f'node{node}'))
+        with open(os.path.join(directory, f'node{node}', 'cpulist'), 'w') as f:
+            f.write(cpulist + '\n')
+
+def test_parse_cpulist():
+    assert affinity.parse_cpulist('0-3,8,10-11\n') == {0, 1, 2, 3, 8, 10, 11}
+    assert affinity.parse_cpulist('5') == {5}
+
+def test_plan():
+    available_cores, nodes_path = affinity.available_cores, affinity.NODES_PATH
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            fake_topology(directory, ['0-3', '4-7'])
+            affinity.NODES_PATH = directory
+            affinity.available_cores = lambda: list(range(8))
+            plan = affinity.AffinityPlan('core')
+            # spread evenly across NUMA nodes
+            assert [plan.cores(i) for i in range(4)] == [[0], [4], [1], [5]]
+            assert plan.placement(1) == ([4], 1)
+            assert plan.cores_count == 8
+            plan = affinity.AffinityPlan('numa', reserved_cores=[0])
+            assert [plan.placement(i) for i in range(3)] == [
+                ([1, 2, 3], 0), ([4, 5, 6, 7], 1), ([1, 2, 3], 0)]
+            plan = affinity.AffinityPlan(None, reserved_cores=[0, 4])
+            assert plan.placement(0) == ([1, 2, 3, 5, 6, 7], None)
+            assert plan.cores_count == 6
+            plan = affinity.AffinityPlan([[0, 1], 6])
+            assert [plan.placement(i) for i in range(2)] == [([0, 1], 0), ([6], 1)]
+    finally:
+        affinity.available_cores, affinity.NODES_PATH = available_cores, nodes_path
+
+def test_pinned_workers():
+    if not hasattr(os, 'sched_setaffinity'):
+        print('CPU affinity not supported, skipping test_pinned_workers')
+        return
+    core = affinity.available_cores()[-1]
+    stats = FastMapStats()
+    results = list(fast_map(cores_of_worker, range(8), affinity=[core], stats=stats))
+    assert results == [[core]] * 8
+    assert all(proc['cores'] == [core] for proc in stats.procs.values() if proc['pid'])
+    total = fast_map_reduce(cores_of_worker, operator.add, range(4), affinity='core')
+    assert set(total) <= set(affinity.available_cores())
+    with FastMapPool(procs_limit=2, affinity='core') as pool:
+        assert all(len(cores) == 1 for cores in pool.map(cores_of_worker, range(8)))
+        assert len(pool.placement()) == pool.procs_count
+
+if __name__ == '__main__':
+    test_parse_cpulist()
+    test_plan()
+    test_pinned_workers()
+    print('all done')
@@ -0,0 +1,234 @@
+from fast_map import (fast_map, fast_map_reduce, CancelToken, FastMapStats, ResultCache,
+                      process_state, thread_state)
+from fast_map.backends import is_free_threaded, ThreadQueue, Skip
+import threading
+import operator
+import asyncio
+import time
+import os
+
+def square(x):
+    return x * x
+
+def where(x):
+    return os.getpid(), threading.get_ident()
+
+def sleep_and_return(x):
+    time.sleep(0.05)
+    return x
+
+def busy(x):
+    end = time.thread_time() + 0.05
+    while time.thread_time() < end:
+        pass
+    return x
+
+def fail_on_3(x):
+    if x == 3:
+        raise ValueError('x == 3')
+    return x
+
+def sleeping_pid(x):
+    time.sleep(0.02)
+    return os.getpid()
+
+def busy_pid(x):
+    busy(x)
+    return os.getpid()
+
+def add_batch(xs, ys):
+    assert isinstance(xs, list)
+    return [x + y for x, y in zip(xs, ys)]
+
+def init_process(name):
+    return name
+
+def init_thread():
+    return threading.get_ident()
+
+def with_state(x):
+    time.sleep(0.01)
+    return process_state(), thread_state() is not None
+
+def busy_with_state(x):
+    busy(x)
+    return process_state()
+
+def hang_on_0(x):
+    if x == 0:
+        time.sleep(2)
+    return x
+
+def call_time(x):
+    return time.monotonic()
+
+def reverse(data):
+    time.sleep(0.01)
+    return data[::-1]
+
+def failing_init():
+    raise ValueError('initializer failed')
+
+async def async_square(x):
+    await asyncio.sleep(0.01)
+    return x * x
+
+def test_backends():
+    for backend in ('hybrid', 'processes', 'threads', 'auto'):
+        assert list(fast_map(square, range(50), backend=backend)) == [x * x for x in range(50)]
+        assert sorted(fast_map(square, range(20), backend=backend, ordered=False)) == [
+            (x, x * x) for x in range(20)]
+        assert list(fast_map(square, [], backend=backend)) == []
+        assert list(fast_map(async_square, range(10), backend=backend)) == [x * x for x in range(10)]
+
+def test_threads_run_in_parent():
+    pids = {pid for pid, _ in fast_map(where, range(20), backend='threads')}
+    assert pids == {os.getpid()}
+    pids = {pid for pid, _ in fast_map(where, range(20), backend='processes')}
+    assert os.getpid() not in pids
+    # a single thread per process
+    threads = {pid_thread for pid_thread in fast_map(where, range(20), backend='processes')}
+    assert len(threads) == len(pids)
+
+def test_errors_and_cancel():
+    for backend in ('threads', 'auto'):
+        results = []
+        try:
+            for res in fast_map(fail_on_3, range(10), backend=backend, threads_limit=1):
+                results.append(res)
+            assert False, 'ValueError not raised'
+        except ValueError as e:
+            print('exception raised as expected:', e)
+        assert results == [0, 1, 2]
+    token = CancelToken()
+    start = time.perf_counter()
+    results = []
+    for res in fast_map(sleep_and_return, range(1000), backend='threads', threads_limit=4,
+                        cancel_token=token):
+        results.append(res)
+        if len(results) == 4:
+            token.cancel()
+    # queued tasks were dropped
+    assert time.perf_counter() - start < 5
+    gen = fast_map(sleep_and_return, range(1000), backend='threads', threads_limit=4)
+    assert next(gen) == 0
+    gen.close()
+
+def test_auto():
+    if is_free_threaded():
+        print('free-threaded build, skipping probe checks of test_auto')
+        return
+    for f_args in (range(10), iter(range(10))):
+        pids = list(fast_map(sleeping_pid, f_args, backend='auto'))
+        assert pids == [os.getpid()] * 10
+    pids = list(fast_map(busy_pid, range(10), backend='auto'))
+    # the probed task runs in the parent, others in worker processes
+    assert pids[0] == os.getpid() and os.getpid() not in pids[1:]
+    # the first task isn't run again
+    calls = []
+    def record(x):
+        calls.append(x)
+        time.sleep(0.01)
+        return x
+    assert list(fast_map(record, range(10), backend='auto')) == list(range(10))
+    assert sorted(calls) == list(range(10))
+    assert sorted(fast_map(record, range(5), backend='auto', ordered=False)) == [
+        (x, x) for x in range(5)]
+
+def test_auto_batched():
+    assert list(fast_map(add_batch, range(20), range(20), batched=True,
+                         backend='auto')) == [x * 2 for x in range(20)]
+
+def test_auto_initializers():
+    results = list(fast_map(with_state, range(10), backend='auto', initializer=init_process,
+                            initargs=('model',), thread_initializer=init_thread))
+    assert results == [('model', True)] * 10
+    # the state is kept in the parent only if tasks run there
+    assert process_state() == 'model'
+    results = list(fast_map(busy_with_state, range(10), backend='auto',
+                            initializer=init_process, initargs=('big model',)))
+    assert results == ['big model'] * 10
+    assert process_state() == 'model'
+    try:
+        list(fast_map(with_state, range(4), backend='auto', initializer=failing_init))
+    except RuntimeError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'failing initializer should stop the map'
+
+def test_auto_stats():
+    stats = FastMapStats()
+    assert list(fast_map(sleep_and_return, range(10), backend='auto', stats=stats)) == list(range(10))
+    assert stats.tasks_total == 10
+    assert stats.tasks_completed == 10
+    assert stats.tasks_yielded == 10
+
+def test_auto_cache():
+    cache = ResultCache()
+    assert list(fast_map(sleep_and_return, range(10), backend='auto', cache=cache)) == list(range(10))
+    assert cache.misses == 10
+    # the probed task was cached too, cached tasks aren't probed
+    assert list(fast_map(sleep_and_return, range(12), backend='auto', cache=cache)) == list(range(12))
+    assert cache.hits == 10
+    assert list(fast_map(sleep_and_return, range(5), backend='auto', cache=cache)) == list(range(5))
+
+def test_auto_timeout():
+    results = []
+    start = time.perf_counter()
+    try:
+        for res in fast_map(hang_on_0, range(5), backend='auto', timeout=0.2):
+            results.append(res)
+        assert False, 'TimeoutError not raised'
+    except TimeoutError:
+        pass
+    assert time.perf_counter() - start < 1.5
+    assert results == []
+
+def test_auto_rate_limits():
+    times = sorted(fast_map(call_time, range(6), backend='auto', max_calls_per_second=10))
+    # the first call is spaced like the others
+    assert all(b - a >= 0.09 for a, b in zip(times, times[1:]))
+
+def test_auto_shared_memory():
+    blobs = [bytes([i]) * 5000 for i in range(6)]
+    results = list(fast_map(reverse, blobs, backend='auto', shared_memory_threshold=1000))
+    assert results == [b[::-1] for b in blobs]
+
+def test_auto_reduce():
+    assert fast_map_reduce(square, operator.add, range(50), backend='auto') == sum(
+        x * x for x in range(50))
+    assert fast_map_reduce(square, operator.add, range(1), backend='auto') == 0
+    cache = ResultCache()
+    assert fast_map_reduce(square, operator.add, range(20), backend='auto', cache=cache) == sum(
+        x * x for x in range(20))
+    assert cache.misses == 20
+
+def test_skip():
+    assert list(Skip(range(5), 2)) == [2, 3, 4]
+    assert len(Skip(range(5), 2)) == 3
+    assert len(Skip([], 1)) == 0
+
+def test_thread_queue():
+    q = ThreadQueue()
+    q.put((0, [1]))
+    q.cancel_join_thread()
+    assert q.get() == (None, None)
+    q.put((1, [2]))
+    assert q.get() == (None, None)
+
+if __name__ == '__main__':
+    test_backends()
+    test_threads_run_in_parent()
+    test_errors_and_cancel()
+    test_auto()
+    test_auto_batched()
+    test_auto_initializers()
+    test_auto_stats()
+    test_auto_cache()
+    test_auto_timeout()
+    test_auto_rate_limits()
+    test_auto_shared_memory()
+    test_auto_reduce()
+    test_skip()
+    test_thread_queue()
+    print('all done')
@@ -0,0 +1,77 @@
+from fast_map import fast_map, fast_map_reduce, FastMapPool
+import operator
+
+def add_batch(xs, ys):
+    assert isinstance(xs, list) and isinstance(ys, list)
+    return [x + y for x, y in zip(xs, ys)]
+
+def batch_len(xs):
+    return [len(xs)] * len(xs)
+
+def tuple_batch(xs):
+    assert isinstance(xs, tuple)
+    return xs
+
+def wrong_length(xs):
+    return xs[1:]
+
+def fail_on_3(xs):
+    if 3 in xs:
+        raise ValueError('3')
+    return xs
+
+async def async_double(xs):
+    return [x * 2 for x in xs]
+
+def test_batched():
+    results = list(fast_map(add_batch, range(100), range(100), batched=True))
+    assert results == [x * 2 for x in range(100)]
+
+def test_batch_size():
+    sizes = list(fast_map(batch_len, range(20), batched=True, chunksize=5))
+    assert sizes == [5] * 20
+    sizes = list(fast_map(batch_len, range(7), batched=True, chunksize=5))
+    assert sizes == [5] * 5 + [2] * 2
+
+def test_batch_type():
+    assert list(fast_map(tuple_batch, range(10), batched=True, batch_type=tuple)) == list(range(10))
+
+def test_errors():
+    try:
+        list(fast_map(wrong_length, range(10), batched=True, chunksize=5))
+        assert False, 'ValueError not raised'
+    except ValueError as e:
+        assert 'returned 4 results for 5 tasks' in str(e)
+    results = []
+    try:
+        for res in fast_map(fail_on_3, range(10), batched=True, chunksize=2):
+            results.append(res)
+        assert False, 'ValueError not raised'
+    except ValueError as e:
+        assert str(e) == '3'
+    # the whole batch [2, 3] fails
+    assert results == [0, 1]
+
+def test_unordered_and_coroutines():
+    results = sorted(fast_map(async_double, range(30), batched=True, ordered=False))
+    assert results == [(i, i * 2) for i in range(30)]
+
+def test_reduce():
+    assert fast_map_reduce(add_batch, operator.add, range(50), range(50), batched=True) == 2450
+
+def test_pool():
+    with FastMapPool(procs_limit=2, threads_limit=4) as pool:
+        assert pool.map(add_batch, range(40), range(40), batched=True) == [x * 2 for x in range(40)]
+        assert pool.map(batch_len, range(6), batched=True, chunksize=3) == [3] * 6
+        # non-batched jobs still work in the same pool
+        assert pool.map(operator.neg, range(5)) == [0, -1, -2, -3, -4]
+
+if __name__ == '__main__':
+    test_batched()
+    test_batch_size()
+    test_batch_type()
+    test_errors()
+    test_unordered_and_coroutines()
+    test_reduce()
+    test_pool()
+    print('all done')
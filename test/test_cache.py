@@ -0,0 +1,190 @@
+from fast_map import fast_map, FastMapPool, ResultCache, FastMapStats
+import fast_map as fast_map_package
+import subprocess
+import importlib
+import tempfile
+import math
+import threading
+import time
+import sys
+import os
+
+def task(x):
+    time.sleep(0.01)
+    return x * 2, os.getpid()
+
+def add(x, y):
+    return x + y
+
+def squares_sum(x):
+    # nested code objects (comprehension, lambda) and a set constant
+    key = lambda y: y in {'a', 'b', 'c'}
+    return sum([y * y for y in range(x) if not key(y)])
+
+def fill_cache(directory):
+    list(fast_map(squares_sum, range(20), cache=ResultCache(directory=directory)))
+
+def make_multiplier(n):
+    def multiply(x):
+        return x * n
+    return multiply
+
+def scale(x, factor=1):
+    return x * factor
+
+def sine(x):
+    return math.sin(x)
+
+def cosine(x):
+    return math.cos(x)
+
+class Scaler:
+    def __init__(self, factor):
+        self.factor = factor
+
+    def scale(self, x):
+        return x * self.factor
+
+def failing(x):
+    if x == 3:
+        raise ValueError('x == 3')
+    return x
+
+def test_memory_cache():
+    cache = ResultCache()
+    first = list(fast_map(task, range(50), cache=cache))
+    assert cache.stats()['misses'] == 50
+    second = list(fast_map(task, range(100), cache=cache))
+    # the same results (the same pids prove they weren't recomputed)
+    assert second[:50] == first
+    assert [res for res, _ in second] == [x * 2 for x in range(100)]
+    assert cache.hits == 50 and cache.misses == 100
+
+def test_interleaved_hits_and_misses():
+    cache = ResultCache()
+    list(fast_map(add, range(0, 100, 2), range(0, 100, 2), cache=cache))
+    assert list(fast_map(add, range(100), range(100), cache=cache)) == [x * 2 for x in range(100)]
+    assert cache.hits == 50
+    unordered = list(fast_map(add, range(100), range(100), cache=cache, ordered=False))
+    assert sorted(unordered) == [(x, x * 2) for x in range(100)]
+    assert cache.hits == 150
+
+def test_all_hits_with_generator():
+    cache = ResultCache()
+    list(fast_map(add, range(20), range(20), cache=cache))
+    stats = FastMapStats()
+    assert list(fast_map(add, (x for x in range(20)), range(20), cache=cache, stats=stats)) == \
+        [x * 2 for x in range(20)]
+    assert stats.procs['cache']['tasks_completed'] == 20
+    assert cache.hits == 20
+
+def test_function_identity():
+    cache = ResultCache()
+    list(fast_map(add, range(10), range(10), cache=cache))
+    list(fast_map(failing, range(3), cache=cache))
+    assert cache.hits == 0
+
+def test_function_state_identity():
+    cache = ResultCache()
+    assert list(fast_map(make_multiplier(1), range(4), cache=cache)) == [0, 1, 2, 3]
+    # the same code with a different closure isn't answered from the cache
+    assert list(fast_map(make_multiplier(10), range(4), cache=cache)) == [0, 10, 20, 30]
+    assert list(fast_map(make_multiplier(10), range(4), cache=cache)) == [0, 10, 20, 30]
+    assert cache.hits == 4
+    scale.__defaults__ = (3,)
+    assert list(fast_map(scale, range(4), cache=cache)) == [0, 3, 6, 9]
+    scale.__defaults__ = (1,)
+    assert list(fast_map(scale, range(4), cache=cache)) == [0, 1, 2, 3]
+    # the same bytecode using other global names
+    sines = list(fast_map(sine, range(4), cache=cache))
+    assert list(fast_map(cosine, range(4), cache=cache)) == [math.cos(x) for x in range(4)]
+    assert sines == [math.sin(x) for x in range(4)]
+    # bound methods of different objects
+    assert list(fast_map(Scaler(2).scale, range(4), cache=cache)) == [0, 2, 4, 6]
+    assert list(fast_map(Scaler(5).scale, range(4), cache=cache)) == [0, 5, 10, 15]
+    assert cache.hits == 4
+
+def test_unpicklable_closure_is_not_cached():
+    cache = ResultCache()
+    lock = threading.Lock()
+    def locked_add(x):
+        with lock:
+            return x + 1
+    for _ in range(2):
+        assert list(fast_map(locked_add, range(4), cache=cache)) == [1, 2, 3, 4]
+    assert cache.hits == 0 and cache.misses == 0
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+    for _ in range(2):
+        try:
+            list(fast_map(failing, range(5), cache=cache))
+        except ValueError:
+            pass
+        else:
+            assert False
+    # x == 3 is never answered from the cache, so it's raised again
+    assert cache.stats()['memory_items'] >= 3
+
+def test_lru_eviction():
+    cache = ResultCache(max_items=10)
+    list(fast_map(add, range(20), range(20), cache=cache))
+    assert len(cache.memory) == 10
+    list(fast_map(add, range(10, 20), range(10, 20), cache=cache))
+    assert cache.hits == 10
+
+def test_disk_cache():
+    with tempfile.TemporaryDirectory() as directory:
+        list(fast_map(add, range(30), range(30), cache=ResultCache(directory=directory)))
+        # a new cache (e.g. in a new run of the script) finds results on disk
+        cache = ResultCache(max_items=0, directory=directory)
+        assert list(fast_map(add, range(30), range(30), cache=cache)) == [x * 2 for x in range(30)]
+        assert cache.disk_hits == 30 and cache.misses == 0
+
+def test_disk_cache_across_runs():
+    with tempfile.TemporaryDirectory() as directory:
+        # filled by a new interpreter (with different string hashes and
+        # addresses of code objects)
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        src_dir = os.path.dirname(os.path.dirname(os.path.abspath(fast_map_package.__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([src_dir, os.environ.get('PYTHONPATH', '')]))
+        env.pop('PYTHONHASHSEED', None)
+        subprocess.run([sys.executable, '-c', f'import test_cache; test_cache.fill_cache({directory!r})'],
+                       cwd=test_dir, env=env, check=True, timeout=60)
+        # the module name is a part of the function identity (it's "__main__"
+        # when this file is run as a script)
+        func = importlib.import_module('test_cache').squares_sum
+        cache = ResultCache(max_items=0, directory=directory)
+        results = list(fast_map(func, range(20), cache=cache))
+        assert results == [sum(y * y for y in range(x)) for x in range(20)]
+        assert cache.disk_hits == 20 and cache.misses == 0
+
+def test_disk_size_limit():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory=directory, max_disk_bytes=2000)
+        list(fast_map(add, ['a' * 100] * 50, [str(x) for x in range(50)], cache=cache))
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        assert 0 < size <= 2000
+        assert cache.disk_size == size
+
+def test_pool_cache():
+    cache = ResultCache()
+    with FastMapPool(procs_limit=2) as pool:
+        assert pool.map(add, range(10), range(10), cache=cache) == [x * 2 for x in range(10)]
+        assert pool.map(add, range(20), range(20), cache=cache) == [x * 2 for x in range(20)]
+    assert cache.hits == 10
+
+if __name__ == '__main__':
+    test_memory_cache()
+    test_interleaved_hits_and_misses()
+    test_all_hits_with_generator()
+    test_function_identity()
+    test_function_state_identity()
+    test_unpicklable_closure_is_not_cached()
+    test_errors_are_not_cached()
+    test_lru_eviction()
+    test_disk_cache()
+    test_disk_cache_across_runs()
+    test_disk_size_limit()
+    test_pool_cache()
+    print('all done')
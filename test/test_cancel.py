@@ -0,0 +1,112 @@
+from fast_map import (fast_map, fast_map_async, FastMapPool, CancelToken, fast_first,
+                      fast_any, fast_all)
+import threading
+import tempfile
+import time
+import os
+
+def logged_task(x, log_path):
+    time.sleep(0.2)
+    with open(log_path, 'a') as f:
+        f.write(f'{x}\n')
+    return x
+
+def count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return len(f.readlines())
+
+def sleepy(x):
+    time.sleep(0.5 if x == 7 else 5)
+    return x
+
+def is_even(x):
+    time.sleep(0.01)
+    return x % 2 == 0
+
+def test_break_stops_workers():
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, 'log')
+        for res in fast_map(logged_task, range(100), [log_path] * 100, threads_limit=2):
+            break
+        done = count_lines(log_path)
+        time.sleep(1)
+        # nothing runs once the generator is closed
+        assert count_lines(log_path) == done
+        assert done < 10
+
+def test_cancel_token():
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, 'log')
+        token = CancelToken()
+        threading.Timer(0.5, token.cancel).start()
+        start = time.time()
+        results = list(fast_map(logged_task, range(100), [log_path] * 100, threads_limit=2,
+                                cancel_token=token))
+        assert time.time() - start < 2
+        assert results == list(range(len(results)))
+        assert len(results) < 10
+        done = count_lines(log_path)
+        time.sleep(0.5)
+        assert count_lines(log_path) == done
+
+def test_cancel_generator_input():
+    token = CancelToken()
+    threading.Timer(0.5, token.cancel).start()
+    infinite = (x for x in iter(int, 1))
+    results = list(fast_map(lambda x: x, infinite, cancel_token=token))
+    assert len(results) > 0
+
+def test_fast_map_async_cancel():
+    results = []
+    done = threading.Event()
+    t = fast_map_async(sleepy, range(20), on_result=results.append, on_done=done.set,
+                       threads_limit=20)
+    time.sleep(0.5)
+    start = time.time()
+    t.cancel()
+    t.join()
+    assert time.time() - start < 2
+    assert done.is_set()
+
+def test_fast_first():
+    start = time.time()
+    assert fast_first(sleepy, range(20), predicate=lambda x: x == 7, threads_limit=20,
+                      chunksize=1) == 7
+    assert time.time() - start < 3
+    assert fast_first(is_even, [1, 3, 5]) is None
+    assert fast_first(is_even, [1, 3, 5], default='none') == 'none'
+
+def test_fast_any_and_all():
+    assert fast_any(is_even, [1, 3, 4, 5])
+    assert not fast_any(is_even, [1, 3, 5])
+    assert fast_all(is_even, [2, 4, 6])
+    assert not fast_all(is_even, [2, 3, 6])
+    assert not fast_any(is_even, [])
+    assert fast_all(is_even, [])
+
+def test_pool_cancel():
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, 'log')
+        with FastMapPool(threads_limit=2, procs_limit=1) as pool:
+            for res in pool.imap(logged_task, range(100), [log_path] * 100):
+                break
+            token = CancelToken()
+            threading.Timer(0.5, token.cancel).start()
+            results = list(pool.imap(logged_task, range(100), [log_path] * 100, cancel_token=token))
+            assert len(results) < 20
+            # the pool remains usable
+            assert pool.map(is_even, range(4)) == [True, False, True, False]
+        # queued tasks of both calls were skipped
+        assert count_lines(log_path) < 30
+
+if __name__ == '__main__':
+    test_break_stops_workers()
+    test_cancel_token()
+    test_cancel_generator_input()
+    test_fast_map_async_cancel()
+    test_fast_first()
+    test_fast_any_and_all()
+    test_pool_cancel()
+    print('all done')
@@ -0,0 +1,48 @@
+from fast_map import fast_map, FastMapPool
+from fast_map.fast_map import ChunkSizer, TARGET_CHUNK_DURATION
+import time
+
+def add(a, b):
+    return a + b
+
+def slow(x):
+    time.sleep(0.5)
+    return x
+
+def test_explicit_chunksize():
+    for chunksize in [1, 3, 7, 1000]:
+        results = list(fast_map(add, range(100), range(100), chunksize=chunksize))
+        assert results == [x * 2 for x in range(100)]
+
+def test_auto_chunksize_with_generator():
+    gen = (x for x in range(10000))
+    assert list(fast_map(add, gen, range(10000), threads_limit=4)) == [x * 2 for x in range(10000)]
+
+def test_tasks_of_chunk_run_concurrently():
+    start = time.time()
+    assert list(fast_map(slow, range(16), chunksize=16)) == list(range(16))
+    assert time.time() - start < 1.5
+
+def test_pool_chunksize():
+    with FastMapPool(threads_limit=4) as pool:
+        assert pool.map(add, range(50), range(50), chunksize=4) == [x * 2 for x in range(50)]
+
+def test_chunk_sizer():
+    sizer = ChunkSizer(tasks_count=1000, workers_count=2)
+    # grows gradually before any task duration is known
+    assert [sizer.next_size() for _ in range(4)] == [1, 2, 4, 8]
+    # cheap tasks, chunks are limited by the number of tasks
+    sizer.observe(100, 0.001)
+    assert sizer.next_size() == 125
+    # expensive tasks are sent one by one
+    sizer.observe(10, TARGET_CHUNK_DURATION * 1000)
+    assert sizer.next_size() == 1
+    assert ChunkSizer(chunksize=5).next_size() == 5
+
+if __name__ == '__main__':
+    test_explicit_chunksize()
+    test_auto_chunksize_with_generator()
+    test_tasks_of_chunk_run_concurrently()
+    test_pool_chunksize()
+    test_chunk_sizer()
+    print('all done')
@@ -0,0 +1,66 @@
+from fast_map import fast_map
+from threading import Thread
+import time
+
+def task(x):
+    time.sleep(0.1)
+    return x*x
+
+def returns_none(x):
+    return None
+
+def failing_task(x):
+    if x == 5:
+        raise ValueError('x == 5')
+    return x
+
+def test_interleaved_generators():
+    # completion used to depend on module-level globals shared by all calls
+    gen_a = fast_map(task, range(20), threads_limit=8)
+    gen_b = fast_map(task, range(100, 110), threads_limit=8)
+    results_a, results_b = [], []
+    for b in gen_b:
+        results_a.append(next(gen_a))
+        results_b.append(b)
+    results_a.extend(gen_a)
+    assert results_a == [x*x for x in range(20)]
+    assert results_b == [x*x for x in range(100, 110)]
+
+def test_concurrent_threads():
+    results = {}
+    def run(name, numbers):
+        results[name] = list(fast_map(task, numbers, threads_limit=8))
+    threads = [Thread(target=run, args=[i, range(i * 10)]) for i in range(1, 4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for i in range(1, 4):
+        assert results[i] == [x*x for x in range(i * 10)]
+
+def test_back_to_back():
+    for _ in range(5):
+        assert list(fast_map(task, range(4))) == [0, 1, 4, 9]
+    assert list(fast_map(task, [])) == []
+
+def test_none_results():
+    assert list(fast_map(returns_none, range(10))) == [None] * 10
+
+def test_exception_is_raised():
+    results = []
+    try:
+        for res in fast_map(failing_task, range(10), threads_limit=4):
+            results.append(res)
+    except ValueError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'ValueError was not raised'
+    assert results == [0, 1, 2, 3, 4]
+
+if __name__ == '__main__':
+    test_interleaved_generators()
+    test_concurrent_threads()
+    test_back_to_back()
+    test_none_results()
+    test_exception_is_raised()
+    print('all done')
@@ -0,0 +1,68 @@
+from fast_map import fast_map, fast_map_reduce, FastMapPool
+from fast_map.context import get_context
+from threading import Lock
+import multiprocessing as mp
+import subprocess
+import operator
+import fast_map as fast_map_package
+import sys
+import os
+
+lock_G = Lock()
+
+def square(x):
+    return x * x
+
+def with_lock(x):
+    # deadlocks in processes forked while the parent holds the lock
+    with lock_G:
+        return x
+
+def preloaded(x):
+    return 'preloaded_module' in sys.modules
+
+def test_start_methods():
+    for method in mp.get_all_start_methods():
+        assert list(fast_map(square, range(20), mp_context=method)) == [x * x for x in range(20)]
+        assert fast_map_reduce(square, operator.add, range(20), mp_context=method) == 2470
+    ctx = mp.get_context('spawn')
+    assert list(fast_map(square, range(5), mp_context=ctx, threads_limit=2)) == [0, 1, 4, 9, 16]
+
+def test_pool():
+    with FastMapPool(procs_limit=2, mp_context='spawn') as pool:
+        assert pool.map(square, range(10)) == [x * x for x in range(10)]
+
+def test_forkserver_doesnt_inherit_locks():
+    if 'forkserver' not in mp.get_all_start_methods():
+        print('forkserver not available, skipping test_forkserver_doesnt_inherit_locks')
+        return
+    with lock_G:
+        results = list(fast_map(with_lock, range(4), mp_context='forkserver'))
+    assert results == list(range(4))
+
+def check_preload():
+    assert 'preloaded_module' not in sys.modules
+    get_context('forkserver', preload=['preloaded_module'])
+    # imported by the forkserver, not by the parent
+    assert 'preloaded_module' not in sys.modules
+    assert all(fast_map(preloaded, range(4), mp_context='forkserver'))
+
+def test_preload():
+    if 'forkserver' not in mp.get_all_start_methods():
+        print('forkserver not available, skipping test_preload')
+        return
+    # in a new interpreter, so the forkserver isn't running yet (the test
+    # runner may have started it) and it finds preloaded_module (it ignores
+    # sys.path of the parent before Python 3.12)
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(fast_map_package.__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([src_dir, os.environ.get('PYTHONPATH', '')]))
+    subprocess.run([sys.executable, '-c', 'import test_context; test_context.check_preload()'],
+                   cwd=test_dir, env=env, check=True, timeout=60)
+
+if __name__ == '__main__':
+    test_preload()
+    test_start_methods()
+    test_pool()
+    test_forkserver_doesnt_inherit_locks()
+    print('all done')
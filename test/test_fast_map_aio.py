@@ -0,0 +1,74 @@
+from fast_map import fast_map, fast_map_aio, FastMapPool
+import asyncio
+import time
+
+async def async_task(x):
+    await asyncio.sleep(1)
+    return x * x
+
+def task(x):
+    time.sleep(0.1)
+    return x * x
+
+def failing_task(x):
+    if x == 2:
+        raise ValueError('x == 2')
+    return x
+
+def test_coroutine_function_in_workers():
+    # 500 coroutines awaited concurrently without 500 threads
+    start = time.time()
+    results = list(fast_map(async_task, range(500), threads_limit=500))
+    assert results == [x * x for x in range(500)]
+    assert time.time() - start < 3
+
+def test_coroutine_concurrency_limit():
+    start = time.time()
+    assert list(fast_map(async_task, range(4), threads_limit=2, procs_limit=1)) == [0, 1, 4, 9]
+    assert time.time() - start >= 2
+
+def test_async_for():
+    async def main():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+        ticker_task = asyncio.ensure_future(ticker())
+        results = [r async for r in fast_map_aio(async_task, range(50), threads_limit=50)]
+        ticker_task.cancel()
+        # the event loop wasn't blocked while waiting for results
+        assert ticks > 10, ticks
+        return results
+    assert asyncio.run(main()) == [x * x for x in range(50)]
+
+def test_async_for_exception_and_break():
+    async def main():
+        results = []
+        try:
+            async for r in fast_map_aio(failing_task, range(5)):
+                results.append(r)
+        except ValueError:
+            pass
+        else:
+            assert False, 'ValueError was not raised'
+        assert results == [0, 1]
+        gen = fast_map_aio(task, range(100), buffer_size=2)
+        async for r in gen:
+            break
+        await gen.aclose()
+    asyncio.run(main())
+
+def test_pool_coroutine_function():
+    with FastMapPool(threads_limit=100) as pool:
+        assert pool.map(async_task, range(100)) == [x * x for x in range(100)]
+        assert pool.map(task, range(4)) == [0, 1, 4, 9]
+
+if __name__ == '__main__':
+    test_coroutine_function_in_workers()
+    test_coroutine_concurrency_limit()
+    test_async_for()
+    test_async_for_exception_and_break()
+    test_pool_coroutine_function()
+    print('all done')
@@ -0,0 +1,96 @@
+from fast_map import FastMapPool
+import threading
+import time
+
+def task(x):
+    time.sleep(0.2)
+    return x*x
+
+def failing_task(x):
+    if x == 3:
+        raise ValueError('x == 3')
+    return x
+
+def test_pool_reuse():
+    with FastMapPool(threads_limit=16, procs_limit=2) as pool:
+        procs = list(pool._all_procs)
+        for _ in range(3):
+            assert pool.map(task, range(8)) == [x*x for x in range(8)]
+        # no new processes were spawned by subsequent map calls
+        assert pool._all_procs == procs
+        assert list(pool.imap(pow, [2, 3], [2, 2])) == [4, 9]
+
+def test_pool_map_async():
+    results = []
+    with FastMapPool(threads_limit=8) as pool:
+        t = pool.map_async(task, range(8), on_result=results.append)
+        t.join()
+    assert results == [x*x for x in range(8)]
+
+def test_pool_resize():
+    with FastMapPool(threads_limit=4, procs_limit=1) as pool:
+        pool.resize(procs_count=2, threads_per_process=8)
+        assert pool.procs_count == 2
+        assert pool.threads_per_process == 8
+        start = time.time()
+        assert pool.map(task, range(16)) == [x*x for x in range(16)]
+        assert time.time() - start < 1.5
+        pool.resize(procs_count=1)
+        assert pool.map(task, range(4)) == [x*x for x in range(4)]
+
+def test_pool_exception():
+    with FastMapPool(threads_limit=4) as pool:
+        try:
+            pool.map(failing_task, range(8))
+        except ValueError as e:
+            print('exception raised as expected:', e)
+        else:
+            assert False, 'ValueError was not raised'
+        assert pool.map(failing_task, range(3)) == [0, 1, 2]
+
+def test_pool_abandoned_imap():
+    with FastMapPool(threads_limit=2) as pool:
+        results = pool.imap(task, range(20), chunksize=1)
+        assert next(results) == 0
+        results.close()
+        # chunks of the abandoned call are skipped by the processes
+        start = time.time()
+        assert pool.map(task, range(2)) == [0, 1]
+        assert time.time() - start < 1.5
+
+def test_pool_resize_after_abandoned_imap():
+    with FastMapPool(threads_limit=1, procs_limit=1) as pool:
+        results = pool.imap(task, range(20), chunksize=1)
+        assert next(results) == 0
+        results.close()
+        # the new process must skip queued chunks of the abandoned call
+        # (it never received its "job" message)
+        pool.resize(procs_count=2)
+        assert pool.map(task, range(4)) == [x*x for x in range(4)]
+
+def test_pool_terminate():
+    pool = FastMapPool(threads_limit=2, procs_limit=1)
+    errors = []
+    def consume():
+        try:
+            pool.map(task, range(100))
+        except RuntimeError as e:
+            errors.append(e)
+    t = threading.Thread(target=consume)
+    t.start()
+    time.sleep(0.5)
+    pool.terminate()
+    # the blocked map call fails instead of waiting forever
+    t.join(5)
+    assert not t.is_alive()
+    assert len(errors) == 1
+
+if __name__ == '__main__':
+    test_pool_reuse()
+    test_pool_map_async()
+    test_pool_resize()
+    test_pool_exception()
+    test_pool_abandoned_imap()
+    test_pool_resize_after_abandoned_imap()
+    test_pool_terminate()
+    print('all done')
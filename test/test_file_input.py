@@ -0,0 +1,83 @@
+from fast_map import fast_map_file
+from fast_map.file_input import split_file
+import tempfile
+import os
+
+def parse(line):
+    return int(line)
+
+def fail_on_5(line):
+    if int(line) == 5:
+        raise ValueError('line 5')
+    return int(line)
+
+def pid(line):
+    return os.getpid()
+
+def write_file(directory, name, lines, end='\n'):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + end)
+    return path
+
+def test_split_file():
+    with tempfile.TemporaryDirectory() as d:
+        path = write_file(d, 'a.txt', [str(i) * (i % 7 + 1) for i in range(1000)])
+        with open(path, 'rb') as f:
+            data = f.read()
+        for range_size in (1, 10, 100, 4096, 10**6):
+            ranges = split_file(path, range_size)
+            assert ranges[0][1] == 0 and ranges[-1][2] == len(data)
+            for (_, _, end), (_, start, _) in zip(ranges, ranges[1:]):
+                assert end == start
+                # ranges begin at the start of a line
+                assert data[start - 1:start] == b'\n'
+        assert split_file(write_file(d, 'empty.txt', [], end=''), 10) == []
+
+def test_fast_map_file():
+    with tempfile.TemporaryDirectory() as d:
+        path = write_file(d, 'a.txt', [str(i) for i in range(10000)])
+        assert list(fast_map_file(parse, path, range_size=1000)) == list(range(10000))
+        assert list(fast_map_file(parse, path)) == list(range(10000))
+        # no newline at the end of the last line
+        path = write_file(d, 'b.txt', [str(i) for i in range(100)], end='')
+        assert list(fast_map_file(parse, path, range_size=50)) == list(range(100))
+
+def test_lines_and_encoding():
+    with tempfile.TemporaryDirectory() as d:
+        path = write_file(d, 'a.txt', ['zażółć', '', 'x'])
+        assert list(fast_map_file(str, path)) == [repr('zażółć\n'.encode()), "b'\\n'", "b'x\\n'"]
+        assert list(fast_map_file(str.strip, path, encoding='utf-8', range_size=1)) == ['zażółć', '', 'x']
+
+def test_many_files():
+    with tempfile.TemporaryDirectory() as d:
+        paths = [write_file(d, f'{i}.txt', [str(i * 100 + j) for j in range(100)]) for i in range(5)]
+        paths.insert(2, write_file(d, 'empty.txt', [], end=''))
+        assert list(fast_map_file(parse, paths, range_size=64)) == list(range(500))
+        assert list(fast_map_file(parse, [])) == []
+
+def test_errors():
+    with tempfile.TemporaryDirectory() as d:
+        path = write_file(d, 'a.txt', [str(i) for i in range(10)])
+        results = []
+        try:
+            for res in fast_map_file(fail_on_5, path, range_size=8):
+                results.append(res)
+            assert False, 'ValueError not raised'
+        except ValueError as e:
+            print('exception raised as expected:', e)
+        assert results == [0, 1, 2, 3, 4]
+
+def test_workers():
+    with tempfile.TemporaryDirectory() as d:
+        path = write_file(d, 'a.txt', [str(i) for i in range(100)])
+        assert os.getpid() not in set(fast_map_file(pid, path, range_size=10))
+
+if __name__ == '__main__':
+    test_split_file()
+    test_fast_map_file()
+    test_lines_and_encoding()
+    test_many_files()
+    test_errors()
+    test_workers()
+    print('all done')
@@ -0,0 +1,94 @@
+from fast_map import fast_map, FastMapPool, process_state, thread_state
+import threading
+import asyncio
+import time
+import os
+
+def init_process(name):
+    return {'name': name, 'pid': os.getpid(), 'created': time.time()}
+
+def init_thread(prefix):
+    return f'{prefix}-{threading.get_ident()}'
+
+def task(x):
+    time.sleep(0.01)
+    state = process_state()
+    return state['name'], state['pid'] == os.getpid(), state['created'], thread_state()
+
+def thread_task(x):
+    time.sleep(0.01)
+    return thread_state()
+
+async def coroutine_task(x):
+    await asyncio.sleep(0.01)
+    return process_state()['name'], thread_state()
+
+def failing_init():
+    raise ValueError('initializer failed')
+
+def test_process_initializer_runs_once_per_process():
+    results = list(fast_map(task, range(100), threads_limit=8, initializer=init_process,
+                            initargs=('model',)))
+    assert all(name == 'model' and same_pid for name, same_pid, _, _ in results)
+    # each process created its state once, reused by all of its tasks
+    assert len({created for _, _, created, _ in results}) <= 8
+    assert all(thread is None for _, _, _, thread in results)
+
+def test_thread_initializer_runs_once_per_thread():
+    results = list(fast_map(thread_task, range(100), threads_limit=4, procs_limit=1,
+                            thread_initializer=init_thread, thread_initargs=('conn',)))
+    threads = set(results)
+    assert all(thread.startswith('conn-') for thread in threads)
+    assert 1 <= len(threads) <= 4
+
+def test_coroutine_function():
+    results = list(fast_map(coroutine_task, range(20), initializer=init_process,
+                            initargs=('aio',), thread_initializer=init_thread,
+                            thread_initargs=('loop',)))
+    assert {name for name, _ in results} == {'aio'}
+    assert all(thread.startswith('loop-') for _, thread in results)
+
+def test_failing_initializer():
+    try:
+        list(fast_map(task, range(4), procs_limit=1, initializer=failing_init))
+    except RuntimeError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'failing initializer should stop the map'
+
+def test_pool_failing_initializer():
+    pool = FastMapPool(procs_limit=1, initializer=failing_init)
+    try:
+        pool.map(task, range(4))
+    except RuntimeError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'failing initializer should stop the map'
+    try:
+        pool.map(task, range(4))
+    except RuntimeError as e:
+        assert 'broken' in str(e)
+    else:
+        assert False, 'broken pool should refuse new map calls'
+    # doesn't wait for the crashed process
+    pool.close()
+
+def test_pool():
+    with FastMapPool(threads_limit=4, procs_limit=1, initializer=init_process,
+                     initargs=('pool',), thread_initializer=init_thread,
+                     thread_initargs=('t',)) as pool:
+        first = pool.map(task, range(20))
+        second = pool.map(task, range(20))
+    # the state survives between map calls
+    assert len({created for _, _, created, _ in first + second}) == 1
+    assert {name for name, _, _, _ in first} == {'pool'}
+    assert len({thread for _, _, _, thread in first + second}) <= 4
+
+if __name__ == '__main__':
+    test_process_initializer_runs_once_per_process()
+    test_thread_initializer_runs_once_per_thread()
+    test_coroutine_function()
+    test_failing_initializer()
+    test_pool_failing_initializer()
+    test_pool()
+    print('all done')
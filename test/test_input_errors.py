@@ -0,0 +1,76 @@
+from fast_map import (fast_map, fast_map_reduce, fast_pipeline, FastMapPool, Coordinator,
+                      run_worker)
+import multiprocessing as mp
+
+AUTHKEY = b'test'
+
+def raising_input(count):
+    for i in range(count):
+        yield i
+    raise ValueError('input failed')
+
+def double(x):
+    return x * 2
+
+def add(a, b):
+    return a + b
+
+def expect_input_error(results_iter):
+    ''' Consumes the results and returns them, the input error must be
+    raised once the results of the enqueued tasks were yielded. '''
+    results = []
+    try:
+        for res in results_iter:
+            results.append(res)
+    except ValueError as e:
+        assert str(e) == 'input failed'
+    else:
+        assert False, 'ValueError not raised'
+    return results
+
+def test_fast_map():
+    for backend in ['hybrid', 'threads']:
+        results = expect_input_error(fast_map(double, raising_input(20), backend=backend,
+                                              threads_limit=2))
+        assert results == [x * 2 for x in range(20)]
+        results = expect_input_error(fast_map(double, raising_input(20), backend=backend,
+                                              threads_limit=2, ordered=False))
+        assert sorted(results) == [(x, x * 2) for x in range(20)]
+
+def test_fast_map_reduce():
+    try:
+        fast_map_reduce(double, add, raising_input(20), threads_limit=2)
+    except ValueError as e:
+        assert str(e) == 'input failed'
+    else:
+        assert False, 'ValueError not raised'
+
+def test_fast_pipeline():
+    results = expect_input_error(fast_pipeline(double, double, f_args=[raising_input(20)]))
+    assert results == [x * 4 for x in range(20)]
+
+def test_pool():
+    with FastMapPool(threads_limit=2) as pool:
+        results = expect_input_error(pool.imap(double, raising_input(20)))
+        assert results == [x * 2 for x in range(20)]
+        # the pool remains usable
+        assert pool.map(double, range(4)) == [0, 2, 4, 6]
+
+def test_coordinator():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        p = mp.Process(target=run_worker, args=[coordinator.address, AUTHKEY],
+                       kwargs={'procs_limit': 1})
+        p.start()
+        assert coordinator.wait_for_nodes(1, timeout=10)
+        results = expect_input_error(coordinator.imap(double, raising_input(20)))
+        assert results == [x * 2 for x in range(20)]
+        assert coordinator.map(double, range(4)) == [0, 2, 4, 6]
+    p.join(timeout=10)
+
+if __name__ == '__main__':
+    test_fast_map()
+    test_fast_map_reduce()
+    test_fast_pipeline()
+    test_pool()
+    test_coordinator()
+    print('all done')
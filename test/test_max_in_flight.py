@@ -0,0 +1,54 @@
+from fast_map import fast_map, FastMapPool
+import time
+
+def task(x):
+    return x * 2
+
+def slow_first(x):
+    if x == 0:
+        time.sleep(1)
+    return x
+
+class CountingGenerator:
+    ''' Generator (without len()) counting how many items were taken. '''
+    def __init__(self, count):
+        self.count = count
+        self.taken = 0
+
+    def __iter__(self):
+        for i in range(self.count):
+            self.taken += 1
+            yield i
+
+def test_window_limits_enqueued_tasks():
+    gen = CountingGenerator(20000)
+    max_ahead = 0
+    for yielded, res in enumerate(fast_map(task, gen, threads_limit=4, max_in_flight=100), 1):
+        assert res == (yielded - 1) * 2
+        max_ahead = max(max_ahead, gen.taken - yielded)
+    assert yielded == 20000
+    # at most one chunk is held by the enqueuer while it waits for the window
+    assert max_ahead <= 150, max_ahead
+
+def test_window_with_slow_low_index():
+    # the slow task 0 holds back yielding, so the enqueuer must stop too
+    gen = CountingGenerator(100000)
+    results = fast_map(slow_first, gen, threads_limit=4, max_in_flight=50,
+                       tasks_count_estimate=100000)
+    assert next(results) == 0
+    assert gen.taken <= 100, gen.taken
+    assert sum(results) == sum(range(1, 100000))
+
+def test_pool_window():
+    gen = CountingGenerator(5000)
+    with FastMapPool(threads_limit=4) as pool:
+        results = pool.imap(slow_first, gen, max_in_flight=20)
+        assert next(results) == 0
+        assert gen.taken <= 40, gen.taken
+        assert list(results) == list(range(1, 5000))
+
+if __name__ == '__main__':
+    test_window_limits_enqueued_tasks()
+    test_window_with_slow_low_index()
+    test_pool_window()
+    print('all done')
@@ -0,0 +1,85 @@
+from fast_map import fast_pipeline, Stage, CancelToken
+import os
+import time
+
+def double(x):
+    return x * 2
+
+def inc(x):
+    return x + 1
+
+def add(x, y):
+    return x + y
+
+def fail_on_4(x):
+    if x == 4:
+        raise ValueError('x == 4')
+    return x
+
+def slow_first(x):
+    if x == 0:
+        time.sleep(0.5)
+    return x
+
+def with_pid(x):
+    return x, os.getpid()
+
+def test_pipeline():
+    results = list(fast_pipeline(double, inc, f_args=[range(100)]))
+    assert results == [x * 2 + 1 for x in range(100)]
+    results = list(fast_pipeline(add, Stage(double, procs_limit=2, threads_limit=8),
+                                 f_args=[range(10), range(10)]))
+    assert results == [x * 4 for x in range(10)]
+    assert list(fast_pipeline(double, f_args=[range(5)])) == [0, 2, 4, 6, 8]
+    assert list(fast_pipeline(double, inc, f_args=[[]])) == []
+
+def test_stages_run_in_worker_processes():
+    results = list(fast_pipeline(with_pid, Stage(with_pid), f_args=[range(5)]))
+    for (_, first_pid), second_pid in results:
+        assert first_pid != os.getpid() and second_pid != os.getpid()
+        assert first_pid != second_pid
+
+def test_order():
+    results = list(fast_pipeline(slow_first, inc, f_args=[range(20)], chunksize=1))
+    assert results == [x + 1 for x in range(20)]
+    results = list(fast_pipeline(slow_first, inc, f_args=[range(20)], chunksize=1, ordered=False))
+    assert sorted(results) == [(x, x + 1) for x in range(20)]
+    # the slow task doesn't hold back others
+    assert results[-1] == (0, 1)
+
+def test_generators():
+    gen = (x for x in range(1000))
+    results = fast_pipeline(double, inc, f_args=[gen], tasks_count_estimate=1000, max_in_flight=20)
+    assert list(results) == [x * 2 + 1 for x in range(1000)]
+
+def test_errors():
+    results = []
+    try:
+        for res in fast_pipeline(fail_on_4, double, f_args=[range(10)], chunksize=3):
+            results.append(res)
+        assert False, 'ValueError not raised'
+    except ValueError as e:
+        print('exception raised as expected:', e)
+    assert results == [0, 2, 4, 6]
+
+def test_close_and_cancel():
+    gen = fast_pipeline(double, inc, f_args=[range(10**6)], max_in_flight=100)
+    assert next(gen) == 1
+    gen.close()
+    token = CancelToken()
+    results = []
+    for res in fast_pipeline(double, inc, f_args=[range(10**6)], max_in_flight=100,
+                             cancel_token=token):
+        results.append(res)
+        if len(results) == 10:
+            token.cancel()
+    assert results[:10] == [x * 2 + 1 for x in range(10)]
+
+if __name__ == '__main__':
+    test_pipeline()
+    test_stages_run_in_worker_processes()
+    test_order()
+    test_generators()
+    test_errors()
+    test_close_and_cancel()
+    print('all done')
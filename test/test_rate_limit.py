@@ -0,0 +1,58 @@
+from fast_map import fast_map, fast_map_reduce, FastMapPool
+import operator
+import asyncio
+import time
+
+def timed_sleep(x):
+    start = time.monotonic()
+    time.sleep(0.1)
+    return start, time.monotonic()
+
+async def async_timed_sleep(x):
+    start = time.monotonic()
+    await asyncio.sleep(0.1)
+    return start, time.monotonic()
+
+def one(x):
+    return 1
+
+def max_overlap(intervals):
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+def min_spacing(intervals):
+    starts = sorted(start for start, _ in intervals)
+    return min(b - a for a, b in zip(starts, starts[1:]))
+
+def test_rate():
+    for func in (timed_sleep, async_timed_sleep):
+        begin = time.monotonic()
+        intervals = list(fast_map(func, range(30), threads_limit=30, max_calls_per_second=20))
+        elapsed = time.monotonic() - begin
+        # 30 calls spaced by 50ms, never faster than the rate
+        assert min_spacing(intervals) > 0.045, min_spacing(intervals)
+        assert 1.4 < elapsed < 3, elapsed
+
+def test_concurrency():
+    for func in (timed_sleep, async_timed_sleep):
+        intervals = list(fast_map(func, range(20), procs_limit=2, max_concurrency=3))
+        assert max_overlap(intervals) <= 3
+    count = fast_map_reduce(one, operator.add, range(20), max_concurrency=2,
+                            max_calls_per_second=100)
+    assert count == 20
+
+def test_pool():
+    with FastMapPool(threads_limit=20, max_concurrency=4, max_calls_per_second=50) as pool:
+        intervals = pool.map(timed_sleep, range(20))
+        assert max_overlap(intervals) <= 4
+        assert min_spacing(intervals) > 0.015
+
+if __name__ == '__main__':
+    test_rate()
+    test_concurrency()
+    test_pool()
+    print('all done')
@@ -0,0 +1,124 @@
+from fast_map import fast_map_reduce, CancelToken, FastMapStats, ResultCache
+from concurrent.futures import CancelledError
+from collections import Counter
+import threading
+import operator
+import time
+import os
+
+def square(x):
+    return x * x
+
+def letters(word):
+    return Counter(word)
+
+def fail_at_5(x):
+    if x == 5:
+        raise Exception('x == 5')
+    return x
+
+def slow(x):
+    time.sleep(0.2)
+    return x
+
+def with_pids(x):
+    return x, ()
+
+def reversed_blob(data):
+    return data[::-1]
+
+def concat(a, b):
+    return a + b
+
+def sum_with_pids(a, b):
+    # records the process combining results
+    return a[0] + b[0], a[1] + b[1] + (os.getpid(),)
+
+def test_sum():
+    assert fast_map_reduce(square, operator.add, range(1000)) == sum(x * x for x in range(1000))
+    assert fast_map_reduce(square, operator.add, range(10), initial=100, procs_limit=2) == 385
+
+def test_counter():
+    words = ['apple', 'banana', 'cherry'] * 50
+    total = fast_map_reduce(letters, operator.add, words, initial=Counter(), threads_limit=8)
+    assert total == sum((Counter(w) for w in words), Counter())
+
+def test_generator():
+    gen = (x for x in range(500))
+    assert fast_map_reduce(square, max, gen, tasks_count_estimate=500, max_in_flight=20) == 499**2
+
+def test_empty():
+    assert fast_map_reduce(square, operator.add, [], initial=0) == 0
+    try:
+        fast_map_reduce(square, operator.add, [])
+    except TypeError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'no exception raised'
+
+def test_exception():
+    try:
+        fast_map_reduce(fail_at_5, operator.add, range(100))
+    except Exception as e:
+        print('exception raised as expected:', e)
+        assert str(e) == 'x == 5'
+    else:
+        assert False, 'no exception raised'
+
+def test_folded_in_workers():
+    total, pids = fast_map_reduce(with_pids, sum_with_pids, range(200), procs_limit=2,
+                                  threads_limit=4)
+    assert total == sum(range(200))
+    # the parent only combines the partial results of processes
+    assert pids.count(os.getpid()) <= 1
+    assert len(pids) == 199
+
+def test_stats():
+    stats = FastMapStats()
+    fast_map_reduce(square, operator.add, range(100), stats=stats)
+    assert stats.tasks_completed == 100
+
+def test_cancel():
+    token = CancelToken()
+    threading.Timer(0.5, token.cancel).start()
+    start = time.time()
+    try:
+        fast_map_reduce(slow, operator.add, range(100), threads_limit=2, cancel_token=token)
+    except CancelledError:
+        pass
+    else:
+        assert False, 'no exception raised'
+    assert time.time() - start < 2
+
+def test_backends():
+    expected = sum(x * x for x in range(100))
+    for backend in ('threads', 'processes', 'auto'):
+        assert fast_map_reduce(square, operator.add, range(100), backend=backend) == expected
+
+def test_shared_memory():
+    blobs = [bytes([i]) * 5000 for i in range(8)]
+    # arguments are shared, results are folded by workers as usual
+    total = fast_map_reduce(reversed_blob, concat, blobs, shared_memory_threshold=1000)
+    assert type(total) is bytes
+    assert sorted(total[i:i + 5000] for i in range(0, len(total), 5000)) == blobs
+
+def test_cache():
+    cache = ResultCache()
+    assert fast_map_reduce(square, operator.add, range(50), cache=cache) == sum(x * x for x in range(50))
+    assert cache.misses == 50
+    assert fast_map_reduce(square, operator.add, range(60), cache=cache) == sum(x * x for x in range(60))
+    assert cache.hits == 50
+
+if __name__ == '__main__':
+    test_sum()
+    test_counter()
+    test_generator()
+    test_empty()
+    test_exception()
+    test_folded_in_workers()
+    test_stats()
+    test_cancel()
+    test_backends()
+    test_shared_memory()
+    test_cache()
+    print('all done')
@@ -0,0 +1,125 @@
+from fast_map import Coordinator, run_worker
+from multiprocessing.connection import Client
+from multiprocessing import AuthenticationError
+import multiprocessing as mp
+import socket
+import time
+import os
+
+AUTHKEY = b'test'
+
+def task(x):
+    time.sleep(0.01)
+    return x * 2
+
+def failing(x):
+    if x == 3:
+        raise ValueError('x == 3')
+    return x
+
+def crash_on_flaky_node(x):
+    if os.environ.get('FLAKY_NODE') and x >= 20:
+        # simulates a node going down
+        os._exit(1)
+    time.sleep(0.05)
+    return x
+
+def flaky_worker(address):
+    os.environ['FLAKY_NODE'] = '1'
+    run_worker(address, AUTHKEY, procs_limit=1, threads_limit=4)
+
+def start_node(address, target=run_worker, **kwargs):
+    args = [address] if target is flaky_worker else [address, AUTHKEY]
+    p = mp.Process(target=target, args=args, kwargs=kwargs)
+    p.start()
+    return p
+
+def test_ordered_results():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        nodes = [start_node(coordinator.address, procs_limit=1, threads_limit=4) for _ in range(2)]
+        assert coordinator.wait_for_nodes(2, timeout=10)
+        assert coordinator.map(task, range(200)) == [x * 2 for x in range(200)]
+        unordered = list(coordinator.imap(task, range(50), ordered=False))
+        assert sorted(unordered) == [(x, x * 2) for x in range(50)]
+        # both nodes took part
+        assert all(node['tasks_completed'] > 0 for node in coordinator.nodes())
+    for p in nodes:
+        p.join(timeout=10)
+        assert p.exitcode == 0
+
+def test_exceptions():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        start_node(coordinator.address, procs_limit=1)
+        try:
+            coordinator.map(failing, range(10))
+        except ValueError as e:
+            print('exception raised as expected:', e)
+        else:
+            assert False
+        # the next map call works
+        assert coordinator.map(failing, [1, 2]) == [1, 2]
+
+def test_capacity_weighting():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        start_node(coordinator.address, procs_limit=1, threads_limit=16)
+        start_node(coordinator.address, procs_limit=1, threads_limit=2)
+        assert coordinator.wait_for_nodes(2, timeout=10)
+        coordinator.map(task, range(400), chunksize=2)
+        completed = sorted(node['tasks_completed'] for node in coordinator.nodes())
+        assert completed[1] > completed[0] * 2
+
+def test_node_drop():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        start_node(coordinator.address, procs_limit=1, threads_limit=4)
+        flaky = start_node(coordinator.address, target=flaky_worker)
+        assert coordinator.wait_for_nodes(2, timeout=10)
+        results = coordinator.map(crash_on_flaky_node, range(100), chunksize=2)
+        # tasks of the dropped node were run by the other one
+        assert results == list(range(100))
+        flaky.join(timeout=10)
+        assert len(coordinator.nodes()) == 1
+
+def test_late_node():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        results = coordinator.imap(task, range(20))
+        # the map call waits for a node
+        start_node(coordinator.address, procs_limit=1)
+        assert list(results) == [x * 2 for x in range(20)]
+
+def test_handshake_failures():
+    with Coordinator(('127.0.0.1', 0), authkey=AUTHKEY) as coordinator:
+        # a client that never authenticates doesn't block other nodes
+        silent = socket.create_connection(coordinator.address)
+        try:
+            Client(coordinator.address, authkey=b'wrong')
+            assert False, 'AuthenticationError not raised'
+        except AuthenticationError:
+            pass
+        # authenticated, but not a node
+        conn = Client(coordinator.address, authkey=AUTHKEY)
+        conn.send(('not hello',))
+        start_node(coordinator.address, procs_limit=1)
+        assert coordinator.wait_for_nodes(1, timeout=10)
+        assert coordinator.map(task, range(10)) == [x * 2 for x in range(10)]
+        assert len(coordinator.nodes()) == 1
+        silent.close()
+        conn.close()
+
+def test_authkey_required():
+    try:
+        Coordinator(('127.0.0.1', 0))
+        assert False, 'TypeError not raised'
+    except TypeError:
+        pass
+    with Coordinator(authkey=AUTHKEY) as coordinator:
+        assert coordinator.address[0] == '127.0.0.1'
+
+if __name__ == '__main__':
+    test_ordered_results()
+    test_exceptions()
+    test_capacity_weighting()
+    test_node_drop()
+    test_late_node()
+    test_handshake_failures()
+    test_authkey_required()
+    print('all done')
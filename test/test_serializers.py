@@ -0,0 +1,65 @@
+from fast_map import fast_map, fast_map_reduce, FastMapPool, Serializer
+from fast_map.serializers import EncodedChunk
+import multiprocessing as mp
+import pickle
+
+class Point:
+    def __init__(self, x):
+        self.x = x
+
+def record(x):
+    return {'id': x, 'name': f'item {x}', 'values': [x, x * 0.5], 'flag': x % 2 == 0}
+
+def read_point(point):
+    return Point(point.x * 2)
+
+def fail_at_3(x):
+    if x == 3:
+        raise ValueError('x == 3')
+    return x
+
+def test_codecs():
+    records = [record(x) for x in range(10)] + [None, b'data', (1, 2)]
+    for codec in ('marshal', 'pickle5'):
+        assert pickle.loads(pickle.dumps(EncodedChunk(codec, records))) == records
+    # marshal falls back to pickle for instances of classes
+    points = pickle.loads(pickle.dumps(EncodedChunk('marshal', [Point(1)])))
+    assert points[0].x == 1
+
+def test_data_codecs():
+    for serializer in ('marshal', 'pickle5', Serializer(data='marshal')):
+        results = list(fast_map(record, range(500), serializer=serializer))
+        assert results == [record(x) for x in range(500)]
+        results = list(fast_map(read_point, [Point(x) for x in range(20)], serializer=serializer))
+        assert [p.x for p in results] == [x * 2 for x in range(20)]
+
+def test_exceptions():
+    try:
+        list(fast_map(fail_at_3, range(10), serializer='marshal'))
+    except ValueError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'no exception raised'
+
+def test_cloudpickle_lambdas():
+    offset = 10
+    for method in mp.get_all_start_methods():
+        results = list(fast_map(lambda x: x + offset, range(20), mp_context=method,
+                                serializer='cloudpickle'))
+        assert results == [x + offset for x in range(20)]
+        total = fast_map_reduce(lambda x: x * 2, lambda a, b: a + b, range(10),
+                                mp_context=method, serializer=Serializer('cloudpickle', 'marshal'))
+        assert total == 90
+
+def test_pool():
+    with FastMapPool(procs_limit=2, serializer=Serializer('cloudpickle', 'marshal')) as pool:
+        assert pool.map(lambda x: x * 3, range(50)) == [x * 3 for x in range(50)]
+        assert pool.map(record, range(50)) == [record(x) for x in range(50)]
+
+if __name__ == '__main__':
+    test_codecs()
+    test_data_codecs()
+    test_exceptions()
+    test_cloudpickle_lambdas()
+    test_pool()
+    print('all done')
@@ -0,0 +1,83 @@
+from fast_map import fast_map, FastMapPool
+import time
+import os
+
+def reverse(data):
+    return data[::-1]
+
+def describe(data, x):
+    return type(data).__name__, len(data), x
+
+def make_result(size):
+    return bytes(size)
+
+def slow_result(size):
+    time.sleep(0.01)
+    return bytes(size)
+
+def shm_segments():
+    return set(name for name in os.listdir('/dev/shm') if name.startswith('psm_'))
+
+def test_large_arguments_and_results():
+    before = shm_segments()
+    blobs = [os.urandom(100000) for _ in range(10)]
+    results = list(fast_map(reverse, blobs, shared_memory_threshold=1000))
+    assert results == [b[::-1] for b in blobs]
+    assert all(type(r) is bytes for r in results)
+    # small arguments are pickled as usual
+    assert list(fast_map(reverse, [b'abc', b'de'], shared_memory_threshold=1000)) == [b'cba', b'ed']
+    assert shm_segments() == before
+
+def test_argument_types():
+    args = [bytearray(5000), memoryview(bytes(5000)), b'x' * 5000, 'not a buffer']
+    results = list(fast_map(describe, args, range(4), shared_memory_threshold=1000))
+    assert results == [('bytearray', 5000, 0), ('memoryview', 5000, 1),
+                       ('bytes', 5000, 2), ('str', 12, 3)]
+
+def test_non_contiguous_memoryview():
+    data = memoryview(bytes(range(256)) * 40)[::2]
+    assert not data.c_contiguous
+    results = list(fast_map(describe, [data], [0], shared_memory_threshold=1000))
+    assert results == [('memoryview', 5120, 0)]
+    assert list(fast_map(reverse, [data], shared_memory_threshold=1000)) == [data.tobytes()[::-1]]
+
+def test_break_removes_segments():
+    before = shm_segments()
+    for res in fast_map(slow_result, [10000] * 200, threads_limit=8, shared_memory_threshold=1000):
+        break
+    assert shm_segments() == before
+    with FastMapPool(threads_limit=8, shared_memory_threshold=1000) as pool:
+        for res in pool.imap(slow_result, [10000] * 200):
+            break
+        # chunks which were running when the job ended arrive later
+        time.sleep(1)
+        assert shm_segments() == before
+    assert shm_segments() == before
+
+def test_numpy_arrays():
+    try:
+        import numpy as np
+    except ImportError:
+        print('numpy not installed, skipping test_numpy_arrays')
+        return
+    arrays = [np.arange(10000, dtype=np.float64) * i for i in range(5)]
+    results = list(fast_map(reverse, arrays, shared_memory_threshold=1000))
+    for array, res in zip(arrays, results):
+        assert (res == array[::-1]).all()
+
+def test_pool_shared_memory():
+    before = shm_segments()
+    with FastMapPool(threads_limit=4, shared_memory_threshold=1000) as pool:
+        assert pool.map(make_result, [10, 100000]) == [bytes(10), bytes(100000)]
+        blobs = [os.urandom(50000) for _ in range(4)]
+        assert pool.map(reverse, blobs) == [b[::-1] for b in blobs]
+    assert shm_segments() == before
+
+if __name__ == '__main__':
+    test_large_arguments_and_results()
+    test_argument_types()
+    test_non_contiguous_memoryview()
+    test_break_removes_segments()
+    test_numpy_arrays()
+    test_pool_shared_memory()
+    print('all done')
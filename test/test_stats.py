@@ -0,0 +1,88 @@
+from fast_map import fast_map, FastMapPool, FastMapStats
+import time
+
+def task(x):
+    time.sleep(0.01)
+    return x
+
+def slow_first(x):
+    time.sleep(1 if x == 0 else 0.01)
+    return x
+
+def failing(x):
+    if x == 3:
+        raise ValueError('x == 3')
+    return x
+
+def test_counters():
+    stats = FastMapStats()
+    assert list(fast_map(task, range(50), threads_limit=10, stats=stats)) == list(range(50))
+    snapshot = stats.snapshot()
+    assert snapshot['tasks_total'] == 50
+    assert snapshot['tasks_enqueued'] == 50
+    assert snapshot['tasks_completed'] == 50
+    assert snapshot['tasks_yielded'] == 50
+    assert snapshot['in_flight'] == 0
+    assert snapshot['results_buffered'] == 0
+    assert snapshot['enqueuing_finished']
+    assert snapshot['progress'] == 1.0
+    assert sum(proc['tasks_completed'] for proc in snapshot['procs'].values()) == 50
+    assert all(proc['pid'] for proc in snapshot['procs'].values())
+    assert snapshot['throughput'] > 0
+
+def test_latency_histogram():
+    stats = FastMapStats()
+    list(fast_map(task, range(20), stats=stats))
+    assert sum(stats.latency_histogram) == 20
+    # 10ms tasks fall into the (0.01, 0.05] bucket
+    assert stats.latency_percentile(50) == 0.05
+
+def test_reorder_buffer():
+    stats = FastMapStats()
+    list(fast_map(slow_first, range(40), threads_limit=40, chunksize=1, stats=stats))
+    # results of fast tasks waited for the slow first task
+    assert stats.max_results_buffered > 10
+
+def test_generator_input():
+    stats = FastMapStats()
+    list(fast_map(task, (x for x in range(30)), stats=stats))
+    assert stats.tasks_total == 30
+    assert stats.eta == 0
+
+def test_failed_tasks():
+    stats = FastMapStats()
+    try:
+        list(fast_map(failing, range(10), stats=stats))
+    except ValueError:
+        pass
+    assert stats.tasks_failed == 1
+    assert stats.end_time is not None
+
+def test_progress_callback():
+    calls = []
+    list(fast_map(task, range(100), threads_limit=2, on_progress=lambda s: calls.append(
+        (s.tasks_completed, s.progress, s.eta))))
+    # called periodically and once at the end
+    assert len(calls) >= 2
+    assert calls[-1] == (100, 1.0, 0)
+
+def test_pool_stats():
+    with FastMapPool(threads_limit=8) as pool:
+        for _ in range(2):
+            stats = FastMapStats()
+            assert pool.map(task, range(30), stats=stats) == list(range(30))
+            assert stats.tasks_completed == 30
+            assert stats.tasks_yielded == 30
+            assert sum(stats.latency_histogram) == 30
+        # map calls without stats don't send task durations
+        assert pool.map(task, range(5)) == list(range(5))
+
+if __name__ == '__main__':
+    test_counters()
+    test_latency_histogram()
+    test_reorder_buffer()
+    test_generator_input()
+    test_failed_tasks()
+    test_progress_callback()
+    test_pool_stats()
+    print('all done')
@@ -0,0 +1,87 @@
+from fast_map import fast_map, fast_map_reduce, FastMapStats
+import operator
+import asyncio
+import time
+
+# tasks already started in this (worker) process
+started = set()
+
+def hang_at_5(x):
+    if x == 5:
+        time.sleep(30)
+    time.sleep(0.05)
+    return x
+
+def first_run_hangs(x):
+    ''' Task 15 hangs the first time it runs, its duplicate is quick. '''
+    if x == 15 and x not in started:
+        started.add(x)
+        time.sleep(30)
+    time.sleep(0.05)
+    return x
+
+async def async_first_run_hangs(x):
+    if x == 15 and x not in started:
+        started.add(x)
+        await asyncio.sleep(30)
+    await asyncio.sleep(0.05)
+    return x
+
+def test_timeout():
+    start = time.time()
+    results = []
+    try:
+        for res in fast_map(hang_at_5, range(20), threads_limit=4, timeout=0.5):
+            results.append(res)
+    except TimeoutError as e:
+        print('exception raised as expected:', e)
+    else:
+        assert False, 'no exception raised'
+    assert results == list(range(5))
+    assert time.time() - start < 3
+
+def test_timeout_unordered():
+    results = set()
+    try:
+        for i, res in fast_map(hang_at_5, range(20), threads_limit=4, timeout=0.5,
+                               chunksize=1, ordered=False):
+            results.add(res)
+    except TimeoutError:
+        pass
+    else:
+        assert False, 'no exception raised'
+    # tasks that didn't hang weren't held back
+    assert len(results) >= 15
+
+def test_timeout_reduce():
+    try:
+        fast_map_reduce(hang_at_5, operator.add, range(20), threads_limit=4, timeout=0.5)
+    except TimeoutError:
+        pass
+    else:
+        assert False, 'no exception raised'
+
+def test_hedge():
+    for func in (first_run_hangs, async_first_run_hangs):
+        start = time.time()
+        stats = FastMapStats()
+        results = list(fast_map(func, range(40), procs_limit=1, threads_limit=4, hedge=3.0,
+                                stats=stats))
+        # the duplicate of task 15 completed first, the hung run was
+        # abandoned (its process was terminated at the end)
+        assert results == list(range(40))
+        assert stats.tasks_completed == 40
+        assert time.time() - start < 5, time.time() - start
+
+def test_hedge_with_timeout():
+    results = list(fast_map(first_run_hangs, range(40), procs_limit=1, threads_limit=4,
+                            hedge=3.0, timeout=10))
+    assert results == list(range(40))
+
+if __name__ == '__main__':
+    test_timeout()
+    test_timeout_unordered()
+    test_timeout_reduce()
+    test_hedge()
+    test_hedge_with_timeout()
+    print('all done')
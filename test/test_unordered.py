@@ -0,0 +1,37 @@
+from fast_map import fast_map, fast_map_async, FastMapPool
+import time
+
+def slow_first(x):
+    if x == 0:
+        time.sleep(1)
+    return x * x
+
+def test_unordered_first_result_not_blocked():
+    start = time.time()
+    results = fast_map(slow_first, range(8), threads_limit=8, ordered=False, chunksize=1)
+    index, res = next(results)
+    assert index != 0
+    assert time.time() - start < 0.9
+    pairs = [(index, res)] + list(results)
+    assert sorted(pairs) == [(x, x * x) for x in range(8)]
+    # the slow task completes last
+    assert pairs[-1] == (0, 0)
+
+def test_unordered_async():
+    pairs = []
+    t = fast_map_async(slow_first, range(8), on_result=pairs.append,
+                       threads_limit=8, ordered=False, chunksize=1)
+    t.join()
+    assert sorted(pairs) == [(x, x * x) for x in range(8)]
+
+def test_pool_unordered():
+    with FastMapPool(threads_limit=8) as pool:
+        pairs = list(pool.imap(slow_first, range(8), ordered=False, chunksize=1))
+    assert pairs[-1] == (0, 0)
+    assert sorted(pairs) == [(x, x * x) for x in range(8)]
+
+if __name__ == '__main__':
+    test_unordered_first_result_not_blocked()
+    test_unordered_async()
+    test_pool_unordered()
+    print('all done')